@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark of how sizing the connection pool of a glance client to the number of threads sharing it (as glancenuke and
+glancecp now do) affects the number of connections opened and the rate of requests.
+
+A local HTTP/1.1 server stands in for glance, answering image deletes after a fixed latency. The same number of threads
+then delete images through a single client created by `create_authenticated_client`, first with requests' default pool
+(10 connections per host) and then with the pool sized to the number of threads. Every connection the server accepts
+is a TCP handshake (and, with --tls or against a real glance, a TLS handshake too) that pooling could have avoided.
+
+--tls serves HTTPS with a throwaway self-signed certificate, which needs the openssl command.
+
+Usage: python3 benchmarks/connection_pool.py [--threads N] [--requests N] [--latency SECONDS] [--tls]
+"""
+
+import argparse
+import logging
+import os
+import socketserver
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# the benchmark uses openstacktools from this working tree, wherever it is run from
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openstacktools._client import create_authenticated_client  # noqa: E402
+
+
+class FakeGlanceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    connections = 0
+    connections_lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with FakeGlanceHandler.connections_lock:
+            FakeGlanceHandler.connections += 1
+
+    def do_DELETE(self):
+        time.sleep(self.latency)
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class PoolFullCounter(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def emit(self, record):
+        if "Connection pool is full" in record.getMessage():
+            self.count += 1
+
+
+def serve_tls(server: HTTPServer, directory: str):
+    cert_file = os.path.join(directory, "cert.pem")
+    key_file = os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=127.0.0.1",
+                    "-addext", "subjectAltName=IP:127.0.0.1", "-keyout", key_file, "-out", cert_file],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_file, key_file)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    # requests takes the CA bundle from the environment (when set) in preference to the client's own setting
+    os.environ["REQUESTS_CA_BUNDLE"] = cert_file
+
+
+def run(endpoint: str, threads: int, requests: int, pool_size):
+    client, _ = create_authenticated_client({
+        "os_image_url": endpoint, "os_auth_token": "benchmark", "os_image_api_version": "2",
+        "os_cacert": os.environ.get("REQUESTS_CA_BUNDLE"), "os_cert": None, "os_key": None, "timeout": 600, "connection_pool_size": pool_size})
+    FakeGlanceHandler.connections = 0
+    pool_full = PoolFullCounter()
+    logging.getLogger("urllib3.connectionpool").addHandler(pool_full)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(client.images.delete, ("image-%d" % i for i in range(requests))))
+    elapsed = time.perf_counter() - started
+    logging.getLogger("urllib3.connectionpool").removeHandler(pool_full)
+    return FakeGlanceHandler.connections, pool_full.count, requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=50, help="Number of threads sharing the client")
+    parser.add_argument("--requests", type=int, default=2000, help="Number of deletes to make")
+    parser.add_argument("--latency", type=float, default=0.05, help="Latency of each delete in seconds")
+    parser.add_argument("--tls", action="store_true", default=False, help="Serve HTTPS rather than HTTP")
+    args = parser.parse_args()
+
+    FakeGlanceHandler.latency = args.latency
+    server = _ThreadingHTTPServer(("127.0.0.1", 0), FakeGlanceHandler)
+    with tempfile.TemporaryDirectory() as directory:
+        if args.tls:
+            serve_tls(server, directory)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        endpoint = "%s://127.0.0.1:%d" % ("https" if args.tls else "http", server.server_address[1])
+
+        print("%-16s %12s %16s %14s" % ("pool", "connections", "pool-full drops", "requests/s"))
+        for label, pool_size in [("default", None), ("sized (%d)" % args.threads, args.threads)]:
+            connections, dropped, rate = run(endpoint, args.threads, args.requests, pool_size)
+            print("%-16s %12d %16d %14.0f" % (label, connections, dropped, rate))
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,529 @@
+"""
+In-process stand-in for Keystone and Glance, for benchmarking (and trying out) the tools without a real OpenStack.
+
+A single HTTP/1.1 server answers:
+- Keystone: version discovery, v3 password tokens (`/v3/auth/tokens`) and v2.0 tokens (`/v2.0/tokens`). Any credentials
+  are accepted. The service catalog has a single image endpoint: this server.
+- Glance v2: the image schema, listing images with pagination and the filters the tools use, getting, creating,
+  updating (JSON patch) and deleting images, and uploading and downloading image data (including byte ranges).
+
+The latency of every request, the bandwidth of image data transfers and the rate at which requests fail can be set to
+see how the tools behave against a slow, thin or overloaded cloud. Images can also be added directly, without going
+through the API.
+
+Usage:
+    with FakeOpenStack(latency=0.01, bandwidth=100 * 1024 * 1024) as cloud:
+        cloud.add_image("example", b"data")
+        subprocess.run(["glancenuke", "-y", "--os-auth-url", cloud.auth_url, ...])
+"""
+
+import hashlib
+import json
+import random
+import re
+import socketserver
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import parse_qs, unquote, urlencode, urlparse
+
+PROJECT_ID = "f0000000000000000000000000000001"
+USER_ID = "u0000000000000000000000000000001"
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 1000
+_TRANSFER_CHUNK_SIZE = 64 * 1024
+
+IMAGE_SCHEMA = {
+    "name": "image",
+    "additionalProperties": {"type": "string"},
+    "properties": {
+        "id": {"type": "string"},
+        "name": {"type": ["null", "string"]},
+        "status": {"type": "string"},
+        "visibility": {"type": "string", "enum": ["public", "private", "shared", "community"]},
+        "protected": {"type": "boolean"},
+        "os_hidden": {"type": "boolean"},
+        "checksum": {"type": ["null", "string"]},
+        "os_hash_algo": {"type": ["null", "string"]},
+        "os_hash_value": {"type": ["null", "string"]},
+        "owner": {"type": ["null", "string"]},
+        "size": {"type": ["null", "integer"]},
+        "virtual_size": {"type": ["null", "integer"]},
+        "container_format": {"type": ["null", "string"]},
+        "disk_format": {"type": ["null", "string"]},
+        "created_at": {"type": "string"},
+        "updated_at": {"type": "string"},
+        "tags": {"type": "array", "items": {"type": "string"}},
+        "min_ram": {"type": "integer"},
+        "min_disk": {"type": "integer"},
+        "self": {"type": "string"},
+        "file": {"type": "string"},
+        "schema": {"type": "string"},
+        "direct_url": {"type": "string"},
+        "locations": {"type": "array"}
+    },
+    "links": [
+        {"rel": "self", "href": "{self}"},
+        {"rel": "enclosure", "href": "{file}"},
+        {"rel": "describedby", "href": "{schema}"}
+    ]
+}
+
+_READ_ONLY_PROPERTIES = {"id", "status", "checksum", "os_hash_algo", "os_hash_value", "size", "virtual_size",
+                         "created_at", "updated_at", "self", "file", "schema", "direct_url"}
+_TIME_OPERATORS = {"lt": "__lt__", "lte": "__le__", "gt": "__gt__", "gte": "__ge__", "eq": "__eq__", "neq": "__ne__"}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _parse_time(value: str) -> datetime:
+    # `datetime.fromisoformat` is only in Python 3.7+, as is a `%z` that accepts "Z" or a colon in the offset
+    value = re.sub(r"Z$", "+0000", value)
+    value = re.sub(r"([+-]\d\d):(\d\d)$", r"\1\2", value)
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f%z" if "." in value else "%Y-%m-%dT%H:%M:%S%z")
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class _Server(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-response (e.g. a download that is abandoned) are expected
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class FakeOpenStack(object):
+    """
+    Fake Keystone and Glance, served from a thread of the current process.
+    """
+    def __init__(self, latency: float=0.0, bandwidth: float=None, error_rate: float=0.0, error_status: int=503,
+                 error_methods: Iterable[str]=("GET", "POST", "PUT", "PATCH", "DELETE"), seed: int=None,
+                 host: str="127.0.0.1", port: int=0):
+        """
+        Constructor.
+        :param latency: time taken to answer every request in seconds
+        :param bandwidth: the maximum rate at which image data is uploaded or downloaded in bytes per second (`None`
+        for no limit)
+        :param error_rate: the probability of a Glance request failing
+        :param error_status: the HTTP status with which failing requests fail
+        :param error_methods: the HTTP methods of the Glance requests that can fail
+        :param seed: seed for choosing which requests fail
+        :param host: the address to listen on
+        :param port: the port to listen on (0 for any free port)
+        """
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.error_methods = set(error_methods)
+        self.images = {}    # type: Dict[str, dict]
+        self.image_data = {}    # type: Dict[str, bytes]
+        self.tokens = set()
+        self.connections = 0
+        self.requests = {}  # type: Dict[str, int]
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._server = _Server((host, port), _make_handler(self))
+        self._thread = None     # type: Optional[threading.Thread]
+
+    @property
+    def url(self) -> str:
+        return "http://%s:%d" % self._server.server_address[:2]
+
+    @property
+    def auth_url(self) -> str:
+        """
+        The (versioned) Keystone v3 URL to authenticate with.
+        """
+        return "%s/v3" % self.url
+
+    def start(self) -> "FakeOpenStack":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-openstack", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self) -> "FakeOpenStack":
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def add_image(self, name: str, data: Optional[bytes]=b"", **properties) -> str:
+        """
+        Adds an image directly.
+        :param name: the name of the image
+        :param data: the data of the image (`None` to leave it queued without data)
+        :param properties: other properties of the image
+        :return: the identifier of the image
+        """
+        image = self._new_image(dict(properties, name=name))
+        with self._lock:
+            self.images[image["id"]] = image
+            if data is not None:
+                self._store_data(image, data)
+        return image["id"]
+
+    def get_data(self, image_id: str) -> Optional[bytes]:
+        with self._lock:
+            return self.image_data.get(image_id)
+
+    def _new_image(self, properties: dict) -> dict:
+        image_id = properties.pop("id", None) or str(uuid.uuid4())
+        now = _now()
+        image = {
+            "id": image_id, "name": None, "status": "queued", "visibility": "shared", "protected": False,
+            "os_hidden": False, "checksum": None, "os_hash_algo": None, "os_hash_value": None, "owner": PROJECT_ID,
+            "size": None, "virtual_size": None, "container_format": None, "disk_format": None, "created_at": now,
+            "updated_at": now, "tags": [], "min_ram": 0, "min_disk": 0, "self": "/v2/images/%s" % image_id,
+            "file": "/v2/images/%s/file" % image_id, "schema": "/v2/schemas/image"
+        }
+        image.update(properties)
+        return image
+
+    def _store_data(self, image: dict, data: bytes):
+        self.image_data[image["id"]] = data
+        image.update(status="active", size=len(data), checksum=hashlib.md5(data).hexdigest(),
+                     os_hash_algo="sha512", os_hash_value=hashlib.sha512(data).hexdigest(), updated_at=_now())
+
+    def _count_request(self, kind: str):
+        with self._lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+
+    def _should_fail(self, method: str) -> bool:
+        with self._lock:
+            return method in self.error_methods and self._random.random() < self.error_rate
+
+    # Keystone
+
+    def _versions(self) -> dict:
+        return {
+            "v3": {"id": "v3.14", "status": "stable", "updated": "2020-04-07T00:00:00Z",
+                   "links": [{"rel": "self", "href": "%s/v3/" % self.url}],
+                   "media-types": [{"base": "application/json",
+                                    "type": "application/vnd.openstack.identity-v3+json"}]},
+            "v2.0": {"id": "v2.0", "status": "deprecated", "updated": "2016-08-04T00:00:00Z",
+                     "links": [{"rel": "self", "href": "%s/v2.0/" % self.url}],
+                     "media-types": [{"base": "application/json",
+                                      "type": "application/vnd.openstack.identity-v2.0+json"}]}
+        }
+
+    def _issue_token(self) -> (str, str):
+        token = uuid.uuid4().hex
+        with self._lock:
+            self.tokens.add(token)
+        expires = (datetime.now(timezone.utc) + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%S.000000Z")
+        return token, expires
+
+    def _v3_token(self, body: dict) -> (str, dict):
+        token, expires = self._issue_token()
+        scope = body.get("auth", {}).get("scope", {}).get("project", {})
+        domain = {"id": "default", "name": "Default"}
+        return token, {"token": {
+            "methods": ["password"], "expires_at": expires, "issued_at": _now(),
+            "user": {"id": USER_ID, "name": "user", "domain": domain},
+            "project": {"id": PROJECT_ID, "name": scope.get("name", "project"), "domain": domain},
+            "roles": [{"id": "r1", "name": "member"}],
+            "catalog": [{"type": "image", "name": "glance", "id": "s1", "endpoints": [
+                {"id": "e%d" % i, "interface": interface, "region": "RegionOne", "region_id": "RegionOne",
+                 "url": self.url} for i, interface in enumerate(["public", "internal", "admin"])]}]
+        }}
+
+    def _v2_token(self, body: dict) -> dict:
+        token, expires = self._issue_token()
+        tenant_name = body.get("auth", {}).get("tenantName", "project")
+        return {"access": {
+            "token": {"id": token, "expires": expires, "issued_at": _now(),
+                      "tenant": {"id": PROJECT_ID, "name": tenant_name, "enabled": True}},
+            "user": {"id": USER_ID, "name": "user", "roles": [{"name": "member"}]},
+            "serviceCatalog": [{"type": "image", "name": "glance", "endpoints": [
+                {"region": "RegionOne", "publicURL": self.url, "internalURL": self.url, "adminURL": self.url}]}],
+            "metadata": {"roles": [], "is_admin": 0}
+        }}
+
+    # Glance
+
+    def _list_images(self, query: Dict[str, List[str]]) -> dict:
+        limit = min(int(query.get("limit", [DEFAULT_PAGE_SIZE])[0]), MAX_PAGE_SIZE)
+        marker = query.get("marker", [None])[0]
+        with self._lock:
+            images = sorted(self.images.values(), key=lambda image: (image["created_at"], image["id"]), reverse=True)
+            if marker is not None:
+                if marker not in self.images:
+                    raise HTTPError(400, "marker %s could not be found" % marker)
+                images = images[[image["id"] for image in images].index(marker) + 1:]
+            selected = [dict(image) for image in images if self._matches(image, query)]
+        page = selected[:limit]
+        body = {"images": page, "first": "/v2/images", "schema": "/v2/schemas/images"}
+        if len(selected) > limit:
+            next_query = {key: values for key, values in query.items() if key not in ("marker", )}
+            next_query["marker"] = [page[-1]["id"]]
+            body["next"] = "/v2/images?%s" % urlencode(next_query, doseq=True)
+        return body
+
+    @staticmethod
+    def _matches(image: dict, query: Dict[str, List[str]]) -> bool:
+        for key, values in query.items():
+            value = values[0]
+            if key in ("limit", "marker", "sort", "sort_key", "sort_dir"):
+                continue
+            if key == "tag":
+                if not set(values).issubset(image["tags"]):
+                    return False
+            elif key == "name" and value.startswith("in:"):
+                names = [name.strip().strip('"').replace('\\"', '"') for name in
+                         re.findall(r'"(?:[^"\\]|\\.)*"|[^,]+', value[3:])]
+                if image["name"] not in names:
+                    return False
+            elif key in ("size_min", "size_max"):
+                if image["size"] is None or (image["size"] < int(value) if key == "size_min"
+                                             else image["size"] > int(value)):
+                    return False
+            elif key in ("created_at", "updated_at"):
+                operator, _, time = value.partition(":")
+                if not getattr(_parse_time(image[key]), _TIME_OPERATORS[operator])(_parse_time(time)):
+                    return False
+            elif key == "protected":
+                if image["protected"] != (value.lower() == "true"):
+                    return False
+            elif key == "visibility" and value == "all":
+                continue
+            elif str(image.get(key)) != value:
+                return False
+        return True
+
+    def _get_image(self, image_id: str) -> dict:
+        with self._lock:
+            if image_id not in self.images:
+                raise HTTPError(404, "No image found with ID %s" % image_id)
+            return self.images[image_id]
+
+    def _create_image(self, body: dict) -> dict:
+        for key in _READ_ONLY_PROPERTIES - {"id"}:
+            if key in body:
+                raise HTTPError(403, "Attribute '%s' is read-only." % key)
+        image = self._new_image(body)
+        with self._lock:
+            if image["id"] in self.images:
+                raise HTTPError(409, "Image with identifier %s already exists!" % image["id"])
+            self.images[image["id"]] = image
+            return dict(image)
+
+    def _update_image(self, image_id: str, operations: List[dict]) -> dict:
+        with self._lock:
+            image = self._get_image(image_id)
+            for operation in operations:
+                key = operation["path"].lstrip("/")
+                if key in _READ_ONLY_PROPERTIES:
+                    raise HTTPError(403, "Attribute '%s' is read-only." % key)
+                if operation["op"] in ("add", "replace"):
+                    image[key] = operation["value"]
+                elif operation["op"] == "remove":
+                    image.pop(key, None)
+            image["updated_at"] = _now()
+            return dict(image)
+
+    def _update_tag(self, image_id: str, tag: str, add: bool):
+        with self._lock:
+            image = self._get_image(image_id)
+            if add and tag not in image["tags"]:
+                image["tags"] = image["tags"] + [tag]
+            elif not add and tag in image["tags"]:
+                image["tags"] = [other for other in image["tags"] if other != tag]
+            image["updated_at"] = _now()
+
+    def _delete_image(self, image_id: str):
+        with self._lock:
+            image = self._get_image(image_id)
+            if image["protected"]:
+                raise HTTPError(403, "Image %s is protected and cannot be deleted." % image_id)
+            del self.images[image_id]
+            self.image_data.pop(image_id, None)
+
+    def _upload(self, image_id: str, data: bytes):
+        with self._lock:
+            image = self._get_image(image_id)
+            if image["status"] != "queued":
+                raise HTTPError(409, "Image status transition from %s to saving is not allowed" % image["status"])
+            self._store_data(image, data)
+
+    def _throttle(self, size: int, started: float):
+        if self.bandwidth:
+            ahead = size / self.bandwidth - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+
+def _make_handler(cloud: FakeOpenStack):
+    class FakeOpenStackHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            with cloud._lock:
+                cloud.connections += 1
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+        def do_PUT(self):
+            self._handle("PUT")
+
+        def do_PATCH(self):
+            self._handle("PATCH")
+
+        def do_DELETE(self):
+            self._handle("DELETE")
+
+        def _handle(self, method: str):
+            url = urlparse(self.path)
+            path = url.path.rstrip("/")
+            query = parse_qs(url.query)
+            if cloud.latency > 0:
+                time.sleep(cloud.latency)
+            try:
+                if not path.startswith("/v2/"):
+                    cloud._count_request("%s identity" % method)
+                    self._handle_identity(method, path)
+                    return
+                cloud._count_request("%s %s" % (method, re.sub(r"/v2/images/[^/]+", "/v2/images/{id}", path)))
+                if self.headers.get("X-Auth-Token") not in cloud.tokens:
+                    raise HTTPError(401, "The request you have made requires authentication.")
+                if cloud._should_fail(method):
+                    # the request body must still be consumed for the connection to be reused
+                    self._read_body()
+                    raise HTTPError(cloud.error_status, "Injected failure")
+                self._handle_image(method, path, query)
+            except HTTPError as e:
+                self._send_json(e.status, {"error": {"message": e.message, "code": e.status}})
+
+        def _handle_identity(self, method: str, path: str):
+            versions = cloud._versions()
+            if method == "GET" and path == "":
+                self._send_json(300, {"versions": {"values": list(versions.values())}})
+            elif method == "GET" and path in ("/v3", "/v2.0"):
+                self._send_json(200, {"version": versions[path[1:]]})
+            elif method == "POST" and path == "/v3/auth/tokens":
+                token, body = cloud._v3_token(json.loads(self._read_body() or b"{}"))
+                self._send_json(201, body, {"X-Subject-Token": token})
+            elif method == "POST" and path == "/v2.0/tokens":
+                self._send_json(200, cloud._v2_token(json.loads(self._read_body() or b"{}")))
+            else:
+                raise HTTPError(404, "Not found")
+
+        def _handle_image(self, method: str, path: str, query: Dict[str, List[str]]):
+            match = re.match(r"^/v2/images/([^/]+)(/file|/tags/([^/]+))?$", path)
+            if method == "GET" and path == "/v2/schemas/image":
+                self._send_json(200, IMAGE_SCHEMA)
+            elif method == "GET" and path == "/v2/images":
+                self._send_json(200, cloud._list_images(query))
+            elif method == "POST" and path == "/v2/images":
+                self._send_json(201, cloud._create_image(json.loads(self._read_body())))
+            elif match is None:
+                raise HTTPError(404, "Not found")
+            elif match.group(2) is None and method == "GET":
+                self._send_json(200, dict(cloud._get_image(match.group(1))))
+            elif match.group(2) is None and method == "PATCH":
+                self._send_json(200, cloud._update_image(match.group(1), json.loads(self._read_body())))
+            elif match.group(2) is None and method == "DELETE":
+                cloud._delete_image(match.group(1))
+                self._send_empty(204)
+            elif match.group(3) is not None and method in ("PUT", "DELETE"):
+                cloud._update_tag(match.group(1), unquote(match.group(3)), method == "PUT")
+                self._send_empty(204)
+            elif match.group(3) is not None:
+                raise HTTPError(405, "Method not allowed")
+            elif method == "PUT":
+                cloud._get_image(match.group(1))
+                started = time.monotonic()
+                data = self._read_body()
+                cloud._throttle(len(data), started)
+                cloud._upload(match.group(1), data)
+                self._send_empty(204)
+            elif method == "GET":
+                self._send_data(match.group(1))
+            else:
+                raise HTTPError(405, "Method not allowed")
+
+        def _send_data(self, image_id: str):
+            image = cloud._get_image(image_id)
+            data = cloud.get_data(image_id)
+            if data is None:
+                self._send_empty(204)
+                return
+            start, end = 0, len(data) - 1
+            status = 200
+            headers = {"Content-Type": "application/octet-stream", "Content-MD5": image["checksum"]}
+            byte_range = re.match(r"^bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+            if byte_range is not None:
+                start = int(byte_range.group(1))
+                end = min(int(byte_range.group(2)) if byte_range.group(2) else end, len(data) - 1)
+                if start > end:
+                    raise HTTPError(416, "Requested range not satisfiable")
+                status = 206
+                headers = {"Content-Type": "application/octet-stream",
+                           "Content-Range": "bytes %d-%d/%d" % (start, end, len(data))}
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(end - start + 1))
+            self.end_headers()
+            started = time.monotonic()
+            for offset in range(start, end + 1, _TRANSFER_CHUNK_SIZE):
+                chunk = data[offset:min(offset + _TRANSFER_CHUNK_SIZE, end + 1)]
+                self.wfile.write(chunk)
+                cloud._throttle(offset + len(chunk) - start, started)
+
+        def _read_body(self) -> bytes:
+            if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+                chunks = []
+                while True:
+                    size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                    if size == 0:
+                        # skip any trailers up to the blank line that ends the body
+                        while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                            pass
+                        return b"".join(chunks)
+                    chunks.append(self.rfile.read(size))
+                    self.rfile.readline()
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        def _send_json(self, status: int, body: dict, headers: Dict[str, str]=None):
+            content = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(content)
+
+        def _send_empty(self, status: int):
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    return FakeOpenStackHandler
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the cold-start latency of glancecp: importing it, printing its help and parsing a typical command line.
+
+Every sample is taken in a fresh interpreter, as a script calling glancecp in a loop would. The "parse" scenario
+parses a typical command line and resolves the defaults of the OpenStack arguments for its environments, stopping
+before any connection to OpenStack is made.
+
+Usage: python3 benchmarks/startup.py [--repeats N]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SCENARIOS = {
+    "import": ["-c", "import openstacktools.glancecp"],
+    "help": ["-m", "openstacktools.glancecp", "--help"],
+    "parse": ["-c", "from openstacktools.glancecp import GlanceCPShell; shell = GlanceCPShell(); "
+                    "args = shell.parse_args(['source:image', 'dest:image']); "
+                    "shell.resolve_env_args(args, 'source', 'dest', shell.load_config(args.config))"]
+}
+
+_MISSING_CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "missing.config")
+_MODULE_COUNT_SCRIPT = "import sys; import openstacktools.glancecp; print(len(sys.modules))"
+
+
+def time_scenario(arguments, repeats: int) -> list:
+    environment = dict(os.environ, GLANCECP_CONFIG_FILE=_MISSING_CONFIG_FILE)
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        subprocess.run([sys.executable] + arguments, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       env=environment)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=20, help="Number of fresh interpreters to time per scenario")
+    args = parser.parse_args()
+
+    baseline = statistics.median(time_scenario(["-c", "pass"], args.repeats))
+    print("%-8s %12s %12s %14s" % ("scenario", "median (ms)", "min (ms)", "minus python"))
+    for scenario, arguments in SCENARIOS.items():
+        samples = time_scenario(arguments, args.repeats)
+        print("%-8s %12.1f %12.1f %14.1f" % (scenario, statistics.median(samples) * 1000, min(samples) * 1000,
+                                             (statistics.median(samples) - baseline) * 1000))
+    modules = subprocess.check_output([sys.executable, "-c", _MODULE_COUNT_SCRIPT]).decode().strip()
+    print("modules loaded by importing glancecp: %s" % modules)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite of the tools against fake OpenStack servers, giving results that can be compared between revisions.
+
+Each benchmark runs the command-line tools (from this working tree) in fresh interpreters against the fake Keystone and
+Glance of `fake_openstack.py`, so the whole of a run is measured, from startup to exit (except for copy, for which only
+the transfer of the image data is timed, as recorded by glancecp's --metrics-json):
+- copy: glancecp copying an image between two fake clouds, streamed and in byte-range segments (MB/s);
+- delete: glancenuke deleting every image in a fake cloud at various numbers of parallel deletes (images/s);
+- startup: the cold-start scenarios of `startup.py` (ms).
+
+The latency of every request, the bandwidth of each image download and upload and the rate at which deletes fail are set
+with options, so the same suite can stand in for a nearby, distant or overloaded cloud. Results can be saved with
+--json and a later run compared against them with --compare.
+
+Usage: python3 benchmarks/suite.py [--only copy,delete,startup] [--json RESULTS] [--compare BASELINE]
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from fake_openstack import FakeOpenStack
+from startup import SCENARIOS, time_scenario
+
+BENCHMARKS = ["copy", "delete", "startup"]
+RESULTS_VERSION = 1
+
+_REPOSITORY_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_MISSING_CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "missing.config")
+
+
+def get_environment(clouds: dict) -> dict:
+    """
+    Gets the environment variables with which to run the tools against the given fake clouds.
+    :param clouds: the fake clouds by environment name ("" for the default environment)
+    :return: the environment, without any OpenStack settings of the caller's
+    """
+    environment = {key: value for key, value in os.environ.items() if "OS_" not in key}
+    environment.update(GLANCECP_CONFIG_FILE=_MISSING_CONFIG_FILE, GLANCENUKE_CONFIG_FILE=_MISSING_CONFIG_FILE,
+                       PYTHONPATH=os.pathsep.join([_REPOSITORY_DIRECTORY] + environment.get("PYTHONPATH", "").split(
+                           os.pathsep)).rstrip(os.pathsep))
+    for env_name, cloud in clouds.items():
+        prefix = "%s_" % env_name if env_name != "" else ""
+        environment.update({prefix + "OS_AUTH_URL": cloud.auth_url, prefix + "OS_USERNAME": "benchmark",
+                            prefix + "OS_PASSWORD": "benchmark", prefix + "OS_PROJECT_NAME": "benchmark",
+                            prefix + "OS_USER_DOMAIN_NAME": "Default", prefix + "OS_PROJECT_DOMAIN_NAME": "Default"})
+    return environment
+
+
+def run_tool(module: str, arguments: list, environment: dict) -> float:
+    """
+    Runs one of the tools to completion.
+    :param module: the module of the tool (e.g. "glancecp")
+    :param arguments: the arguments to run it with
+    :param environment: the environment to run it in
+    :return: how long it took in seconds
+    """
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-m", "openstacktools.%s" % module] + arguments, env=environment,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError("%s %s failed: %s" % (module, " ".join(arguments), result.stderr.decode().strip()))
+    return elapsed
+
+
+def time_transfer(arguments: list, environment: dict) -> float:
+    """
+    Runs glancecp to completion, timing only the transfer of the image data (not startup, auth, lookup or create).
+    :param arguments: the arguments to run it with
+    :param environment: the environment to run it in
+    :return: how long the transfer took in seconds
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        metrics_path = os.path.join(directory, "metrics.json")
+        run_tool("glancecp", arguments + ["--metrics-json", metrics_path], environment)
+        with open(metrics_path) as metrics_file:
+            phases = json.load(metrics_file)["phases"]
+    transfers = [phase["seconds"] for phase in phases if phase["phase"] == "transfer"]
+    if len(transfers) == 0:
+        raise RuntimeError("glancecp %s did not transfer any image data" % " ".join(arguments))
+    return sum(transfers)
+
+
+def benchmark_copy(args) -> dict:
+    size = args.image_size * 1024 * 1024
+    variants = {"copy (streamed)": [], "copy (4 segments)": ["--segments", "4", "--segment-size",
+                                                             "%dM" % max(1, args.image_size // 8)]}
+    results = {}
+    with FakeOpenStack(latency=args.latency, bandwidth=_to_bytes(args.download_bandwidth)) as source, \
+            FakeOpenStack(latency=args.latency, bandwidth=_to_bytes(args.upload_bandwidth)) as destination:
+        source.add_image("benchmark", os.urandom(size), disk_format="raw", container_format="bare")
+        environment = get_environment({"source": source, "destination": destination})
+        for name, arguments in variants.items():
+            samples = []
+            for repeat in range(args.repeats):
+                copy_name = "%s-%d" % (name, repeat)
+                samples.append(time_transfer(["source:benchmark", "destination:%s" % copy_name] + arguments,
+                                             environment))
+            results[name] = _result(size / 1024 / 1024 / statistics.median(samples), "MB/s", True)
+    return results
+
+
+def benchmark_delete(args) -> dict:
+    results = {}
+    for parallel_deletes in args.parallel_deletes:
+        samples = []
+        for _ in range(args.repeats):
+            with FakeOpenStack(latency=args.latency, error_rate=args.error_rate, error_methods=["DELETE"]) as cloud:
+                for i in range(args.images):
+                    cloud.add_image("benchmark-%d" % i)
+                elapsed = run_tool("glancenuke", ["-y", "-q", "-p", str(parallel_deletes)],
+                                   get_environment({"": cloud}))
+                if len(cloud.images) != 0:
+                    raise RuntimeError("glancenuke left %d images undeleted" % len(cloud.images))
+            samples.append(elapsed)
+        results["delete (-p %d)" % parallel_deletes] = _result(args.images / statistics.median(samples), "images/s",
+                                                               True)
+    return results
+
+
+def benchmark_startup(args) -> dict:
+    return {"startup (%s)" % scenario: _result(statistics.median(time_scenario(arguments, args.repeats)) * 1000, "ms",
+                                               False)
+            for scenario, arguments in SCENARIOS.items()}
+
+
+def _to_bytes(megabytes: float=None) -> float:
+    return megabytes * 1024 * 1024 if megabytes is not None else None
+
+
+def _result(value: float, unit: str, higher_is_better: bool) -> dict:
+    return {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+
+def print_results(results: dict, baseline: dict=None):
+    """
+    Prints the given results, compared against the given baseline results if any.
+    :param results: the results by benchmark name
+    :param baseline: the baseline results by benchmark name
+    """
+    print("%-22s %12s %-9s %s" % ("benchmark", "result", "unit", "vs baseline" if baseline is not None else ""))
+    for name, result in results.items():
+        comparison = ""
+        if baseline is not None:
+            if name in baseline and baseline[name]["value"] != 0:
+                change = (result["value"] - baseline[name]["value"]) / baseline[name]["value"] * 100
+                better = (change > 0) == result["higher_is_better"]
+                comparison = "%+.1f%% (%s)" % (change, "better" if better else "worse") if abs(change) >= 0.05 \
+                    else "no change"
+            else:
+                comparison = "not in baseline"
+        print("%-22s %12.1f %-9s %s" % (name, result["value"], result["unit"], comparison))
+
+
+def _parse_list(value: str) -> list:
+    return [item.strip() for item in value.split(",") if item.strip() != ""]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--only", type=_parse_list, default=BENCHMARKS,
+                        help="Comma-separated benchmarks to run (default: %s)" % ",".join(BENCHMARKS))
+    parser.add_argument("--repeats", type=int, default=3, help="Number of times to run each benchmark (the median is "
+                                                               "reported)")
+    parser.add_argument("--latency", type=float, default=0.01, help="Latency of every request in seconds")
+    parser.add_argument("--download-bandwidth", type=float, default=10,
+                        help="Bandwidth of each image data download from the source cloud in MB/s")
+    parser.add_argument("--upload-bandwidth", type=float, default=None,
+                        help="Bandwidth of each image data upload to the destination cloud in MB/s (default: no limit)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of each image delete failing")
+    parser.add_argument("--image-size", type=int, default=64, help="Size of the image to copy in MB")
+    parser.add_argument("--images", type=int, default=500, help="Number of images to delete")
+    parser.add_argument("--parallel-deletes", type=lambda value: [int(item) for item in _parse_list(value)],
+                        default=[1, 5, 20, 50], help="Comma-separated numbers of parallel deletes to measure")
+    parser.add_argument("--json", help="File to write the results to")
+    parser.add_argument("--compare", help="Results file (written by --json) to compare against")
+    args = parser.parse_args()
+    unknown = set(args.only) - set(BENCHMARKS)
+    if len(unknown) > 0:
+        parser.error("Unknown benchmarks: %s" % ", ".join(sorted(unknown)))
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+
+    functions = {"copy": benchmark_copy, "delete": benchmark_delete, "startup": benchmark_startup}
+    results = {}
+    for benchmark in BENCHMARKS:
+        if benchmark in args.only:
+            results.update(functions[benchmark](args))
+    print_results(results, baseline)
+
+    if args.json is not None:
+        settings = {key: value for key, value in vars(args).items() if key not in ("json", "compare")}
+        with open(args.json, "w") as results_file:
+            json.dump({"version": RESULTS_VERSION, "created_at": datetime.now(timezone.utc).strftime(
+                "%Y-%m-%dT%H:%M:%SZ"), "python": platform.python_version(), "settings": settings, "results": results},
+                results_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
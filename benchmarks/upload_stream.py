@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark comparing the throughput and peak memory use of the glancecp upload stream against the implementation
+it replaced (which re-sliced every downloaded chunk).
+
+Each implementation is run in its own subprocess so that the peak RSS reported for one is not polluted by the other.
+
+Usage: python3 benchmarks/upload_stream.py [--size-mb N] [--chunk-size BYTES] [--read-size BYTES]
+"""
+
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+IMPLEMENTATIONS = ["legacy", "current"]
+
+_REPOSITORY_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _get_environment() -> dict:
+    # the benchmark imports openstacktools from this working tree, wherever it is run from
+    return dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [_REPOSITORY_DIRECTORY] + os.environ.get("PYTHONPATH", "").split(os.pathsep)).rstrip(os.pathsep))
+
+
+def legacy_data_to_upload_stream(data, buffer_size=io.DEFAULT_BUFFER_SIZE):
+    class UploadStream(io.RawIOBase):
+        def __init__(self, data_iter, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.remaining_data = None
+            self.data_iter = data_iter
+
+        def readable(self):
+            return True
+
+        def readinto(self, b):
+            try:
+                max_chunk_size = len(b)
+                chunk = self.remaining_data or next(self.data_iter)
+                output, self.remaining_data = chunk[:max_chunk_size], chunk[max_chunk_size:]
+                b[:len(output)] = output
+                return len(output)
+            except StopIteration:
+                return 0
+
+    return io.BufferedReader(UploadStream(iter(data)), buffer_size=buffer_size)
+
+
+def generate_data(total_size: int, chunk_size: int):
+    """
+    Simulates the download iterator returned by `images.data()`, yielding a fresh bytes object per chunk.
+    """
+    remaining = total_size
+    while remaining > 0:
+        size = min(chunk_size, remaining)
+        yield bytes(size)
+        remaining -= size
+
+
+def run(implementation: str, total_size: int, chunk_size: int, read_size: int) -> dict:
+    # imported for both implementations so that the import cost does not skew the peak RSS comparison
+    from openstacktools._copy import data_to_upload_stream
+    if implementation == "legacy":
+        stream = legacy_data_to_upload_stream(generate_data(total_size, chunk_size))
+    else:
+        stream = data_to_upload_stream(generate_data(total_size, chunk_size), buffer_size=chunk_size)
+
+    transferred = 0
+    started = time.perf_counter()
+    # mimics the way glanceclient consumes the file-like object given to `images.upload()`
+    while True:
+        chunk = stream.read(read_size)
+        if not chunk:
+            break
+        transferred += len(chunk)
+    elapsed = time.perf_counter() - started
+
+    assert transferred == total_size, "transferred %d bytes, expected %d" % (transferred, total_size)
+    return {
+        "implementation": implementation,
+        "bytes": transferred,
+        "seconds": elapsed,
+        "mb_per_second": transferred / elapsed / 1024 / 1024,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=2048, help="Amount of data to stream (in MiB)")
+    parser.add_argument("--chunk-size", type=int, default=1024 * 1024, help="Size of downloaded chunks (in bytes)")
+    parser.add_argument("--read-size", type=int, default=64 * 1024,
+                        help="Size of the reads made by the uploader (in bytes)")
+    parser.add_argument("--implementation", choices=IMPLEMENTATIONS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    total_size = args.size_mb * 1024 * 1024
+
+    if args.implementation:
+        print(json.dumps(run(args.implementation, total_size, args.chunk_size, args.read_size)))
+        return
+
+    print("%-10s %12s %14s" % ("impl", "MB/s", "peak RSS (KB)"))
+    for implementation in IMPLEMENTATIONS:
+        output = subprocess.check_output([
+            sys.executable, __file__, "--implementation", implementation, "--size-mb", str(args.size_mb),
+            "--chunk-size", str(args.chunk_size), "--read-size", str(args.read_size)], env=_get_environment())
+        result = json.loads(output.decode())
+        print("%-10s %12.1f %14d" % (implementation, result["mb_per_second"], result["peak_rss_kb"]))
+
+
+if __name__ == "__main__":
+    main()
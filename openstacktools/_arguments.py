@@ -1,159 +1,74 @@
 import argparse
+import os
 from configparser import ConfigParser
 
-from glanceclient.common import utils
-
-
-def add_openstack_args(parser, env_name="", config=ConfigParser(), prefix=None):
-    hyphen_prefix = "%s-" % prefix if prefix else ""
-    underscore_prefix = "%s_" % prefix if prefix else ""
-
-    parser.add_argument('--%sos-auth-url' % hyphen_prefix,
-                        default=get_default(config, 'OS_AUTH_URL', env_name=env_name),
-                        help=get_help(env_name, 'OS_AUTH_URL'))
-
-    parser.add_argument('--%sos_auth_url' % underscore_prefix,
-                        help=argparse.SUPPRESS)
-
-    parser.add_argument('--%sos-username' % hyphen_prefix,
-                        default=get_default(config, 'OS_USERNAME', env_name=env_name),
-                        help=get_help(env_name, 'OS_USERNAME'))
-
-    parser.add_argument('--%sos_username' % underscore_prefix,
-                        help=argparse.SUPPRESS)
-
-    parser.add_argument('--%sos-user-id' % hyphen_prefix,
-                        default=get_default(config, 'OS_USER_ID', env_name=env_name),
-                        help=get_help(env_name, 'OS_USER_ID'))
-
-    parser.add_argument('--%sos_user_id' % underscore_prefix,
-                        help=argparse.SUPPRESS)
-
-    parser.add_argument('--%sos-user-domain-name' % hyphen_prefix,
-                        default=get_default(config, 'OS_USER_DOMAIN_NAME', env_name=env_name),
-                        help=get_help(env_name, 'OS_USER_DOMAIN_NAME'))
-
-    parser.add_argument('--%sos_user_domain_name' % underscore_prefix,
-                        help=argparse.SUPPRESS)
-
-    parser.add_argument('--%sos-user-domain-id' % hyphen_prefix,
-                        default=get_default(config, 'OS_USER_DOMAIN_ID', env_name=env_name),
-                        help=get_help(env_name, 'OS_USER_DOMAIN_ID'))
-
-    parser.add_argument('--%sos_user_domain_id' % underscore_prefix,
-                        help=argparse.SUPPRESS)
-
-    parser.add_argument('--%sos-password' % hyphen_prefix,
-                        default=get_default(config, 'OS_PASSWORD', env_name=env_name),
-                        help=get_help(env_name, 'OS_PASSWORD') + '''
+from openstacktools._catalog import DEFAULT_MAX_AGE
+
+
+# the OpenStack arguments, as tuples of the argument's name, the config options and environment variables from which its
+# default is taken, the names of any hidden aliases and the default of last resort
+OPENSTACK_ARGS = [
+    ("auth-url", ["OS_AUTH_URL"], [], ""),
+    ("username", ["OS_USERNAME"], [], ""),
+    ("user-id", ["OS_USER_ID"], [], ""),
+    ("user-domain-name", ["OS_USER_DOMAIN_NAME"], [], ""),
+    ("user-domain-id", ["OS_USER_DOMAIN_ID"], [], ""),
+    ("password", ["OS_PASSWORD"], [], ""),
+    ("project-name", ["OS_PROJECT_NAME", "OS_TENANT_NAME"], ["tenant-name"], ""),
+    ("project-id", ["OS_PROJECT_ID", "OS_TENANT_ID"], ["tenant-id"], ""),
+    ("project-domain-name", ["OS_PROJECT_DOMAIN_NAME"], [], ""),
+    ("project-domain-id", ["OS_PROJECT_DOMAIN_ID"], [], ""),
+    ("region-name", ["OS_REGION_NAME"], [], ""),
+    ("auth-token", ["OS_AUTH_TOKEN"], [], ""),
+    ("auth-type", ["OS_AUTH_TYPE"], [], ""),
+    ("service-type", ["OS_SERVICE_TYPE"], [], ""),
+    ("endpoint-type", ["OS_ENDPOINT_TYPE"], [], ""),
+    ("cacert", ["OS_CACERT"], [], ""),
+    ("cert", ["OS_CERT"], [], ""),
+    ("key", ["OS_KEY"], [], ""),
+    ("image-url", ["OS_IMAGE_URL"], [], ""),
+    ("image-api-version", ["OS_IMAGE_API_VERSION"], [], "2")
+]
+
+PASSWORD_WARNING = '''
                            WARNING: specifying your password on the command-line
                            may expose it to other users on the same machine.
-                        ''')
-
-    parser.add_argument('--%sos_password' % underscore_prefix,
-                        help=argparse.SUPPRESS)
-
-    parser.add_argument('--%sos-project-name' % hyphen_prefix,
-                        default=get_default(config, 'OS_PROJECT_NAME', 'OS_TENANT_NAME', env_name=env_name),
-                        help=get_help(env_name, 'OS_PROJECT_NAME', 'OS_TENANT_NAME'))
-
-    parser.add_argument('--%sos_project_name' % underscore_prefix,
-                        '--%sos-tenant-name' % hyphen_prefix,
-                        '--%sos_tenant_name' % underscore_prefix,
-                        help=argparse.SUPPRESS)
-
-    parser.add_argument('--%sos-project-id' % hyphen_prefix,
-                        default=get_default(config, 'OS_PROJECT_ID', 'OS_TENANT_ID', env_name=env_name),
-                        help=get_help(env_name, 'OS_PROJECT_ID', 'OS_TENANT_ID'))
-
-    parser.add_argument('--%sos_project_id' % underscore_prefix,
-                        '--%sos-tenant-id' % hyphen_prefix,
-                        '--%sos_tenant_id' % underscore_prefix,
-                        help=argparse.SUPPRESS)
-
-    parser.add_argument('--%sos-project-domain-name' % hyphen_prefix,
-                        default=get_default(config, 'OS_PROJECT_DOMAIN_NAME', env_name=env_name),
-                        help=get_help(env_name, 'OS_PROJECT_DOMAIN_NAME'))
-
-    parser.add_argument('--%sos_project_domain_name' % underscore_prefix,
-                        help=argparse.SUPPRESS)
-
-    parser.add_argument('--%sos-project-domain-id' % hyphen_prefix,
-                        default=get_default(config, 'OS_PROJECT_DOMAIN_ID', env_name=env_name),
-                        help=get_help(env_name, 'OS_PROJECT_DOMAIN_ID'))
-
-    parser.add_argument('--%sos_project_domain_id' % underscore_prefix,
-                        help=argparse.SUPPRESS)
+                        '''
 
-    parser.add_argument('--%sos-region-name' % hyphen_prefix,
-                        default=get_default(config, 'OS_REGION_NAME', env_name=env_name),
-                        help=get_help(env_name, 'OS_REGION_NAME'))
 
-    parser.add_argument('--%sos_region_name' % underscore_prefix,
-                        help=argparse.SUPPRESS)
-
-    parser.add_argument('--%sos-auth-token' % hyphen_prefix,
-                        default=get_default(config, 'OS_AUTH_TOKEN', env_name=env_name),
-                        help=get_help(env_name, 'OS_AUTH_TOKEN'))
-
-    parser.add_argument('--%sos_auth_token' % underscore_prefix,
-                        help=argparse.SUPPRESS)
-
-    parser.add_argument('--%sos-auth-type' % hyphen_prefix,
-                        default=get_default(config, 'OS_AUTH_TYPE', env_name=env_name),
-                        help=get_help(env_name, 'OS_AUTH_TYPE'))
-
-    parser.add_argument('--%sos_auth_type' % underscore_prefix,
-                        help=argparse.SUPPRESS)
-
-    parser.add_argument('--%sos-service-type' % hyphen_prefix,
-                        default=get_default(config, 'OS_SERVICE_TYPE', env_name=env_name),
-                        help=get_help(env_name, 'OS_SERVICE_TYPE'))
-
-    parser.add_argument('--%sos_service_type' % underscore_prefix,
-                        help=argparse.SUPPRESS)
-
-    parser.add_argument('--%sos-endpoint-type' % hyphen_prefix,
-                        default=get_default(config, 'OS_ENDPOINT_TYPE', env_name=env_name),
-                        help=get_help(env_name, 'OS_ENDPOINT_TYPE'))
-
-    parser.add_argument('--%sos_endpoint_type' % underscore_prefix,
-                        help=argparse.SUPPRESS)
-
-    parser.add_argument('--%sos-cacert' % hyphen_prefix,
-                        default=get_default(config, 'OS_CACERT', env_name=env_name),
-                        help=get_help(env_name, 'OS_CACERT'))
-
-    parser.add_argument('--%sos_cacert' % underscore_prefix,
-                        help=argparse.SUPPRESS)
-
-    parser.add_argument('--%sos-cert' % hyphen_prefix,
-                        default=get_default(config, 'OS_CERT', env_name=env_name),
-                        help=get_help(env_name, 'OS_CERT'))
-
-    parser.add_argument('--%sos_cert' % underscore_prefix,
-                        help=argparse.SUPPRESS)
-
-    parser.add_argument('--%sos-key' % hyphen_prefix,
-                        default=get_default(config, 'OS_KEY', env_name=env_name),
-                        help=get_help(env_name, 'OS_KEY'))
-
-    parser.add_argument('--%sos_key' % underscore_prefix,
-                        help=argparse.SUPPRESS)
-
-    parser.add_argument('--%sos-image-url' % hyphen_prefix,
-                        default=get_default(config, 'OS_IMAGE_URL', env_name=env_name),
-                        help=get_help(env_name, 'OS_IMAGE_URL'))
-
-    parser.add_argument('--%sos_image_url' % underscore_prefix,
-                        help=argparse.SUPPRESS)
-
-    parser.add_argument('--%sos-image-api-version' % hyphen_prefix,
-                        default=get_default(config, 'OS_IMAGE_API_VERSION', default="2", env_name=env_name),
-                        help=get_help(env_name, 'OS_IMAGE_API_VERSION'))
+def add_openstack_args(parser, env_name="", config=ConfigParser(), prefix=None, resolve_defaults=True):
+    # if the defaults are not resolved here, arguments that are not given are left unset and resolve_openstack_args
+    # must be called once the environment is known (env_name is then only used in the help)
+    hyphen_prefix = "%s-" % prefix if prefix else ""
+    underscore_prefix = "%s_" % prefix if prefix else ""
 
-    parser.add_argument('--%sos_image_api_version' % underscore_prefix,
-                        help=argparse.SUPPRESS)
+    for name, params, aliases, default in OPENSTACK_ARGS:
+        if resolve_defaults:
+            default = get_default(config, *params, default=default, env_name=env_name)
+        else:
+            default = argparse.SUPPRESS
+        help_text = get_help(env_name, *params)
+        if name == "password":
+            help_text += PASSWORD_WARNING
+        parser.add_argument('--%sos-%s' % (hyphen_prefix, name), default=default, help=help_text)
+
+        hidden_options = ['--%sos_%s' % (underscore_prefix, name.replace("-", "_"))]
+        for alias in aliases:
+            hidden_options.append('--%sos-%s' % (hyphen_prefix, alias))
+            hidden_options.append('--%sos_%s' % (underscore_prefix, alias.replace("-", "_")))
+        parser.add_argument(*hidden_options, help=argparse.SUPPRESS)
+
+
+def resolve_openstack_args(args, env_name="", config=ConfigParser(), prefix=None):
+    # returns a copy of the given namespace in which the OpenStack arguments that were not given are set to their
+    # defaults for the given environment
+    underscore_prefix = "%s_" % prefix if prefix else ""
+    resolved = argparse.Namespace(**vars(args))
+    for name, params, _, default in OPENSTACK_ARGS:
+        dest = "%sos_%s" % (underscore_prefix, name.replace("-", "_"))
+        if getattr(resolved, dest, None) is None:
+            setattr(resolved, dest, get_default(config, *params, default=default, env_name=env_name))
+    return resolved
 
 
 def get_default(config, *params, default="", env_name=""):
@@ -169,7 +84,7 @@ def get_default(config, *params, default="", env_name=""):
             return value
     if env_name != "":
         env_params = [('%s_%s' % (env_name, param)) for param in params]
-        value = utils.env(*env_params, default=None)
+        value = get_env(*env_params, default=None)
         if value:
             return value
         for param in params:
@@ -177,7 +92,7 @@ def get_default(config, *params, default="", env_name=""):
                 return env_name
             if param == "OS_TENANT_NAME":
                 return env_name
-    return utils.env(*params, default=default)
+    return get_env(*params, default=default)
 
 
 def get_help(env_name, *params):
@@ -204,3 +119,44 @@ def env_section(env_name):
     if section == "":
         section = "common"
     return section
+
+
+def get_env(*names, default=""):
+    # returns the value of the first of the given environment variables that is set and not empty
+    for name in names:
+        value = os.environ.get(name)
+        if value:
+            return value
+    return default
+
+
+def add_image_index_args(parser):
+    parser.add_argument("--image-index",
+                        dest="image_index",
+                        default=get_env("GLANCECP_IMAGE_INDEX", default=None),
+                        help='''
+               Path of a local (SQLite) index of the images in each
+               environment, used instead of listing the images in glance to
+               find images by name or select the images to delete. The index
+               of an environment is created when first used and afterwards
+               only the images updated since are listed to bring it up to
+               date. Images found by name in the index are checked with glance
+               before they are used. Defaults to env[GLANCECP_IMAGE_INDEX].
+        ''')
+
+    parser.add_argument("--image-index-max-age",
+                        dest="image_index_max_age",
+                        type=float,
+                        default=DEFAULT_MAX_AGE,
+                        help='''
+               Age in seconds at which the index of an environment is
+               rebuilt by listing all of its images, which drops the images
+               deleted by others since.
+        ''')
+
+    parser.add_argument("--rebuild-image-index",
+                        dest="rebuild_image_index",
+                        action="store_true",
+                        help='''
+               Rebuild the index of each environment used, whatever its age.
+        ''')
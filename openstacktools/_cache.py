@@ -0,0 +1,187 @@
+import mmap
+import os
+import shutil
+import tempfile
+from threading import Lock
+from typing import Callable, Iterator, Optional
+
+from openstacktools._helpers import get_image_property, print_error
+
+DEFAULT_CACHE_SIZE = 100 * 1024 * 1024 * 1024
+
+_ENTRY_SUFFIX = ".image"
+
+
+def get_cache_key(image) -> Optional[str]:
+    """
+    Gets the key under which the data of the given image is cached, based on its checksums.
+    :param image: the image
+    :return: the cache key or `None` if the image has no checksum
+    """
+    hash_algorithm = get_image_property(image, "os_hash_algo")
+    hash_value = get_image_property(image, "os_hash_value")
+    if hash_algorithm is not None and hash_value is not None:
+        return "%s-%s" % (hash_algorithm, hash_value)
+    checksum = get_image_property(image, "checksum")
+    if checksum is not None:
+        return "md5-%s" % checksum
+    return None
+
+
+def read_mapped(path: str, chunk_size: int) -> Iterator[memoryview]:
+    """
+    Reads a file through a memory map, without copying its contents.
+    :param path: path of the file
+    :param chunk_size: size of the chunks to yield
+    :return: iterator over views of consecutive chunks of the file
+    """
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    # the map is left to be closed when the last view of it is released, as consumers may hold on to a chunk for a
+    # while after it has been yielded
+    view = memoryview(mapped)
+    for offset in range(0, len(view), chunk_size):
+        yield view[offset:offset + chunk_size]
+
+
+class ImageCache(object):
+    """
+    Local cache of image data, keyed by the image's checksum and limited in size by evicting the least recently used
+    entries.
+    """
+    def __init__(self, cache_dir: str, max_size: int=DEFAULT_CACHE_SIZE, log: Callable[[str], None]=print_error):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.log = log
+        self._eviction_lock = Lock()
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, "%s%s" % (key, _ENTRY_SUFFIX))
+
+    def lookup(self, key: str) -> Optional[str]:
+        """
+        Looks up the cached data with the given key, marking it as recently used.
+        :param key: the cache key
+        :return: path of the cached data or `None` if it is not cached
+        """
+        path = self.get_path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def writer(self, key: str, size: Optional[int]=None) -> Optional["CacheWriter"]:
+        """
+        Creates a writer through which data can be added to the cache.
+        :param key: the cache key for the data
+        :param size: the expected size of the data, if known
+        :return: the writer or `None` if the data is too large to be cached
+        """
+        if size is not None and size > self.max_size:
+            self.log("WARNING: not caching %s as it is larger than the cache" % key)
+            return None
+        return CacheWriter(self, key)
+
+    def add_file(self, key: str, path: str):
+        """
+        Adds the data in the given file to the cache, leaving the file in place.
+        :param key: the cache key for the data
+        :param path: path of the file
+        """
+        if os.path.getsize(path) > self.max_size:
+            return
+        # the data is copied rather than linked, as a link would share its modification time, which the eviction
+        # order is based on, with the original file
+        temp_path = self._get_temp_path(key)
+        try:
+            shutil.copyfile(path, temp_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        self._commit(key, temp_path)
+
+    def remove(self, key: str):
+        """
+        Removes the cached data with the given key.
+        :param key: the cache key
+        """
+        try:
+            os.remove(self.get_path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """
+        Evicts the least recently used data until the cache is within its size limit.
+        """
+        with self._eviction_lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(_ENTRY_SUFFIX):
+                    try:
+                        stat = os.stat(os.path.join(self.cache_dir, name))
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, name))
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total_size <= self.max_size:
+                    break
+                self.log("evicting %s from image cache" % name)
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass
+                total_size -= size
+
+    def _get_temp_path(self, key: str) -> str:
+        file_descriptor, temp_path = tempfile.mkstemp(prefix="%s." % key, suffix=".tmp", dir=self.cache_dir)
+        os.close(file_descriptor)
+        return temp_path
+
+    def _commit(self, key: str, temp_path: str):
+        path = self.get_path(key)
+        os.replace(temp_path, path)
+        # marks the entry as the most recently used, so that the eviction does not remove it straight away
+        os.utime(path)
+        self.evict()
+
+
+class CacheWriter(object):
+    """
+    Writes data into the cache as it streams past. The data only becomes visible in the cache once committed.
+    """
+    def __init__(self, cache: ImageCache, key: str):
+        self.cache = cache
+        self.key = key
+        self.temp_path = cache._get_temp_path(key)
+        self._file = open(self.temp_path, "wb")
+
+    def wrap(self, data):
+        """
+        Wraps the given data so that it is written to the cache as it is iterated over.
+        :param data: the data
+        :return: iterator over the same data
+        """
+        for chunk in data:
+            self._file.write(chunk)
+            yield chunk
+
+    def commit(self):
+        """
+        Adds the data written so far to the cache.
+        """
+        self._file.close()
+        self.cache._commit(self.key, self.temp_path)
+
+    def abort(self):
+        """
+        Discards the data written so far.
+        """
+        self._file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
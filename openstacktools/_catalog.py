@@ -0,0 +1,266 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional
+
+from openstacktools._helpers import get_image_api_version
+
+if TYPE_CHECKING:
+    from glanceclient import Client
+
+# the catalog of an environment is listed in full again once this old, as images deleted by others since are otherwise
+# never noticed (glance does not list deleted images, so they cannot be picked up incrementally)
+DEFAULT_MAX_AGE = 24 * 60 * 60
+# glance's default maximum page size
+LIST_PAGE_SIZE = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalogs (
+    key TEXT PRIMARY KEY,
+    last_updated_at TEXT,
+    rebuilt_at REAL NOT NULL,
+    refreshed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS images (
+    catalog TEXT NOT NULL,
+    id TEXT NOT NULL,
+    name TEXT,
+    checksum TEXT,
+    os_hash_algo TEXT,
+    os_hash_value TEXT,
+    size INTEGER,
+    status TEXT,
+    protected INTEGER,
+    updated_at TEXT,
+    image TEXT NOT NULL,
+    PRIMARY KEY (catalog, id)
+);
+CREATE INDEX IF NOT EXISTS images_by_name ON images (catalog, name);
+CREATE INDEX IF NOT EXISTS images_by_hash ON images (catalog, os_hash_value);
+"""
+_IMAGE_COLUMNS = ["id", "name", "checksum", "os_hash_algo", "os_hash_value", "size", "status", "protected",
+                  "updated_at"]
+
+
+def get_catalog_key(client: "Client") -> str:
+    """
+    Gets the key of the catalog of images that the given client can see: that of its image endpoint and project.
+
+    A client given a token (rather than credentials) does not know its project, so its key is that of its endpoint and
+    (a hash of) the token, which is scoped to a single project: such keys are never shared between projects, but
+    neither are they between tokens for the same project.
+    :param client: the glance client
+    :return: the key
+    """
+    http_client = client.http_client
+    if _has_project(client):
+        return "%s %s" % (http_client.get_endpoint(), http_client.get_project_id())
+    token = getattr(http_client, "auth_token", None) or ""
+    return "%s token %s" % (http_client.endpoint, hashlib.sha256(token.encode("utf-8")).hexdigest())
+
+
+def _has_project(client: "Client") -> bool:
+    from keystoneauth1 import adapter as ksa_adapter
+    return isinstance(client.http_client, ksa_adapter.Adapter)
+
+
+class ImageCatalog(object):
+    """
+    Local index (in SQLite) of the images in each environment, refreshed incrementally: after the first listing of an
+    environment, only the images updated since the last refresh are listed.
+
+    The index can be out of date: images deleted by others are only dropped from it when it is rebuilt (once it is
+    `max_age` old), so images found in it should be checked with glance before they are acted on where that matters.
+    Only environments with the v2 image API (which can filter images by when they were updated), used through clients
+    that know their project, are indexed.
+    """
+    def __init__(self, path: str, max_age: float=DEFAULT_MAX_AGE, rebuild: bool=False,
+                 refresh_interval: float=None):
+        """
+        Constructor.
+        :param path: the path of the SQLite database, which is created if it does not exist
+        :param max_age: the age in seconds at which the catalog of an environment is rebuilt rather than refreshed
+        :param rebuild: whether to rebuild the catalog of every environment on its first refresh
+        :param refresh_interval: seconds after which the catalog of an environment is refreshed again when used (`None`
+        to only refresh it when first used, as suits a single run of a command)
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_age = max_age
+        self.rebuild = rebuild
+        self.refresh_interval = refresh_interval
+        # the connection is shared by the threads of the process (and the database by processes)
+        self._connection = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._lock = Lock()
+        self._refresh_locks = {}    # type: Dict[str, Lock]
+        self._refreshed = {}        # type: Dict[str, float]
+        with self._lock:
+            self._connection.executescript(_SCHEMA)
+
+    def supports(self, client: "Client") -> bool:
+        """
+        Whether the catalog of the given client's environment can be indexed: that of clients given a token is not,
+        as it cannot be told which project it is of.
+        :param client: the glance client
+        :return: whether it can be indexed
+        """
+        return get_image_api_version(client) == 2 and _has_project(client)
+
+    def refresh(self, client: "Client", full: bool=False) -> str:
+        """
+        Brings the catalog of the given client's environment up to date, unless it has already been by this object
+        within the refresh interval (its own changes to the catalog keep it up to date in the meantime).
+        :param client: the glance client
+        :param full: whether to list every image, rather than only those updated since the last refresh
+        :return: the key of the catalog
+        """
+        key = get_catalog_key(client)
+        with self._lock:
+            refresh_lock = self._refresh_locks.setdefault(key, Lock())
+        with refresh_lock:
+            if key in self._refreshed and not full and (
+                    self.refresh_interval is None or time.monotonic() - self._refreshed[key] < self.refresh_interval):
+                return key
+            with self._lock:
+                row = self._connection.execute("SELECT last_updated_at, rebuilt_at FROM catalogs WHERE key = ?",
+                                               (key, )).fetchone()
+            full = full or row is None or (self.rebuild and key not in self._refreshed) \
+                or time.time() - row[1] > self.max_age
+            filters = {}
+            if not full and row[0] is not None:
+                # images updated at the same time as the last one seen are listed again, in case they were not all
+                # listed then
+                filters["updated_at"] = "gte:%s" % row[0]
+            images = [dict(image) for image in client.images.list(
+                filters=filters, sort_key="updated_at", sort_dir="asc", page_size=LIST_PAGE_SIZE)]
+            self._store(key, images, full, row[0] if row is not None and not full else None)
+            self._refreshed[key] = time.monotonic()
+        return key
+
+    def list_images(self, client: "Client", names: Iterable[str]=None) -> List[Dict[str, Any]]:
+        """
+        Lists the images in the catalog of the given client's environment, refreshing it first.
+        :param client: the glance client
+        :param names: only list the images with these names
+        :return: the images, as dictionaries of their properties
+        """
+        key = self.refresh(client)
+        query = "SELECT image FROM images WHERE catalog = ?"
+        parameters = [key]
+        if names is not None:
+            names = list(names)
+            if len(names) == 0:
+                return []
+            query += " AND name IN (%s)" % ", ".join("?" * len(names))
+            parameters.extend(names)
+        with self._lock:
+            rows = self._connection.execute(query + " ORDER BY updated_at, id", parameters).fetchall()
+        return [json.loads(image) for image, in rows]
+
+    def find_images_by_name(self, client: "Client", names: List[str]) -> list:
+        """
+        Finds the images with the given names, checking with glance that each image found in the catalog still exists
+        and has the name.
+        :param client: the glance client
+        :param names: the names of the images
+        :return: the images with any of the names, as got from glance
+        """
+        return self._get_current(client, self.list_images(client, names), lambda image: image["name"] in names)
+
+    def find_images_by_checksum(self, client: "Client", column: str, value: str) -> list:
+        """
+        Finds the images whose data has the given checksum, checking with glance that each image found in the catalog
+        still exists and has the checksum.
+        :param client: the glance client
+        :param column: the property holding the checksum ("checksum" or "os_hash_value")
+        :param value: the checksum
+        :return: the images with the checksum, as got from glance
+        """
+        if column not in ("checksum", "os_hash_value"):
+            raise ValueError("Images are not indexed by %s" % column)
+        key = self.refresh(client)
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT image FROM images WHERE catalog = ? AND %s = ? ORDER BY updated_at, id" % column,
+                (key, value)).fetchall()
+        return self._get_current(client, [json.loads(image) for image, in rows],
+                                 lambda image: image.get(column) == value)
+
+    def _get_current(self, client: "Client", indexed_images: List[Dict[str, Any]],
+                     still_matches: Callable[[Any], bool]) -> list:
+        from glanceclient import exc
+        # gets the images found in the catalog from glance, dropping (or updating) those that have changed since
+        images = []
+        for indexed in indexed_images:
+            try:
+                image = client.images.get(indexed["id"])
+            except exc.HTTPNotFound:
+                self.remove(client, [indexed["id"]])
+                continue
+            self.add(client, [image])
+            if still_matches(image):
+                images.append(image)
+        return images
+
+    def add(self, client: "Client", images: Iterable):
+        """
+        Adds (or updates) images in the catalog of the given client's environment, e.g. once they have been created.
+        :param client: the glance client
+        :param images: the images
+        """
+        self._store(get_catalog_key(client), [dict(image) for image in images])
+
+    def remove(self, client: "Client", image_ids: Iterable[str]):
+        """
+        Removes images from the catalog of the given client's environment, e.g. once they have been deleted.
+        :param client: the glance client
+        :param image_ids: the identifiers of the images
+        """
+        key = get_catalog_key(client)
+        with self._lock:
+            self._connection.executemany("DELETE FROM images WHERE catalog = ? AND id = ?",
+                                         [(key, image_id) for image_id in image_ids])
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _store(self, key: str, images: List[Dict[str, Any]], full: bool=None,
+               last_updated_at: Optional[str]=None):
+        # `full` is `None` when storing images other than those from a refresh
+        rows = [tuple(_get_column(image, column) for column in _IMAGE_COLUMNS)
+                + (json.dumps(image, default=str), key) for image in images]
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                if full:
+                    self._connection.execute("DELETE FROM images WHERE catalog = ?", (key, ))
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO images (%s, image, catalog) VALUES (%s)"
+                    % (", ".join(_IMAGE_COLUMNS), ", ".join("?" * (len(_IMAGE_COLUMNS) + 2))), rows)
+                if full is not None:
+                    now = time.time()
+                    last_updated_at = max([image["updated_at"] for image in images if image.get("updated_at")]
+                                          + ([last_updated_at] if last_updated_at is not None else []), default=None)
+                    if full:
+                        self._connection.execute(
+                            "INSERT OR REPLACE INTO catalogs (key, last_updated_at, rebuilt_at, refreshed_at) "
+                            "VALUES (?, ?, ?, ?)", (key, last_updated_at, now, now))
+                    else:
+                        self._connection.execute(
+                            "UPDATE catalogs SET last_updated_at = ?, refreshed_at = ? WHERE key = ?",
+                            (last_updated_at, now, key))
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+
+def _get_column(image: Dict[str, Any], column: str) -> Any:
+    value = image.get(column)
+    return int(value) if isinstance(value, bool) else value
+
@@ -0,0 +1,129 @@
+import hashlib
+from queue import Queue
+from threading import Thread
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from openstacktools._helpers import get_image_property, print_error
+
+DEFAULT_QUEUE_DEPTH = 64
+
+_END_OF_DATA = None
+
+
+class ChecksumCalculator(object):
+    """
+    Calculates the MD5 checksum (used for an image's `checksum` property) and, optionally, the digest in the image's
+    `os_hash_algo` of data as it streams past, doing the hashing on a separate thread so that it does not hold up the
+    stream.
+
+    The hashing thread runs until `hexdigests` or `close` is called, one of which must be called once done with the
+    calculator.
+    """
+    def __init__(self, hash_algorithm: Optional[str]=None, queue_depth: int=DEFAULT_QUEUE_DEPTH,
+                 log: Callable[[str], None]=print_error):
+        """
+        Constructor.
+        :param hash_algorithm: the algorithm of the digest to calculate as well as the MD5 checksum
+        :param queue_depth: the maximum number of chunks waiting to be hashed
+        :param log: output for warnings
+        """
+        self.hashers = {"md5": hashlib.md5()}
+        if hash_algorithm is not None and hash_algorithm not in self.hashers:
+            try:
+                self.hashers[hash_algorithm] = hashlib.new(hash_algorithm)
+            except ValueError:
+                log("WARNING: hash algorithm '%s' is not available, only the MD5 checksum will be verified"
+                    % hash_algorithm)
+        self._hexdigests = None
+        self._closed = False
+        self._queue = Queue(maxsize=queue_depth)
+        self._thread = Thread(target=self._hash, daemon=True)
+        self._thread.start()
+
+    def wrap(self, data: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Wraps the given data so that it is hashed as it is iterated over.
+        :param data: the data
+        :return: iterator over the same data
+        """
+        for chunk in data:
+            self._queue.put(chunk)
+            yield chunk
+
+    def hexdigests(self) -> Dict[str, str]:
+        """
+        Waits for all of the data seen so far to be hashed.
+        :return: the hex digests of the data, keyed by hash algorithm
+        """
+        if self._hexdigests is None:
+            if self._closed:
+                raise ValueError("Cannot get the digests of a closed checksum calculator")
+            self._stop()
+            self._hexdigests = {algorithm: hasher.hexdigest() for algorithm, hasher in self.hashers.items()}
+        return self._hexdigests
+
+    def close(self):
+        """
+        Stops the hashing thread, e.g. once the data has failed to be copied (does nothing if already stopped).
+        """
+        if self._hexdigests is None and not self._closed:
+            self._stop()
+        self._closed = True
+
+    def _stop(self):
+        self._queue.put(_END_OF_DATA)
+        self._thread.join()
+
+    def _hash(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is _END_OF_DATA:
+                return
+            for hasher in self.hashers.values():
+                hasher.update(chunk)
+
+
+def verify_checksums(source_image, dest_image, hexdigests: Dict[str, str]) -> List[str]:
+    """
+    Verifies the checksums of the copied data against those of the source image and those reported for the
+    destination image.
+    :param source_image: the source image
+    :param dest_image: the destination image, as reported after the upload
+    :param hexdigests: the hex digests of the copied data, keyed by hash algorithm
+    :return: descriptions of any mismatches
+    """
+    mismatches = []
+    for description, image in [("source", source_image), ("destination", dest_image)]:
+        expected = {"md5": get_image_property(image, "checksum")}
+        hash_algorithm = get_image_property(image, "os_hash_algo")
+        if hash_algorithm is not None:
+            expected[hash_algorithm] = get_image_property(image, "os_hash_value")
+        for algorithm, value in expected.items():
+            if value is not None and algorithm in hexdigests and value != hexdigests[algorithm]:
+                mismatches.append("%s checksum of copied data (%s) does not match that of %s image %s (%s)"
+                                  % (algorithm, hexdigests[algorithm], description, image["id"], value))
+    return mismatches
+
+
+def has_same_data(source_image, image) -> bool:
+    """
+    Whether the given image is active with the same data as the source image, going by their sizes and checksums.
+    :param source_image: the source image
+    :param image: the image
+    :return: whether the image has the same data
+    """
+    if get_image_property(image, "status") != "active" \
+            or get_image_property(image, "size") != get_image_property(source_image, "size"):
+        return False
+    compared = False
+    checksum = get_image_property(source_image, "checksum")
+    if checksum is not None and get_image_property(image, "checksum") is not None:
+        if get_image_property(image, "checksum") != checksum:
+            return False
+        compared = True
+    hash_algo = get_image_property(source_image, "os_hash_algo")
+    if hash_algo is not None and get_image_property(image, "os_hash_algo") == hash_algo:
+        if get_image_property(image, "os_hash_value") != get_image_property(source_image, "os_hash_value"):
+            return False
+        compared = True
+    return compared
@@ -1,16 +1,21 @@
 import argparse
 import getpass
 import sys
+import threading
 
 import glanceclient
 from glanceclient import exc
 from glanceclient._i18n import _
 from glanceclient.common import utils
-from keystoneauth1 import loading
+from keystoneauth1 import loading, session as ks_session_module
 from keystoneclient import discover, exceptions as ks_exc
 from keystoneclient.auth.identity import v3 as v3_auth, v2 as v2_auth
+import requests.adapters
 import six.moves.urllib.parse as urlparse
 
+from openstacktools._helpers import print_error
+from openstacktools._token_cache import CachedAuthentication, TokenCache, get_token_cache_key
+
 SUPPORTED_VERSIONS = [1, 2]
 
 
@@ -18,7 +23,7 @@ def create_authenticated_client(args, name="glance client"):
     if type(args) == argparse.Namespace:
         args = dict(vars(args).items())
 
-    for general_arg in ['insecure', 'timeout']:
+    for general_arg in ['insecure', 'timeout', 'token_cache_dir', 'connection_pool_size', 'tracer']:
         if general_arg not in args:
             args[general_arg] = None
 
@@ -57,6 +62,7 @@ def _get_versioned_client(api_version, args):
     description = "glance-v%s" % (api_version)
 
     ks_session = None
+    trace_hook = args.tracer.create_hook(args.name) if args.tracer else None
     if endpoint and auth_token:
         kwargs = {
             'token': auth_token,
@@ -70,19 +76,45 @@ def _get_versioned_client(api_version, args):
         description += " using auth_token"
     else:
         kwargs = _get_kwargs_for_create_session(args)
-        ks_session, ks_desc = _get_keystone_session(**kwargs)
+        endpoint_filter = {
+            'service_type': args.os_service_type or 'image',
+            'interface': args.os_endpoint_type or 'public',
+            'region_name': args.os_region_name
+        }
+        token_cache = None
+        cached = None
+        if args.token_cache_dir:
+            try:
+                token_cache = TokenCache(args.token_cache_dir, log=print_error)
+            except OSError as e:
+                print_error("WARNING: %s" % e)
+        if token_cache is not None:
+            cache_key = get_token_cache_key(kwargs, **endpoint_filter)
+            cached = token_cache.lookup(cache_key)
+        ks_session, ks_desc, auth_urls = _get_keystone_session(
+            cached=cached, connection_pool_size=args.connection_pool_size, trace_hook=trace_hook, **kwargs)
         kwargs = {'session': ks_session}
         description += ks_desc
 
-    if endpoint is None:
-        endpoint_type = args.os_endpoint_type or 'public'
-        service_type = args.os_service_type or 'image'
-        endpoint = ks_session.get_endpoint(
-            service_type=service_type,
-            interface=endpoint_type,
-            region_name=args.os_region_name)
-
-    return glanceclient.Client(api_version, endpoint, **kwargs), description
+        if cached is not None and cached.access_info is not None:
+            description += " using cached token"
+            endpoint = endpoint or cached.endpoint
+        if endpoint is None:
+            endpoint = ks_session.get_endpoint(**endpoint_filter)
+        if token_cache is not None and (cached is None or cached.access_info is None):
+            token_cache.store(cache_key, CachedAuthentication(
+                auth_urls[0], auth_urls[1], ks_session.auth.get_access(ks_session), endpoint))
+
+    client = glanceclient.Client(api_version, endpoint, **kwargs)
+    if ks_session is None:
+        # the client has its own (requests) session rather than one from keystone
+        if args.connection_pool_size:
+            _size_connection_pool(client.http_client.session, args.connection_pool_size)
+        if trace_hook is not None:
+            client.http_client.session.hooks['response'].append(trace_hook)
+    if trace_hook is not None:
+        trace_hook.image_endpoint = endpoint
+    return client, description
 
 
 def _get_image_url(args):
@@ -128,19 +160,38 @@ def _discover_auth_versions(session, auth_url):
     return (v2_auth_url, v3_auth_url)
 
 
-def _get_keystone_session(**kwargs):
+def _size_connection_pool(requests_session, pool_size):
+    # keep up to pool_size connections to each host open for reuse (never fewer than requests does by default), so that
+    # as many threads as that can share the session without connections being dropped (and later re-established)
+    # because the pool is full. The adapter also sets TCP keep-alive on the connections, as keystoneauth does for the
+    # sessions it creates
+    adapter = ks_session_module.TCPKeepAliveAdapter(pool_maxsize=max(pool_size, requests.adapters.DEFAULT_POOLSIZE))
+    for scheme in list(requests_session.adapters):
+        requests_session.mount(scheme, adapter)
+
+
+def _get_keystone_session(cached=None, connection_pool_size=None, trace_hook=None, **kwargs):
     def option_getter(opt):
         if opt.dest in kwargs:
             return kwargs[opt.dest]
         return
     ks_session = loading.session.Session().load_from_options_getter(option_getter)
+    if connection_pool_size:
+        _size_connection_pool(ks_session.session, connection_pool_size)
+    if trace_hook is not None:
+        # traces the calls to keystone as well as those to glance made through the session
+        ks_session.session.hooks['response'].append(trace_hook)
     ks_desc = ""
 
-    # discover the supported keystone versions using the given auth url
+    # discover the supported keystone versions using the given auth url,
+    # unless they were discovered by a previous run
     auth_url = kwargs.pop('auth_url', None)
-    (v2_auth_url, v3_auth_url) = _discover_auth_versions(
-        session=ks_session,
-        auth_url=auth_url)
+    if cached is not None:
+        (v2_auth_url, v3_auth_url) = (cached.v2_auth_url, cached.v3_auth_url)
+    else:
+        (v2_auth_url, v3_auth_url) = _discover_auth_versions(
+            session=ks_session,
+            auth_url=auth_url)
 
     # Determine which authentication plugin to use. First inspect the
     # auth_url to see the supported version. If both v3 and v2 are
@@ -199,8 +250,13 @@ def _get_keystone_session(**kwargs):
                          "may not able to handle Keystone V3 credentials. "
                          "Please provide a correct Keystone V3 auth_url.")
 
+    if auth is not None and cached is not None and cached.access_info is not None:
+        # the plugin only goes back to keystone once the cached token is
+        # about to expire
+        auth.auth_ref = cached.access_info
+
     ks_session.auth = auth
-    return ks_session, ks_desc
+    return ks_session, ks_desc, (v2_auth_url, v3_auth_url)
 
 
 def _get_kwargs_for_create_session(args):
@@ -243,3 +299,76 @@ def _get_kwargs_for_create_session(args):
         'key': args.os_key
     }
     return kwargs
+
+
+class ClientPool(object):
+    """
+    Authenticated glance clients that are kept for reuse, re-authenticating with Keystone before their tokens expire.
+    """
+    def __init__(self, authenticate, log=None):
+        """
+        Constructor.
+        :param authenticate: function that authenticates a client for the given key, returning the client and its
+        description (as `create_authenticated_client` does)
+        :param log: output for failures to authenticate or refresh
+        """
+        self._authenticate = authenticate
+        self._log = log if log is not None else print_error
+        self._clients = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Gets the client for the given key, authenticating it if there is none (or it was invalidated).
+        :param key: the key (e.g. the name of the environment)
+        :return: tuple of the client and its description
+        """
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        # clients for different keys are authenticated at the same time, but each is only authenticated once
+        with key_lock:
+            with self._lock:
+                if key in self._clients:
+                    return self._clients[key]
+            client_and_desc = self._authenticate(key)
+            with self._lock:
+                self._clients[key] = client_and_desc
+            return client_and_desc
+
+    def invalidate(self, key):
+        """
+        Drops the client for the given key (e.g. because its token was revoked), so that the next `get` authenticates
+        a new one.
+        :param key: the key
+        """
+        with self._lock:
+            self._clients.pop(key, None)
+
+    def keys(self):
+        with self._lock:
+            return list(self._clients)
+
+    def refresh(self, margin):
+        """
+        Re-authenticates the clients whose tokens expire within the given margin, so that requests made with them do
+        not have to wait for it. Clients that cannot be refreshed are dropped.
+        :param margin: the margin in seconds
+        """
+        for key in self.keys():
+            with self._lock:
+                client_and_desc = self._clients.get(key)
+            if client_and_desc is None:
+                continue
+            session = getattr(client_and_desc[0].http_client, "session", None)
+            auth = getattr(session, "auth", None)
+            if not isinstance(session, ks_session_module.Session) or auth is None:
+                # clients given a token (rather than credentials) cannot re-authenticate
+                continue
+            try:
+                if auth.get_access(session).will_expire_soon(stale_duration=margin):
+                    auth.invalidate()
+                    auth.get_access(session)
+            except Exception as e:
+                self._log("Unable to refresh the token of %s: %s" % (client_and_desc[1], e))
+                self.invalidate(key)
@@ -0,0 +1,131 @@
+from threading import Condition
+from typing import Callable, Optional
+
+DEFAULT_DECREASE_FACTOR = 0.5
+DEFAULT_LATENCY_TOLERANCE = 2.0
+_LATENCY_SMOOTHING = 0.2
+_MIN_LATENCY_SAMPLES = 10
+
+
+class AdaptiveConcurrencyLimit(object):
+    """
+    Limit on the number of requests made at once that adapts to how well the server copes with them (additive increase,
+    multiplicative decrease, as in TCP congestion control).
+
+    The limit starts low and doubles with every limit's worth of successful requests ("slow start") until the server
+    first shows signs of overload. From then on, it grows by one for every limit's worth of successful requests. It is
+    multiplied by the decrease factor whenever a request fails because the server is overloaded or the (smoothed)
+    latency of requests rises above the latency tolerance times the lowest seen, at most once for each limit's worth of
+    requests so a burst of errors only counts once.
+    """
+    def __init__(self, minimum: int, maximum: int, initial: int=None,
+                 decrease_factor: float=DEFAULT_DECREASE_FACTOR, latency_tolerance: float=DEFAULT_LATENCY_TOLERANCE,
+                 on_change: Callable[[int, int, str], None]=None):
+        """
+        Constructor.
+        :param minimum: the lowest the limit can go
+        :param maximum: the highest the limit can go
+        :param initial: the limit to start with (defaults to the minimum)
+        :param decrease_factor: what the limit is multiplied by when the server is overloaded
+        :param latency_tolerance: how many times the lowest smoothed latency the smoothed latency can rise to before the
+        server is considered overloaded (`None` to ignore latency)
+        :param on_change: called with the old limit, the new limit and the reason whenever the limit decreases, and
+        when it has increased to twice what it was last reported as (or to the maximum)
+        """
+        if minimum < 1 or maximum < minimum:
+            raise ValueError("Invalid concurrency bounds: %d to %d" % (minimum, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.on_change = on_change
+        self.active = 0
+        self.completed = 0
+        self.overloaded = 0
+        self.smoothed_latency = None    # type: Optional[float]
+        self.lowest_latency = None  # type: Optional[float]
+        self._limit = float(min(max(initial if initial is not None else minimum, minimum), maximum))
+        self._reported_limit = self.limit
+        self._slow_start = True
+        self._started = 0
+        self._last_decrease = 0
+        self._latency_samples = 0
+        self._condition = Condition()
+
+    @property
+    def limit(self) -> int:
+        """
+        The number of requests currently allowed at once.
+        """
+        return int(self._limit)
+
+    def acquire(self) -> int:
+        """
+        Waits until another request is allowed.
+        :return: ticket to give back on release
+        """
+        with self._condition:
+            while self.active >= self.limit:
+                self._condition.wait()
+            self.active += 1
+            self._started += 1
+            return self._started
+
+    def release(self, ticket: int, latency: float, overloaded: bool=False):
+        """
+        Records the outcome of a request, adjusting the limit accordingly.
+        :param ticket: the ticket given when the request was allowed
+        :param latency: how long the request took in seconds
+        :param overloaded: whether the request failed because the server is overloaded
+        """
+        with self._condition:
+            self.active -= 1
+            self.completed += 1
+            old_limit = self.limit
+            reason = None
+            if overloaded:
+                self.overloaded += 1
+                reason = self._decrease(ticket, "server overloaded")
+            else:
+                self._record_latency(latency)
+                if self._latency_too_high():
+                    reason = self._decrease(ticket, "latency %.3fs is over %.1f times the lowest %.3fs"
+                                            % (self.smoothed_latency, self.latency_tolerance, self.lowest_latency))
+                else:
+                    self._limit = min(self._limit + (1.0 if self._slow_start else 1.0 / self._limit), self.maximum)
+                    reason = "slow start" if self._slow_start else "additive increase"
+            if self.limit < old_limit:
+                self._report_change(old_limit, reason)
+            elif self.limit >= min(2 * self._reported_limit, self.maximum) and self.limit != self._reported_limit:
+                # increases come with most requests, so only the larger steps are reported
+                self._report_change(self._reported_limit, reason)
+            self._condition.notify_all()
+
+    def _report_change(self, old_limit: int, reason: str):
+        self._reported_limit = self.limit
+        if self.on_change is not None:
+            self.on_change(old_limit, self.limit, "%s; %d of %d requests overloaded"
+                           % (reason, self.overloaded, self.completed))
+
+    def _decrease(self, ticket: int, reason: str) -> str:
+        # requests started before the last decrease were made at the old limit
+        if ticket <= self._last_decrease:
+            return reason
+        self._slow_start = False
+        self._limit = max(self._limit * self.decrease_factor, self.minimum)
+        self._last_decrease = self._started
+        return reason
+
+    def _record_latency(self, latency: float):
+        if self.smoothed_latency is None:
+            self.smoothed_latency = latency
+        else:
+            self.smoothed_latency += _LATENCY_SMOOTHING * (latency - self.smoothed_latency)
+        self._latency_samples += 1
+        if self._latency_samples >= _MIN_LATENCY_SAMPLES and \
+                (self.lowest_latency is None or self.smoothed_latency < self.lowest_latency):
+            self.lowest_latency = self.smoothed_latency
+
+    def _latency_too_high(self) -> bool:
+        return self.latency_tolerance is not None and self.lowest_latency is not None \
+            and self.smoothed_latency > self.latency_tolerance * self.lowest_latency
@@ -0,0 +1,994 @@
+import functools
+import io
+import random
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from openstacktools._cache import DEFAULT_CACHE_SIZE, ImageCache, get_cache_key, read_mapped
+from openstacktools._catalog import DEFAULT_MAX_AGE, ImageCatalog, get_catalog_key
+from openstacktools._checksum import ChecksumCalculator, has_same_data, verify_checksums
+from openstacktools._errors import AmbiguousImageNameError, ChecksumMismatchError, DuplicateImageNameError, \
+    ImageNotFoundError, ImageOperationError, ImageTransferError
+from openstacktools._helpers import get_image_api_version, get_image_property, print_error
+from openstacktools._metrics import DEFAULT_PROGRESS_INTERVAL, Metrics, ProgressReporter
+from openstacktools._segments import DEFAULT_SEGMENT_SIZE, SegmentedDownload
+from openstacktools._spool import DEFAULT_CHECKPOINT_INTERVAL, Spool
+from openstacktools._transfer import DEFAULT_FAN_OUT_QUEUE_DEPTH, DEFAULT_READ_AHEAD_DEPTH, FanOut, ReadAhead
+
+if TYPE_CHECKING:
+    from glanceclient import Client
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_PROPERTIES = ["min_disk", "min_ram"]
+DEFAULT_UPLOAD_RETRIES = 2
+DUPLICATE_NAME_STRATEGIES = ["none", "allow", "replace", "rename"]
+DEDUP_POLICIES = ["none", "reuse", "rename", "tag"]
+NAME_LOOKUP_PAGE_SIZE = 20
+# options that can differ between the destinations of a fan-out copy (the others concern the shared download)
+DESTINATION_OPTIONS = ["properties", "duplicate_name_strategy", "dedup"]
+
+
+class CopyOptions(object):
+    """
+    Options for copying images, which are those of glancecp of the same names.
+    """
+    def __init__(self, properties: Iterable[str]=DEFAULT_PROPERTIES, duplicate_name_strategy: str="none",
+                 chunk_size: int=DEFAULT_CHUNK_SIZE, verify_checksum: bool=True,
+                 read_ahead: int=DEFAULT_READ_AHEAD_DEPTH, segments: int=1, segment_size: int=DEFAULT_SEGMENT_SIZE,
+                 fan_out_queue_depth: int=DEFAULT_FAN_OUT_QUEUE_DEPTH,
+                 progress_interval: float=DEFAULT_PROGRESS_INTERVAL, cache_dir: str=None,
+                 cache_size: int=DEFAULT_CACHE_SIZE, spool_dir: str=None,
+                 checkpoint_interval: int=DEFAULT_CHECKPOINT_INTERVAL, upload_retries: int=DEFAULT_UPLOAD_RETRIES,
+                 image_index: str=None, image_index_max_age: float=DEFAULT_MAX_AGE, rebuild_image_index: bool=False,
+                 dedup: str="none"):
+        """
+        Constructor.
+        :param properties: properties to copy from the source image to the destination image, as well as its disk
+        and container formats
+        :param duplicate_name_strategy: what to do about images that already have the destination name (one of
+        `DUPLICATE_NAME_STRATEGIES`)
+        :param chunk_size: size of the chunks in which image data is buffered for upload and read from the cache or
+        spool in bytes (the chunks glanceclient downloads and uploads in are set for the whole process, by
+        `set_transfer_chunk_size`)
+        :param verify_checksum: whether to verify the checksums of the copied data
+        :param read_ahead: maximum number of chunks to download ahead of the upload (0 for none)
+        :param segments: number of byte-range segments of the source image to download at once
+        :param segment_size: size of each segment in bytes
+        :param fan_out_queue_depth: maximum number of chunks buffered for each destination of a fan-out copy
+        :param progress_interval: seconds between reports of the progress of each transfer (0 for none)
+        :param cache_dir: directory in which to cache the data of source images (`None` for no cache)
+        :param cache_size: maximum size of the cache in bytes
+        :param spool_dir: directory in which to spool the data of source images, making copies resumable (`None` to
+        not spool)
+        :param checkpoint_interval: bytes to spool between checkpoints
+        :param upload_retries: number of times to retry uploading spooled data
+        :param image_index: path of the local index of the images in each environment, used to look up images by
+        name (`None` to always ask glance)
+        :param image_index_max_age: age in seconds at which the index of an environment is rebuilt
+        :param rebuild_image_index: whether to rebuild the index of each environment when first used
+        :param dedup: what to do instead of copying when the destination already has an active image with the same
+        data: nothing ("none", to always copy), use it as it is ("reuse"), rename it to the destination name
+        ("rename") or tag it with the destination name ("tag")
+        """
+        self.properties = list(properties)
+        self.duplicate_name_strategy = duplicate_name_strategy
+        self.chunk_size = chunk_size
+        self.verify_checksum = verify_checksum
+        self.read_ahead = read_ahead
+        self.segments = segments
+        self.segment_size = segment_size
+        self.fan_out_queue_depth = fan_out_queue_depth
+        self.progress_interval = progress_interval
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.spool_dir = spool_dir
+        self.checkpoint_interval = checkpoint_interval
+        self.upload_retries = upload_retries
+        self.image_index = image_index
+        self.image_index_max_age = image_index_max_age
+        self.rebuild_image_index = rebuild_image_index
+        self.dedup = dedup
+
+    @staticmethod
+    def from_namespace(args) -> "CopyOptions":
+        """
+        Gets the options from parsed glancecp arguments.
+        :param args: the arguments
+        :return: the options
+        """
+        return CopyOptions(
+            properties=[key.strip() for key in args.properties.split(",")],
+            duplicate_name_strategy=args.duplicate_name_strategy, chunk_size=args.chunk_size,
+            verify_checksum=args.verify_checksum, read_ahead=args.read_ahead, segments=args.segments,
+            segment_size=args.segment_size, fan_out_queue_depth=args.fan_out_queue_depth,
+            progress_interval=args.progress_interval, cache_dir=args.cache_dir, cache_size=args.cache_size,
+            spool_dir=args.spool_dir, checkpoint_interval=args.checkpoint_interval, upload_retries=args.upload_retries,
+            image_index=args.image_index, image_index_max_age=args.image_index_max_age,
+            rebuild_image_index=args.rebuild_image_index, dedup=args.dedup)
+
+    def replace(self, **overrides: Any) -> "CopyOptions":
+        """
+        Gets a copy of these options with some of them changed.
+        :param overrides: the options to change, by name
+        :return: the changed copy
+        :raises TypeError: if any of the names is not that of an option
+        """
+        unknown = sorted(set(overrides) - set(vars(self)))
+        if len(unknown) > 0:
+            raise TypeError("Unknown copy options: %s" % ", ".join(unknown))
+        return CopyOptions(**dict(vars(self), **overrides))
+
+    def check(self):
+        """
+        Checks that the options are valid.
+        :raises ValueError: if any option is invalid
+        """
+        if self.duplicate_name_strategy not in DUPLICATE_NAME_STRATEGIES:
+            raise ValueError("Duplicate name strategy must be one of %s, not %s"
+                             % (", ".join(DUPLICATE_NAME_STRATEGIES), self.duplicate_name_strategy))
+        if self.dedup not in DEDUP_POLICIES:
+            raise ValueError("Dedup policy must be one of %s, not %s" % (", ".join(DEDUP_POLICIES), self.dedup))
+        if self.chunk_size <= 0:
+            raise ValueError("Chunk size must be a positive number of bytes, not %d" % self.chunk_size)
+        if self.upload_retries < 0:
+            raise ValueError("Number of upload retries cannot be negative, not %d" % self.upload_retries)
+        if self.fan_out_queue_depth < 1:
+            raise ValueError("Fan-out queue depth must be at least 1, not %d" % self.fan_out_queue_depth)
+        if self.read_ahead < 0:
+            raise ValueError("Read-ahead cannot be negative, not %d" % self.read_ahead)
+        if self.segments < 1:
+            raise ValueError("Number of segments must be at least 1, not %d" % self.segments)
+        if self.segment_size < 1:
+            raise ValueError("Segment size must be at least 1 byte, not %d" % self.segment_size)
+        if self.image_index_max_age < 0:
+            raise ValueError("Maximum age of the image index cannot be negative, not %s" % self.image_index_max_age)
+
+
+class CopyResult(object):
+    """
+    The outcome of copying an image to a destination.
+    """
+    def __init__(self, source_image_id: str, source_image_name: str, dest_image_id: str, dest_image_name: str,
+                 replaced_image_ids: List[str]=(), bytes_transferred: int=0,
+                 verified_checksums: Dict[str, str]=None, deduplicated: bool=False):
+        """
+        Constructor.
+        :param source_image_id: the identifier of the source image
+        :param source_image_name: the name of the source image
+        :param dest_image_id: the identifier of the destination image
+        :param dest_image_name: the name of the destination image
+        :param replaced_image_ids: the identifiers of the images with the destination name that were deleted
+        :param bytes_transferred: the number of bytes of data uploaded to the destination image by this copy
+        :param verified_checksums: the checksums of the copied data that were verified, by hash algorithm
+        :param deduplicated: whether the destination image already had the data, so none was copied
+        """
+        self.source_image_id = source_image_id
+        self.source_image_name = source_image_name
+        self.dest_image_id = dest_image_id
+        self.dest_image_name = dest_image_name
+        self.replaced_image_ids = list(replaced_image_ids)
+        self.bytes_transferred = bytes_transferred
+        self.verified_checksums = dict(verified_checksums or {})
+        self.deduplicated = deduplicated
+
+    def __repr__(self) -> str:
+        return "<%s %s -> %s>" % (type(self).__name__, self.source_image_id, self.dest_image_id)
+
+
+def describe_client(client: "Client") -> str:
+    """
+    Describes a glance client by its API version and endpoint.
+    :param client: the client
+    :return: the description
+    """
+    http_client = client.http_client
+    endpoint = getattr(http_client, "endpoint_override", None) or getattr(http_client, "endpoint", None)
+    return "glance-v%s %s" % (get_image_api_version(client), endpoint)
+
+
+@contextmanager
+def _raising_operation_errors(action: str):
+    from glanceclient import exc
+    # raises the errors of requests to glance as `ImageOperationError`s
+    try:
+        yield
+    except exc.CommunicationError as ce:
+        raise ImageOperationError("Communication error while attempting to %s: %s" % (action, ce), cause=ce)
+    except exc.HTTPException as he:
+        raise ImageOperationError("HTTP error while attempting to %s: %s" % (action, he), cause=he)
+
+
+def find_images_by_name(client: "Client", names: List[str]) -> list:
+    """
+    Finds the images with the given names.
+    :param client: the glance client
+    :param names: the names of the images
+    :return: the images with any of the names
+    :raises ImageOperationError: if glance cannot be asked for the images
+    """
+    with _raising_operation_errors("find images named %s" % ", ".join(names)):
+        return _find_images_by_name(client, names)
+
+
+def _find_images_by_name(client: "Client", names: List[str]) -> list:
+    from glanceclient import exc
+    # have glance filter by name rather than listing every image, falling back to listing every image if the
+    # filter is rejected (only the v2 API supports the "in:" operator needed to look up several names at once)
+    if len(names) == 1:
+        name_filter = names[0]
+    elif get_image_api_version(client) == 2:
+        name_filter = "in:%s" % ",".join('"%s"' % name.replace('"', '\\"') for name in names)
+    else:
+        return [image for name in names for image in _find_images_by_name(client, [name])]
+    try:
+        images = list(client.images.list(filters={"name": name_filter}, page_size=NAME_LOOKUP_PAGE_SIZE))
+    except exc.HTTPBadRequest:
+        images = client.images.list()
+    return [image for image in images if image.name in names]
+
+
+class ImageCopier(object):
+    """
+    Copies images between glance environments through clients that have already been authenticated. A copier can be
+    used for several copies at once, from different threads.
+    """
+    def __init__(self, options: CopyOptions=None, metrics: Metrics=None,
+                 log: Callable[[str], None]=print_error, image_cache: ImageCache=None,
+                 catalog: ImageCatalog=None):
+        """
+        Constructor.
+        :param options: the options to copy with (the defaults if not given)
+        :param metrics: record of the timings of the copies
+        :param log: output for what the copier is doing
+        :param image_cache: the cache of source image data (created from the options if not given), which copiers
+        using the same cache directory must share
+        :param catalog: the index of the images in each environment (opened from the options if not given)
+        """
+        self.options = options if options is not None else CopyOptions()
+        self.options.check()
+        self.metrics = metrics if metrics is not None else Metrics("copy")
+        self.log = log
+        if image_cache is None and self.options.cache_dir:
+            image_cache = ImageCache(self.options.cache_dir, self.options.cache_size, log=self.log)
+        self.image_cache = image_cache
+        if catalog is None and self.options.image_index:
+            catalog = ImageCatalog(self.options.image_index, self.options.image_index_max_age,
+                                   self.options.rebuild_image_index)
+        self.catalog = catalog
+
+    def for_destination(self, option_overrides: Dict[str, Any]=None) -> "ImageCopier":
+        """
+        Gets a copier for one destination of a fan-out copy, with some of this copier's options changed.
+        :param option_overrides: the options to change, by name (only `DESTINATION_OPTIONS` can be)
+        :return: the copier, which shares this copier's metrics, output, cache and index (this copier itself if no
+        options are changed)
+        :raises ValueError: if any of the options cannot be changed for a destination, or is invalid
+        """
+        if not option_overrides:
+            return self
+        not_allowed = sorted(set(option_overrides) - set(DESTINATION_OPTIONS))
+        if len(not_allowed) > 0:
+            raise ValueError("Copy options that cannot be set per destination: %s (allowed: %s)"
+                             % (", ".join(not_allowed), ", ".join(DESTINATION_OPTIONS)))
+        return ImageCopier(self.options.replace(**option_overrides), metrics=self.metrics, log=self.log,
+                           image_cache=self.image_cache, catalog=self.catalog)
+
+    def copy_image(self, source_client: "Client", source_id_or_name: str, dest_client: "Client", dest_name: str="",
+                   source_description: str=None, dest_description: str=None) -> CopyResult:
+        """
+        Copies an image.
+        :param source_client: client of the glance that has the image
+        :param source_id_or_name: the identifier or (unique) name of the image
+        :param dest_client: client of the glance to copy the image to
+        :param dest_name: the name of the copy ("" for that of the source image)
+        :param source_description: description of the source environment
+        :param dest_description: description of the destination environment
+        :return: the result of the copy
+        :raises OpenStackToolsError: if the copy fails
+        """
+        source_description = source_description or describe_client(source_client)
+        dest_description = dest_description or describe_client(dest_client)
+
+        with self.metrics.phase("lookup", source=source_id_or_name):
+            source_image = self.find_source_image(source_client, source_id_or_name)
+        dest_image_properties = self.get_dest_image_properties(source_image, dest_name)
+
+        # inform user we are copying
+        self.log("copying source image %s ('%s') from %s to destination image '%s' on %s" % (
+            source_image.id, source_image.name, source_description, dest_image_properties['name'], dest_description))
+
+        if self.options.dedup != "none":
+            with self.metrics.phase("dedup", dest=dest_image_properties['name']):
+                identical_image = self.find_identical_image(dest_client, source_image, dest_image_properties['name'])
+                if identical_image is not None:
+                    return self.deduplicate(dest_client, source_image, identical_image, dest_image_properties['name'])
+
+        # when spooling, pick up the destination image created by a previous (failed) attempt at this copy
+        spool = None
+        # descriptions need not be unique, so the copies in the spool are told apart by the endpoint and project they
+        # are in
+        dest_key = "%s %s" % (get_catalog_key(dest_client), dest_image_properties['name'])
+        dest_image = None
+        delete_images = []
+        if self.options.spool_dir:
+            spool = Spool(self.options.spool_dir, source_image, log=self.log)
+            dest_image, delete_images = self.find_resumable_dest_image(dest_client, spool, dest_key)
+
+        if dest_image is None:
+            with self.metrics.phase("duplicates", dest=dest_image_properties['name']):
+                delete_images = self.handle_duplicate_names(dest_client, dest_image_properties['name'])
+            with self.metrics.phase("create", dest=dest_image_properties['name']):
+                dest_image = self.create_dest_image(dest_client, dest_image_properties)
+            if spool is not None:
+                spool.set_destination(dest_key, dest_image.id, delete_images)
+
+        # copy data from source to destination (or from the cache, if it has the source image's data)
+        cache_key = get_cache_key(source_image) if self.image_cache is not None else None
+        cached_path = self.image_cache.lookup(cache_key) if cache_key is not None else None
+        transferred, checksums = 0, {}
+        if dest_image.status == "active":
+            self.log("destination image %s has already been uploaded" % (dest_image.id))
+        elif spool is None or cached_path is not None:
+            with self.metrics.phase("transfer", source=source_image.id, dest=dest_image.id):
+                transferred, checksums = self.transfer_image(source_client, source_image, dest_client, dest_image,
+                                                             cache_key=cache_key, cached_path=cached_path)
+        else:
+            with self.metrics.phase("transfer", source=source_image.id, dest=dest_image.id):
+                transferred, checksums = self.transfer_image_via_spool(
+                    source_client, source_image, dest_client, dest_image, dest_image_properties, spool, dest_key,
+                    cache_key=cache_key)
+
+        # successfully created image, now delete any images scheduled for deletion (because of duplicate_name_strategy=replace)
+        with self.metrics.phase("delete", dest=dest_image.id):
+            self.delete_duplicate_images(dest_client, delete_images)
+
+        if spool is not None:
+            spool.finish_destination(dest_key)
+
+        return CopyResult(source_image.id, source_image.name, dest_image.id, dest_image_properties['name'],
+                          delete_images, transferred, checksums)
+
+    def fan_out_copy(self, source_client: "Client", source_id_or_name: str,
+                     destinations: List[Union[Tuple["Client", str], Tuple["Client", str, Dict[str, Any]]]],
+                     source_description: str=None,
+                     dest_descriptions: List[str]=None) -> List[Union[CopyResult, Exception]]:
+        """
+        Copies an image to several destinations, downloading it once and uploading it to all of them at once. Each
+        destination is copied to with this copier's options, except for those of `DESTINATION_OPTIONS` (e.g. the
+        duplicate name strategy and properties) given for it.
+        :param source_client: client of the glance that has the image
+        :param source_id_or_name: the identifier or (unique) name of the image
+        :param destinations: the clients of the glances to copy the image to, each with the name of the copy ("" for
+        that of the source image) and optionally the options to change for it, by name
+        :param source_description: description of the source environment
+        :param dest_descriptions: descriptions of the destination environments
+        :return: the result of the copy to each destination or the error it failed with, in the same order
+        :raises ValueError: if options that cannot be set per destination (or invalid options) are given for one
+        """
+        dest_copiers = [self.for_destination(destination[2] if len(destination) > 2 else None)
+                        for destination in destinations]
+        destinations = [(destination[0], destination[1]) for destination in destinations]
+        source_description = source_description or describe_client(source_client)
+        dest_descriptions = dest_descriptions or [describe_client(dest_client) for dest_client, _ in destinations]
+        results = [None] * len(destinations)    # type: List[Union[CopyResult, Exception]]
+
+        if self.options.spool_dir:
+            # the spool is shared by all destinations of a source image, so it is only downloaded once anyway
+            for index, ((dest_client, dest_name), dest_description, dest_copier) in enumerate(zip(
+                    destinations, dest_descriptions, dest_copiers)):
+                try:
+                    results[index] = dest_copier.copy_image(source_client, source_id_or_name, dest_client, dest_name,
+                                                            source_description, dest_description)
+                except Exception as e:
+                    results[index] = e
+            return results
+
+        try:
+            with self.metrics.phase("lookup", source=source_id_or_name):
+                source_image = self.find_source_image(source_client, source_id_or_name)
+        except Exception as e:
+            return [e] * len(destinations)
+
+        # handle duplicate names and create the image at each destination independently
+        uploads = []
+        for index, ((dest_client, dest_name), dest_description, dest_copier) in enumerate(zip(
+                destinations, dest_descriptions, dest_copiers)):
+            try:
+                dest_image_properties = dest_copier.get_dest_image_properties(source_image, dest_name)
+                self.log("copying source image %s ('%s') from %s to destination image '%s' on %s" % (
+                    source_image.id, source_image.name, source_description, dest_image_properties['name'],
+                    dest_description))
+                if dest_copier.options.dedup != "none":
+                    with self.metrics.phase("dedup", dest=dest_image_properties['name']):
+                        identical_image = dest_copier.find_identical_image(dest_client, source_image,
+                                                                           dest_image_properties['name'])
+                        if identical_image is not None:
+                            results[index] = dest_copier.deduplicate(dest_client, source_image, identical_image,
+                                                                     dest_image_properties['name'])
+                            continue
+                with self.metrics.phase("duplicates", dest=dest_image_properties['name']):
+                    delete_images = dest_copier.handle_duplicate_names(dest_client, dest_image_properties['name'])
+                with self.metrics.phase("create", dest=dest_image_properties['name']):
+                    dest_image = dest_copier.create_dest_image(dest_client, dest_image_properties)
+                uploads.append((index, dest_client, dest_image, delete_images))
+            except Exception as e:
+                results[index] = e
+        if len(uploads) == 0:
+            return results
+
+        cache_key = get_cache_key(source_image) if self.image_cache is not None else None
+        cached_path = self.image_cache.lookup(cache_key) if cache_key is not None else None
+        cache_writer = None
+        checksum_calculator = None
+        download_failure = None     # type: Optional[ImageTransferError]
+        fan_out = FanOut(len(uploads), self.options.fan_out_queue_depth)
+
+        def upload(fan_out_index, dest_client, dest_image):
+            try:
+                dest_client.images.upload(
+                    dest_image.id, data_to_upload_stream(fan_out.consume(fan_out_index),
+                                                         buffer_size=self.options.chunk_size))
+            except Exception:
+                fan_out.abandon(fan_out_index)
+                raise
+
+        progress = self.create_progress_reporter(
+            source_image, "destination images %s" % ", ".join(dest_image.id for _, _, dest_image, _ in uploads))
+        transfer_phase = self.metrics.phase("transfer", source=source_image.id,
+                                            dest=[dest_image.id for _, _, dest_image, _ in uploads])
+        try:
+            with transfer_phase, ThreadPoolExecutor(max_workers=len(uploads)) as executor:
+                futures = [executor.submit(upload, fan_out_index, dest_client, dest_image)
+                           for fan_out_index, (_, dest_client, dest_image, _) in enumerate(uploads)]
+                self.log("copying data from source image %s to destination images %s" % (
+                    source_image.id, ", ".join(dest_image.id for _, _, dest_image, _ in uploads)))
+                try:
+                    if cached_path is not None:
+                        data = read_mapped(cached_path, self.options.chunk_size)
+                    else:
+                        data = self.get_source_data(source_client, source_image) or []
+                        if cache_key is not None and self.options.verify_checksum:
+                            # only verified data is added to the cache
+                            cache_writer = self.image_cache.writer(cache_key, get_image_property(source_image, "size"))
+                            if cache_writer is not None:
+                                data = cache_writer.wrap(data)
+                    if self.options.verify_checksum:
+                        checksum_calculator = ChecksumCalculator(get_image_property(source_image, "os_hash_algo"),
+                                                                 log=self.log)
+                        data = checksum_calculator.wrap(data)
+                    fan_out.feed(progress.wrap(data))
+                except Exception as e:
+                    download_failure = ImageTransferError(
+                        "Failed to download source image (exception type %s): %s" % (type(e), e), source_image.id, e)
+                    fan_out.fail(e)
+                wait(futures)
+            for fan_out_index, (_, _, dest_image, _) in enumerate(uploads):
+                self.log("upload to destination image %s spent %.1fs waiting for the source" % (
+                    dest_image.id, fan_out.consumer_wait_seconds[fan_out_index]))
+            # the download is held back by whichever destination is slowest at the time
+            self.log("download spent %.1fs waiting for the destinations" % fan_out.producer_wait_seconds)
+            self.metrics.add_transfer(source=source_image.id, dest=[dest_image.id for _, _, dest_image, _ in uploads],
+                                      succeeded=download_failure is None, **progress.to_dict(),
+                                      waiting_for_source_seconds=fan_out.consumer_wait_seconds,
+                                      waiting_for_dest_seconds=fan_out.producer_wait_seconds)
+
+            # verify, then roll back or clean up, each destination independently
+            any_verified = False
+            for (index, dest_client, dest_image, delete_images), future in zip(uploads, futures):
+                failure = download_failure
+                if failure is None and future.exception() is not None:
+                    failure = ImageTransferError("Failed to transfer image (exception type %s): %s" % (
+                        type(future.exception()), future.exception()), dest_image.id, future.exception())
+                if failure is None and checksum_calculator is not None:
+                    failure = self.verify_transfer(source_image, dest_client, dest_image, checksum_calculator)
+                    any_verified = any_verified or failure is None
+                try:
+                    with self.metrics.phase("delete", dest=dest_image.id):
+                        if failure is not None:
+                            self.delete_failed_dest_image(dest_client, dest_image, failure)
+                            raise failure
+                        self.delete_duplicate_images(dest_client, delete_images)
+                    results[index] = CopyResult(
+                        source_image.id, source_image.name, dest_image.id, dest_image.name, delete_images,
+                        progress.transferred,
+                        checksum_calculator.hexdigests() if checksum_calculator is not None else {})
+                except Exception as e:
+                    results[index] = e
+
+            if cache_writer is not None:
+                if download_failure is None and any_verified:
+                    cache_writer.commit()
+                else:
+                    cache_writer.abort()
+            return results
+        finally:
+            if checksum_calculator is not None:
+                checksum_calculator.close()
+
+    def find_images_by_name(self, client: "Client", names: List[str]) -> list:
+        """
+        Finds the images with the given names, using the image index if there is one.
+        :param client: the glance client
+        :param names: the names of the images
+        :return: the images with any of the names
+        :raises ImageOperationError: if glance cannot be asked for the images
+        """
+        with _raising_operation_errors("find images named %s" % ", ".join(names)):
+            if self.catalog is not None and self.catalog.supports(client):
+                return self.catalog.find_images_by_name(client, names)
+            return _find_images_by_name(client, names)
+
+    def find_source_image(self, source_client: "Client", source_id_or_name: str):
+        from glanceclient import exc
+        source_image = None
+        try:
+            source_image = source_client.images.get(source_id_or_name)
+        except exc.HTTPNotFound:
+            found = False
+            for image in self.find_images_by_name(source_client, [source_id_or_name]):
+                if found:
+                    raise AmbiguousImageNameError("Multiple source images were found named %s, cannot continue."
+                                                  % source_id_or_name, source_id_or_name)
+                else:
+                    source_image = image
+                    found = True
+        except exc.CommunicationError as ce:
+            raise ImageOperationError("Communication error while attempting to get source image: %s" % (ce),
+                                      cause=ce)
+        except exc.HTTPInternalServerError as hise:
+            raise ImageOperationError("Internal server error while attempting to get source image: %s" % (hise),
+                                      cause=hise)
+        except exc.HTTPException as he:
+            raise ImageOperationError("HTTP error while attempting to get source image: %s" % (he), cause=he)
+
+        if not source_image:
+            raise ImageNotFoundError("Source image not found: %s" % source_id_or_name, source_id_or_name)
+        return source_image
+
+    def get_dest_image_properties(self, source_image, dest_name: str) -> Dict[str, Any]:
+        dest_image_properties = {}
+
+        # copy essential properties (cannot upload without these)
+        for key in ['disk_format', 'container_format']:
+            dest_image_properties[key] = source_image[key]
+
+        # copy extra properties according to user list
+        for key in self.options.properties:
+            dest_image_properties[key] = source_image[key]
+
+        # set or copy name
+        if dest_name != "":
+            dest_image_properties['name'] = dest_name
+        else:
+            dest_image_properties['name'] = source_image['name']
+        return dest_image_properties
+
+    def handle_duplicate_names(self, dest_client: "Client", name: str, exclude_image_id: str=None) -> List[str]:
+        # check for duplicates and plan strategy to deal with them
+        delete_images = []
+        rename_images = []
+        if self.options.duplicate_name_strategy != "allow":
+            # check for existing images by that name at destination
+            for image in self.find_images_by_name(dest_client, [name]):
+                if image.id == exclude_image_id:
+                    continue
+                if self.options.duplicate_name_strategy == "replace":
+                    rename_images.append(image.id)
+                    delete_images.append(image.id)
+                elif self.options.duplicate_name_strategy == "rename":
+                    rename_images.append(image.id)
+                elif self.options.duplicate_name_strategy == "none":
+                    raise DuplicateImageNameError("An image named '%s' is already present at "
+                                                  "destination. Please change to a unique name, "
+                                                  "use the '--duplicate-name-strategy=allow' "
+                                                  "option to allow creation of images with "
+                                                  "duplicate names, use the "
+                                                  "'--duplicate-name-strategy=replace' option "
+                                                  "to remove any other images with the "
+                                                  "destination name, or use the "
+                                                  "'--duplicate-name-strategy=rename' option "
+                                                  "to rename any existing images to make them "
+                                                  "unique." % name, name)
+
+        # pick new names with random suffixes, checking all candidates for collisions with a single lookup
+        new_names = []
+        while len(new_names) < len(rename_images):
+            candidates = ["%s.%s" % (name, self.random_suffix()) for _ in range(len(rename_images) - len(new_names))]
+            taken = set(image.name for image in self.find_images_by_name(dest_client, candidates))
+            new_names.extend(candidate for candidate in candidates if candidate not in taken)
+
+        for image_id, new_name in zip(rename_images, new_names):
+            self.log("renaming existing image %s to '%s'" % (image_id, new_name))
+            self.rename_existing_image(dest_client, image_id, new_name)
+        return delete_images
+
+    def rename_existing_image(self, dest_client: "Client", image_id: str, new_name: str):
+        renamed = self.update_existing_image(
+            "rename", image_id, lambda: dest_client.images.update(image_id, name=new_name))
+        if self.catalog is not None and self.catalog.supports(dest_client):
+            self.catalog.add(dest_client, [renamed])
+
+    def update_existing_image(self, action: str, image_id: str, update: Callable[[], Any]) -> Any:
+        from glanceclient import exc
+        try:
+            return update()
+        except exc.CommunicationError as ce:
+            raise ImageOperationError("Communication error while attempting to %s existing image: %s"
+                                      % (action, ce), image_id, ce)
+        except exc.HTTPInternalServerError as hise:
+            raise ImageOperationError("Internal server error while attempting to %s existing image: %s"
+                                      % (action, hise), image_id, hise)
+        except exc.HTTPException as he:
+            raise ImageOperationError("HTTP error while attempting to %s: %s" % (action, he), image_id, he)
+        except Exception as e:
+            raise ImageOperationError("Failed to %s existing image (exception type %s): %s" % (action, type(e), e),
+                                      image_id, e)
+
+    def find_identical_image(self, dest_client: "Client", source_image, dest_name: str):
+        """
+        Finds an active image at the destination with the same data as the given source image, looking it up by the
+        source image's checksums (with the image index if there is one) rather than listing every image.
+        :param dest_client: client of the glance to look in
+        :param source_image: the source image
+        :param dest_name: the name of the copy, images with which are preferred
+        :return: the image, or `None` if there is none (or the destination's image API cannot filter by checksum)
+        """
+        from glanceclient import exc
+        if get_image_api_version(dest_client) != 2:
+            return None
+        # images uploaded before glance calculated os_hash_value (Rocky) can only be found by their MD5 checksum
+        for key in ["os_hash_value", "checksum"]:
+            value = get_image_property(source_image, key)
+            if value is None:
+                continue
+            try:
+                images = self.find_images_by_checksum(dest_client, key, value)
+            except exc.HTTPBadRequest:
+                # glance too old to filter by this property
+                continue
+            except (exc.CommunicationError, exc.HTTPException) as e:
+                raise ImageOperationError("Failed to find images with %s %s at destination: %s" % (key, value, e),
+                                          cause=e)
+            identical_images = [image for image in images if has_same_data(source_image, image)]
+            if len(identical_images) > 0:
+                return min(identical_images, key=lambda image: (image.name != dest_name,
+                                                                get_image_property(image, "created_at", "")))
+        return None
+
+    def find_images_by_checksum(self, client: "Client", key: str, value: str) -> list:
+        """
+        Finds the active images whose data has the given checksum, using the image index if there is one.
+        :param client: the glance client
+        :param key: the property holding the checksum ("checksum" or "os_hash_value")
+        :param value: the checksum
+        :return: the images with the checksum
+        """
+        if self.catalog is not None and self.catalog.supports(client):
+            return self.catalog.find_images_by_checksum(client, key, value)
+        return list(client.images.list(filters={key: value, "status": "active"}, page_size=NAME_LOOKUP_PAGE_SIZE))
+
+    def deduplicate(self, dest_client: "Client", source_image, identical_image, dest_name: str) -> CopyResult:
+        """
+        Uses an image at the destination that already has the data of the source image as the copy, according to
+        the dedup policy.
+        :param dest_client: client of the glance that has the image
+        :param source_image: the source image
+        :param identical_image: the image at the destination with the same data
+        :param dest_name: the name of the copy
+        :return: the result of the copy
+        """
+        name = identical_image.name
+        self.log("destination image %s ('%s') already has the data of source image %s, so it is not copied"
+                 % (identical_image.id, name, source_image.id))
+        delete_images = []
+        if self.options.dedup == "rename" and name != dest_name:
+            delete_images = self.handle_duplicate_names(dest_client, dest_name, exclude_image_id=identical_image.id)
+            self.log("renaming existing image %s to '%s'" % (identical_image.id, dest_name))
+            self.rename_existing_image(dest_client, identical_image.id, dest_name)
+            name = dest_name
+            self.delete_duplicate_images(dest_client, delete_images)
+        elif self.options.dedup == "tag" and name != dest_name \
+                and dest_name not in get_image_property(identical_image, "tags", []):
+            self.log("tagging existing image %s with '%s'" % (identical_image.id, dest_name))
+            self.update_existing_image(
+                "tag", identical_image.id, lambda: dest_client.image_tags.update(identical_image.id, dest_name))
+        return CopyResult(source_image.id, source_image.name, identical_image.id, name, delete_images,
+                          deduplicated=True)
+
+    def random_suffix(self) -> str:
+        return '%08x' % random.randrange(16**8)
+
+    def create_dest_image(self, dest_client: "Client", dest_image_properties: Dict[str, Any]):
+        from glanceclient import exc
+        self.log("creating image at destination: %s" % (dest_image_properties['name']))
+        try:
+            dest_image = dest_client.images.create(**dest_image_properties)
+        except exc.CommunicationError as ce:
+            raise ImageOperationError("Communication error while attempting to create image: %s" % (ce), cause=ce)
+        except exc.HTTPInternalServerError as hise:
+            raise ImageOperationError("Internal server error while attempting to create image: %s" % (hise),
+                                      cause=hise)
+        except Exception as e:
+            raise ImageOperationError("Failed to create destination image (exception type %s): %s" % (type(e), e),
+                                      cause=e)
+        if self.catalog is not None and self.catalog.supports(dest_client):
+            self.catalog.add(dest_client, [dest_image])
+        return dest_image
+
+    def create_progress_reporter(self, source_image, to: str) -> ProgressReporter:
+        return ProgressReporter("copying %s to %s" % (source_image.id, to),
+                                total_size=get_image_property(source_image, "size"),
+                                interval=self.options.progress_interval, outputter=self.log)
+
+    def get_source_data(self, source_client: "Client", source_image) -> Optional[Iterable[bytes]]:
+        size = get_image_property(source_image, "size")
+        if self.options.segments > 1 and size:
+            segmented_download = SegmentedDownload(source_client, source_image.id, size, self.options.segments,
+                                                   self.options.segment_size)
+            if segmented_download.start():
+                self.log("downloading source image %s in %d segments, %d at a time" % (
+                    source_image.id, len(segmented_download.ranges), self.options.segments))
+                return segmented_download
+            self.log("WARNING: cannot download source image %s in segments as the source does not support range "
+                     "requests, downloading it in a single stream" % source_image.id)
+        # glanceclient's own checksumming is done inline with the download, so it is replaced by ours if verifying
+        return source_client.images.data(source_image.id, do_checksum=not self.options.verify_checksum)
+
+    def transfer_image(self, source_client: "Client", source_image, dest_client: "Client", dest_image,
+                       cache_key: str=None, cached_path: str=None) -> Tuple[int, Dict[str, str]]:
+        from glanceclient import exc
+        failure = None  # type: Optional[ImageTransferError]
+        checksum_calculator = None
+        cache_writer = None
+        read_ahead = None
+        download_stopped = True
+        progress = self.create_progress_reporter(source_image, "destination image %s" % dest_image.id)
+        try:
+            try:
+                if cached_path is not None:
+                    self.log("copying cached data for source image %s from %s to destination image %s" % (
+                        source_image.id, cached_path, dest_image.id))
+                    data = read_mapped(cached_path, self.options.chunk_size)
+                else:
+                    self.log("copying data from source image %s to destination image %s" % (
+                        source_image.id, dest_image.id))
+                    data = self.get_source_data(source_client, source_image)
+                    if data is not None and cache_key is not None and self.options.verify_checksum:
+                        # only verified data is added to the cache
+                        cache_writer = self.image_cache.writer(cache_key, get_image_property(source_image, "size"))
+                        if cache_writer is not None:
+                            data = cache_writer.wrap(data)
+                    if data is not None and self.options.read_ahead > 0:
+                        data = read_ahead = ReadAhead(data, self.options.read_ahead)
+                if data is not None:
+                    if self.options.verify_checksum:
+                        checksum_calculator = ChecksumCalculator(get_image_property(source_image, "os_hash_algo"),
+                                                                 log=self.log)
+                        data = checksum_calculator.wrap(data)
+                    data = progress.wrap(data)
+                    dest_client.images.upload(dest_image.id,
+                                              data_to_upload_stream(data, buffer_size=self.options.chunk_size))
+                else:
+                    self.log("WARNING: source image %s contained no data" % (source_image.id))
+            except exc.CommunicationError as ce:
+                failure = ImageTransferError("Communication error while attempting to transfer image: %s" % (ce),
+                                             dest_image.id, ce)
+            except exc.HTTPInternalServerError as hise:
+                failure = ImageTransferError("Internal server error while attempting to transfer image: %s" % (hise),
+                                             dest_image.id, hise)
+            except Exception as ue:
+                failure = ImageTransferError("Failed to transfer image (exception type %s): %s" % (type(ue), ue),
+                                             dest_image.id, ue)
+
+            waits = {}
+            if read_ahead is not None:
+                # the download must have stopped before the cache writer can be committed
+                if not read_ahead.close():
+                    self.log("WARNING: download of source image %s did not stop, leaving it to finish in the "
+                             "background" % source_image.id)
+                    download_stopped = False
+                waits = {"waiting_for_source_seconds": read_ahead.consumer_wait_seconds,
+                         "waiting_for_dest_seconds": read_ahead.reader_wait_seconds}
+                self.log("upload to destination image %s spent %.1fs waiting for the source, download spent %.1fs "
+                         "waiting for the destination" % (dest_image.id, read_ahead.consumer_wait_seconds,
+                                                          read_ahead.reader_wait_seconds))
+
+            if failure is None and checksum_calculator is not None:
+                failure = self.verify_transfer(source_image, dest_client, dest_image, checksum_calculator)
+                if failure is not None and cached_path is not None:
+                    # the cached data is no good, so make sure it is not used again
+                    self.image_cache.remove(cache_key)
+
+            if cache_writer is not None:
+                if failure is None and download_stopped:
+                    cache_writer.commit()
+                else:
+                    cache_writer.abort()
+
+            self.metrics.add_transfer(source=source_image.id, dest=dest_image.id, cached=cached_path is not None,
+                                      succeeded=failure is None, **progress.to_dict(), **waits)
+            if failure is not None:
+                with self.metrics.phase("delete", dest=dest_image.id):
+                    self.delete_failed_dest_image(dest_client, dest_image, failure)
+                raise failure
+            return progress.transferred, checksum_calculator.hexdigests() if checksum_calculator is not None else {}
+        finally:
+            if checksum_calculator is not None:
+                checksum_calculator.close()
+
+    def verify_transfer(self, source_image, dest_client: "Client", dest_image,
+                        checksum_calculator: ChecksumCalculator) -> Optional[ImageTransferError]:
+        hexdigests = checksum_calculator.hexdigests()
+        try:
+            dest_image = dest_client.images.get(dest_image.id)
+        except Exception as e:
+            return ImageTransferError("Failed to get destination image %s to verify its checksum (exception type "
+                                      "%s): %s" % (dest_image.id, type(e), e), dest_image.id, e)
+        mismatches = verify_checksums(source_image, dest_image, hexdigests)
+        if len(mismatches) > 0:
+            return ChecksumMismatchError("Checksum verification failed: %s" % "; ".join(mismatches), dest_image.id,
+                                         mismatches)
+        self.log("verified checksums of destination image %s (%s)" % (
+            dest_image.id, ", ".join(sorted(hexdigests.keys()))))
+        return None
+
+    def delete_failed_dest_image(self, dest_client: "Client", dest_image, failure: Union[str, Exception]):
+        from glanceclient import exc
+        try:
+            dest_client.images.delete(dest_image.id)
+        except exc.CommunicationError as ce:
+            raise ImageOperationError("%s. In addition, there was a communication error while attempting to delete "
+                                      "image after upload failed: %s" % (failure, ce), dest_image.id, ce)
+        except exc.HTTPInternalServerError as hise:
+            raise ImageOperationError("%s. In addition, there was an internal server error while attempting to "
+                                      "delete image after upload failed: %s" % (failure, hise), dest_image.id, hise)
+        except Exception as de:
+            raise ImageOperationError("%s. In addition, failed to delete image after upload failed (exception type "
+                                      "%s): %s" % (failure, type(de), de), dest_image.id, de)
+
+    def find_resumable_dest_image(self, dest_client: "Client", spool: Spool, dest_key: str):
+        from glanceclient import exc
+        dest_image_id, delete_images = spool.get_destination(dest_key)
+        if dest_image_id is None:
+            return None, []
+        try:
+            dest_image = dest_client.images.get(dest_image_id)
+        except exc.HTTPNotFound:
+            return None, []
+        except (exc.CommunicationError, exc.HTTPException) as e:
+            raise ImageOperationError("Failed to get destination image %s to resume the copy to it: %s"
+                                      % (dest_image_id, e), dest_image_id, e)
+        if dest_image.status not in ["queued", "active"]:
+            self.log("not resuming copy to destination image %s as its status is '%s'"
+                     % (dest_image.id, dest_image.status))
+            return None, []
+        self.log("resuming copy to destination image %s" % (dest_image.id))
+        return dest_image, delete_images
+
+    def transfer_image_via_spool(self, source_client: "Client", source_image, dest_client: "Client", dest_image,
+                                 dest_image_properties: Dict[str, Any], spool: Spool, dest_key: str,
+                                 cache_key: str=None) -> Tuple[int, Dict[str, str]]:
+        # a failure here leaves the spool and destination image in place so that a rerun can resume the copy
+        self.log("spooling data from source image %s to %s" % (source_image.id, spool.data_path))
+        try:
+            spool.download(source_client, checkpoint_interval=self.options.checkpoint_interval,
+                           progress=self.create_progress_reporter(source_image, spool.data_path),
+                           segments=self.options.segments, segment_size=self.options.segment_size)
+        except Exception as e:
+            raise ImageTransferError("Failed to download source image %s to spool (exception type %s): %s. Run the "
+                                     "copy again with the same '--spool-dir' to resume it"
+                                     % (source_image.id, type(e), e), source_image.id, e)
+
+        failure = None
+        for attempt in range(self.options.upload_retries + 1):
+            if attempt > 0:
+                # an upload that fails normally leaves the image queued, ready to be uploaded to again
+                with _raising_operation_errors("get destination image %s after failed upload" % dest_image.id):
+                    dest_image = dest_client.images.get(dest_image.id)
+                if dest_image.status != "queued":
+                    self.log("destination image %s is '%s' after failed upload, replacing it"
+                             % (dest_image.id, dest_image.status))
+                    self.delete_failed_dest_image(dest_client, dest_image, "Upload failed")
+                    dest_image = self.create_dest_image(dest_client, dest_image_properties)
+                    spool.set_destination(dest_key, dest_image.id, spool.get_destination(dest_key)[1])
+            self.log("uploading spooled data to destination image %s (attempt %d of %d)"
+                     % (dest_image.id, attempt + 1, self.options.upload_retries + 1))
+            checksum_calculator = None
+            progress = self.create_progress_reporter(source_image, "destination image %s" % dest_image.id)
+            try:
+                with spool.open() as spool_file:
+                    data = iter(functools.partial(spool_file.read, self.options.chunk_size), b"")
+                    if self.options.verify_checksum:
+                        checksum_calculator = ChecksumCalculator(get_image_property(source_image, "os_hash_algo"),
+                                                                 log=self.log)
+                        data = checksum_calculator.wrap(data)
+                    data = progress.wrap(data)
+                    dest_client.images.upload(dest_image.id,
+                                              data_to_upload_stream(data, buffer_size=self.options.chunk_size))
+            except Exception as ue:
+                failure = ImageTransferError("Failed to upload image (exception type %s): %s" % (type(ue), ue),
+                                             dest_image.id, ue)
+                self.log(str(failure))
+                continue
+            else:
+                if checksum_calculator is not None:
+                    failure = self.verify_transfer(source_image, dest_client, dest_image, checksum_calculator)
+                    if failure is not None:
+                        # the spooled data cannot be trusted, so the next attempt at the copy must start from scratch
+                        spool.discard()
+                        self.delete_failed_dest_image(dest_client, dest_image, failure)
+                        raise failure
+                    if cache_key is not None:
+                        # only verified data is added to the cache
+                        self.image_cache.add_file(cache_key, spool.data_path)
+                return progress.transferred, checksum_calculator.hexdigests() if checksum_calculator is not None else {}
+            finally:
+                if checksum_calculator is not None:
+                    checksum_calculator.close()
+        raise ImageTransferError("%s. Run the copy again with the same '--spool-dir' to retry the upload without "
+                                 "downloading the source image again" % failure, dest_image.id, failure.cause)
+
+    def delete_duplicate_images(self, dest_client: "Client", delete_images: List[str]):
+        from glanceclient import exc
+        for image_id in delete_images:
+            self.log("deleting existing image %s because it had a duplicate name" % (image_id))
+            try:
+                dest_client.images.delete(image_id)
+            except exc.HTTPNotFound:
+                # already deleted by a previous attempt at this copy
+                pass
+            except exc.CommunicationError as ce:
+                raise ImageOperationError("Communication error while attempting to delete image %s with duplicate "
+                                          "name: %s" % (image_id, ce), image_id, ce)
+            except exc.HTTPInternalServerError as hise:
+                raise ImageOperationError("Internal server error while attempting to delete image %s with duplicate "
+                                          "name: %s" % (image_id, hise), image_id, hise)
+            except exc.HTTPConflict as hc:
+                raise ImageOperationError("Conflict while attempting to delete image %s with duplicate name: %s"
+                                          % (image_id, hc), image_id, hc)
+            except Exception as e:
+                raise ImageOperationError("Failed to delete image %s with duplicate "
+                                          "name (exception type %s): %s" % (image_id, type(e), e), image_id, e)
+        if self.catalog is not None and self.catalog.supports(dest_client):
+            self.catalog.remove(dest_client, delete_images)
+
+
+def data_to_upload_stream(data: Iterable[bytes], buffer_size: int=DEFAULT_CHUNK_SIZE) -> io.BufferedReader:
+    class UploadStream(io.RawIOBase):
+        def __init__(self, data_iter, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            # the chunk currently being consumed is held as a memoryview together with an offset into it, so that
+            # serving a partial read does not create (and copy into) a new bytes object for the remainder
+            self.chunk = memoryview(b"")
+            self.offset = 0
+            self.data_iter = data_iter
+
+        def readable(self):
+            return True
+
+        def readinto(self, b):
+            while self.offset >= len(self.chunk):
+                try:
+                    self.chunk = memoryview(next(self.data_iter)).cast("B")
+                except StopIteration:
+                    return 0
+                self.offset = 0
+            count = min(len(b), len(self.chunk) - self.offset)
+            b[:count] = self.chunk[self.offset:self.offset + count]
+            self.offset += count
+            return count
+
+    return io.BufferedReader(UploadStream(iter(data)), buffer_size=buffer_size)
+
+
+def set_transfer_chunk_size(chunk_size: int):
+    """
+    Sets the size of the chunks in which glanceclient downloads image data and reads image data to upload. The size is
+    that of glanceclient's module, so it is shared by every client in the process: it is set once, by the commands.
+    :param chunk_size: the chunk size in bytes
+    """
+    from glanceclient.common import http as glance_http
+    if chunk_size <= 0:
+        raise ValueError("Chunk size must be a positive number of bytes, not %d" % chunk_size)
+    glance_http.CHUNKSIZE = chunk_size
@@ -0,0 +1,268 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Condition
+from typing import Any, Callable, Iterable, List, Optional, Tuple, Union
+
+from glanceclient import Client
+from glanceclient.exc import CommunicationError, HTTPBadGateway, HTTPConflict, HTTPException, \
+    HTTPInternalServerError, HTTPNotFound, HTTPOverLimit, HTTPServiceUnavailable, InvalidEndpoint
+
+from openstacktools._concurrency import AdaptiveConcurrencyLimit
+from openstacktools._errors import ImagesNotDeletedError
+from openstacktools._helpers import get_correct_image_noun, null_op, print_error
+from openstacktools._retry import RetryPolicy, RetryScheduler
+
+STATUS_PROPERTY = "status"
+DELETED_STATUSES = ["deleted", "pending_delete"]
+
+# errors with which an overloaded Glance (or its backend) responds (timeouts are raised as `InvalidEndpoint`)
+OVERLOAD_ERRORS = (HTTPServiceUnavailable, HTTPConflict, HTTPOverLimit, HTTPBadGateway, CommunicationError,
+                   InvalidEndpoint)
+# errors after which deletes are retried (409 is also returned while an image is transitioning between statuses)
+RETRYABLE_ERRORS = OVERLOAD_ERRORS + (HTTPInternalServerError, )
+
+
+class ImageDeletion(object):
+    """
+    The deletion of an image, which may take several attempts.
+    """
+    def __init__(self, image_id: str, name: str):
+        self.image_id = image_id
+        self.name = name
+        self.attempts = 0
+        self.error = None   # type: Optional[Exception]
+
+    @property
+    def deleted(self) -> bool:
+        """
+        Whether the image was definitely deleted (if not, it may or may not have been).
+        """
+        return self.attempts > 0 and self.error is None
+
+
+def _delete_images(client: Client, images: Iterable[Tuple[str, str]], outputter: Callable[[Any], None],
+                   max_simultaneous_deletes: int=5, max_in_flight: int=None,
+                   total: int=None, concurrency_limit: AdaptiveConcurrencyLimit=None,
+                   retry_policy: RetryPolicy=None, shared_limit: BoundedSemaphore=None,
+                   log: Callable[[str], None]=print_error) -> Tuple[int, List[ImageDeletion]]:
+    """
+    Deletes the given images, taking them from the iterable only as fast as they are deleted.
+
+    Deletes that fail with a transient error are put back to be retried after a backoff, leaving the workers free to
+    delete other images in the meantime. An image counts as in flight until its deletion has succeeded or been given up.
+    :param client: the glance client that can access OpenStack
+    :param images: the identifiers and names of the images to delete
+    :param outputter: output for the progress of the deletes
+    :param max_simultaneous_deletes: the maximum number of deletes to request simultaneously
+    :param max_in_flight: the maximum number of images taken from the iterable that have not yet been deleted
+    (defaults to twice the number of simultaneous deletes)
+    :param total: the number of images to delete, if known
+    :param concurrency_limit: limit on the number of deletes requested simultaneously that adapts to how well glance
+    copes with them (if not given, `max_simultaneous_deletes` are always requested simultaneously)
+    :param retry_policy: how to retry deletes that fail with a transient error (defaults to not retrying)
+    :param shared_limit: limit on the number of deletes requested simultaneously, shared with the deletes of images in
+    other environments
+    :param log: output for the errors of failed deletes
+    :return: tuple where the first element is the number of images that deletes were requested for and the second is
+    the deletions that took more than one attempt or failed, in the order they finished
+    """
+    if max_in_flight is None:
+        max_in_flight = 2 * max_simultaneous_deletes
+    if retry_policy is None:
+        retry_policy = RetryPolicy(retries=0)
+    in_flight = BoundedSemaphore(max(max_in_flight, max_simultaneous_deletes))
+    retries = RetryScheduler()
+    noteworthy = []     # type: List[ImageDeletion]
+    complete = 0
+    failed = 0
+    unfinished = 0
+    complete_condition = Condition()
+
+    def attempt(deletion: ImageDeletion, ticket: int=None):
+        started = time.monotonic()
+        deletion.error = _delete_image(client, deletion.image_id)
+        deletion.attempts += 1
+        if shared_limit is not None:
+            shared_limit.release()
+        if concurrency_limit is not None:
+            concurrency_limit.release(ticket, time.monotonic() - started,
+                                      overloaded=isinstance(deletion.error, OVERLOAD_ERRORS))
+        if deletion.error is not None and _is_retryable(deletion.error) \
+                and deletion.attempts < retry_policy.max_attempts:
+            delay = retry_policy.get_delay(deletion.attempts)
+            log("Retrying delete of image %s in %.1fs (attempt %d/%d failed: %s)"
+                % (deletion.image_id, delay, deletion.attempts, retry_policy.max_attempts,
+                   describe_error(deletion.error)))
+            retries.schedule(delay, submit, deletion)
+        else:
+            finish(deletion)
+
+    def submit(deletion: ImageDeletion):
+        ticket = concurrency_limit.acquire() if concurrency_limit is not None else None
+        if shared_limit is not None:
+            shared_limit.acquire()
+        executor.submit(attempt, deletion, ticket)
+
+    def finish(deletion: ImageDeletion):
+        nonlocal complete, failed, unfinished
+        if not deletion.deleted:
+            log("Unable to delete image %s: %s" % (deletion.image_id, describe_error(deletion.error)))
+        in_flight.release()
+        with complete_condition:
+            complete += 1
+            if not deletion.deleted:
+                failed += 1
+            if deletion.attempts > 1 or not deletion.deleted:
+                noteworthy.append(deletion)
+            if total is None:
+                outputter("Deleted %d %s (%d failed)"
+                          % (complete - failed, get_correct_image_noun(range(complete)), failed))
+            else:
+                outputter("Deleted %d/%d %s (%d failed)"
+                          % (complete - failed, total, get_correct_image_noun(range(total)), failed))
+            unfinished -= 1
+            complete_condition.notify_all()
+
+    attempted = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max_simultaneous_deletes) as executor:
+            for image_id, name in images:
+                in_flight.acquire()
+                with complete_condition:
+                    unfinished += 1
+                submit(ImageDeletion(image_id, name))
+                attempted += 1
+            # retries are submitted to the executor, so it must be kept open until every deletion has finished
+            with complete_condition:
+                complete_condition.wait_for(lambda: unfinished == 0)
+    finally:
+        retries.close()
+    return attempted, noteworthy
+
+
+def _delete_image(client: Client, image_id: str) -> Optional[Exception]:
+    """
+    Deletes an OpenStack image with the given identifier.
+    :param client: the glance client that can access OpenStack
+    :param image_id: the identifier of the image to delete
+    :return: the error that stopped the image from being deleted (in which case it may or may not have been deleted)
+    or `None` if it was deleted
+    """
+    try:
+        client.images.delete(image_id)
+        return None
+    except HTTPNotFound:
+        # already gone, e.g. because an earlier attempt to delete it succeeded but its response was lost
+        return None
+    except Exception as e:
+        return e
+
+
+def _is_retryable(error: Exception) -> bool:
+    """
+    Whether the given error from deleting an image is transient, in which case the delete may succeed if retried.
+    :param error: the error
+    :return: whether the delete should be retried
+    """
+    # glanceclient raises a plain `HTTPException` for status codes it does not know, such as 429 and 504
+    return isinstance(error, RETRYABLE_ERRORS) or type(error) is HTTPException
+
+
+def describe_error(error: Exception) -> str:
+    return error.details if isinstance(error, HTTPException) else str(error)
+
+
+def _get_undeleted_images(client: Client, image_ids: Iterable[str], max_simultaneous_requests: int=5,
+                          log: Callable[[str], None]=print_error) -> List[str]:
+    """
+    Gets which of the given images still exist, checking each individually rather than listing all images.
+    :param client: the glance client that can access OpenStack
+    :param image_ids: the identifiers of the images that may not have been deleted
+    :param max_simultaneous_requests: the maximum number of images to check simultaneously
+    :param log: output for the errors of failed checks
+    :return: the identifiers of the images that still exist
+    """
+    def exists(image_id: str) -> bool:
+        try:
+            return client.images.get(image_id)[STATUS_PROPERTY] not in DELETED_STATUSES
+        except HTTPNotFound:
+            return False
+        except Exception as e:
+            log("Unable to check whether image %s was deleted: %s" % (image_id, e))
+            return True
+
+    image_ids = list(image_ids)
+    if len(image_ids) == 0:
+        return []
+    with ThreadPoolExecutor(max_workers=max_simultaneous_requests) as executor:
+        return [image_id for image_id, still_exists in zip(image_ids, executor.map(exists, image_ids))
+                if still_exists]
+
+
+class DeletionResult(object):
+    """
+    The result of deleting images.
+    """
+    def __init__(self, attempted: int, noteworthy: List[ImageDeletion], not_deleted: List[ImageDeletion]):
+        """
+        Constructor.
+        :param attempted: the number of images that deletes were requested for
+        :param noteworthy: the deletions that took more than one attempt or failed, in the order they finished
+        :param not_deleted: the deletions of the images that still exist
+        """
+        self.attempted = attempted
+        self.noteworthy = noteworthy
+        self.not_deleted = not_deleted
+
+    @property
+    def deleted(self) -> int:
+        """
+        The number of images that were deleted.
+        """
+        return self.attempted - len(self.not_deleted)
+
+    def raise_for_failures(self):
+        """
+        Raises an error if any of the images could not be deleted.
+        :raises ImagesNotDeletedError: if any of the images still exist
+        """
+        if len(self.not_deleted) > 0:
+            raise ImagesNotDeletedError(
+                "Could not delete %d %s: %s" % (len(self.not_deleted), get_correct_image_noun(self.not_deleted),
+                                                 ", ".join(deletion.image_id for deletion in self.not_deleted)),
+                [deletion.image_id for deletion in self.not_deleted], [deletion.error for deletion in self.not_deleted])
+
+    def __repr__(self) -> str:
+        return "<DeletionResult attempted=%d deleted=%d not_deleted=%s>" \
+               % (self.attempted, self.deleted, [deletion.image_id for deletion in self.not_deleted])
+
+
+def delete_images(client: Client, images: Iterable[Union[str, Tuple[str, str]]],
+                  outputter: Callable[[Any], None]=null_op, max_simultaneous_deletes: int=5,
+                  max_in_flight: int=None, total: int=None, concurrency_limit: AdaptiveConcurrencyLimit=None,
+                  retry_policy: RetryPolicy=None, shared_limit: BoundedSemaphore=None,
+                  log: Callable[[str], None]=print_error) -> DeletionResult:
+    """
+    Deletes the given images and then checks whether those whose deletes failed still exist (a delete that failed, e.g.
+    because its response was lost, may still have deleted the image).
+    :param client: the glance client that can access OpenStack
+    :param images: the identifiers of the images to delete, or tuples of their identifiers and names
+    :param outputter: output for the progress of the deletes
+    :param max_simultaneous_deletes: the maximum number of deletes to request simultaneously
+    :param max_in_flight: the maximum number of images taken from the iterable that have not yet been deleted
+    (defaults to twice the number of simultaneous deletes)
+    :param total: the number of images to delete, if known
+    :param concurrency_limit: limit on the number of deletes requested simultaneously that adapts to how well glance
+    copes with them
+    :param retry_policy: how to retry deletes that fail with a transient error (defaults to not retrying)
+    :param shared_limit: limit on the number of deletes requested simultaneously, shared with other deletes
+    :param log: output for errors
+    :return: the result of the deletes
+    """
+    images = ((image, image) if isinstance(image, str) else image for image in images)
+    attempted, noteworthy = _delete_images(
+        client, images, outputter, max_simultaneous_deletes=max_simultaneous_deletes, max_in_flight=max_in_flight,
+        total=total, concurrency_limit=concurrency_limit, retry_policy=retry_policy, shared_limit=shared_limit, log=log)
+    failed = {deletion.image_id: deletion for deletion in noteworthy if not deletion.deleted}
+    not_deleted_ids = _get_undeleted_images(client, failed, max_simultaneous_requests=max_simultaneous_deletes, log=log)
+    return DeletionResult(attempted, noteworthy, [failed[image_id] for image_id in sorted(not_deleted_ids)])
@@ -0,0 +1,69 @@
+from typing import List, Optional
+
+
+class OpenStackToolsError(Exception):
+    """
+    Base class of the errors raised when copying or deleting images fails.
+    """
+
+
+class ImageNotFoundError(OpenStackToolsError):
+    """
+    Raised when no image has the given identifier or name.
+    """
+    def __init__(self, message: str, image_id_or_name: str):
+        super().__init__(message)
+        self.image_id_or_name = image_id_or_name
+
+
+class AmbiguousImageNameError(OpenStackToolsError):
+    """
+    Raised when an image is looked up by a name that several images have.
+    """
+    def __init__(self, message: str, name: str):
+        super().__init__(message)
+        self.name = name
+
+
+class DuplicateImageNameError(OpenStackToolsError):
+    """
+    Raised when an image with the destination name already exists and duplicate names are not allowed.
+    """
+    def __init__(self, message: str, name: str):
+        super().__init__(message)
+        self.name = name
+
+
+class ImageOperationError(OpenStackToolsError):
+    """
+    Raised when a request to glance about an image (e.g. to create, rename or delete it) fails.
+    """
+    def __init__(self, message: str, image_id: Optional[str]=None, cause: Optional[Exception]=None):
+        super().__init__(message)
+        self.image_id = image_id
+        self.cause = cause
+
+
+class ImageTransferError(ImageOperationError):
+    """
+    Raised when the data of an image could not be copied to the destination image.
+    """
+
+
+class ChecksumMismatchError(ImageTransferError):
+    """
+    Raised when the checksums of the copied data do not match those of the source or destination image.
+    """
+    def __init__(self, message: str, image_id: str, mismatches: List[str]):
+        super().__init__(message, image_id)
+        self.mismatches = mismatches
+
+
+class ImagesNotDeletedError(OpenStackToolsError):
+    """
+    Raised when some images could not be deleted.
+    """
+    def __init__(self, message: str, image_ids: List[str], causes: List[Optional[Exception]]):
+        super().__init__(message)
+        self.image_ids = image_ids
+        self.causes = causes
@@ -1,6 +1,8 @@
 import sys
-from typing import Callable, Any
+from threading import Lock
+from typing import Any, Callable, Optional, Sized
 
+SIZE_SUFFIXES = "KMGT"
 CONSENT_AGREED = ["y", "yes", "yup", "yea", "ok", "okey", "sure", "do it", "get on with it"]
 
 
@@ -21,3 +23,76 @@ def null_op(*args, **kwargs):
     :param args: arguments
     :param kwargs: named arguments
     """
+
+
+def synchronised(function: Callable) -> Callable:
+    """
+    Wraps the given function so that it is only called by one thread at a time.
+    :param function: the function to wrap
+    :return: the wrapped function
+    """
+    lock = Lock()
+
+    def synchronised(*args, **kwargs):
+        with lock:
+            return function(*args, **kwargs)
+
+    return synchronised
+
+
+@synchronised
+def print_error(message: str):
+    """
+    Prints the given error message to stderr, without interleaving it with those printed by other threads.
+    :param message: the message
+    """
+    print(message, file=sys.stderr)
+
+
+def get_correct_image_noun(images: Sized):
+    """
+    Gets the correct image noun (image or images) depending on the number of images.
+    :param images: the container of images
+    :return: the image noun
+    """
+    return "image" if len(images) in [0, 1] else "images"
+
+
+def get_image_property(image, key: str, default=None):
+    """
+    Gets a property of an image, which may not be set.
+    :param image: the image
+    :param key: the name of the property
+    :param default: value to return if the property is not set
+    :return: the value of the property
+    """
+    try:
+        value = image[key]
+    except KeyError:
+        return default
+    return default if value is None else value
+
+
+def parse_size(size: str) -> int:
+    """
+    Parses a size in bytes, which may have a (binary) K, M, G or T suffix.
+    :param size: the size (e.g. "4096" or "64M")
+    :return: the size in bytes
+    """
+    size = size.strip()
+    multiplier = 1
+    if len(size) > 0 and size[-1].upper() in SIZE_SUFFIXES:
+        multiplier = 1024 ** (SIZE_SUFFIXES.index(size[-1].upper()) + 1)
+        size = size[:-1]
+    return int(size) * multiplier
+
+
+def get_image_api_version(client) -> Optional[int]:
+    """
+    Gets the major version of the image API that the given glance client uses.
+    :param client: the glance client
+    :return: the major API version or `None` if it cannot be determined
+    """
+    version = getattr(client, "version", None)
+    return None if version is None else int(float(version))
+
@@ -0,0 +1,268 @@
+import itertools
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from threading import Condition, Thread
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED_STATUSES = [SUCCEEDED, FAILED]
+
+DEFAULT_HISTORY = 1000
+# period over which the recent throughput is measured
+DEFAULT_THROUGHPUT_WINDOW = 300.0
+
+
+class Job(object):
+    """
+    A job (e.g. a copy or a delete) run by a `JobScheduler`.
+    """
+    def __init__(self, job_id: str, kind: str, environments: Iterable[str], function: Callable[["Job"], Any],
+                 request: Dict[str, Any]=None):
+        """
+        Constructor.
+        :param job_id: the identifier of the job
+        :param kind: the kind of job (e.g. "copy")
+        :param environments: the environments the job uses, each of which it takes a slot of while running
+        :param function: the function that runs the job, returning its result (which must be JSON serialisable)
+        :param request: what was requested, as reported with the status of the job
+        """
+        self.id = job_id
+        self.kind = kind
+        self.environments = sorted(set(environments))
+        self.function = function
+        self.request = request if request is not None else {}
+        self.status = QUEUED
+        self.submitted_at = time.time()
+        self.started_at = None     # type: Optional[float]
+        self.finished_at = None    # type: Optional[float]
+        self.result = None
+        self.error = None          # type: Optional[str]
+        # set by the job's function as it goes
+        self.bytes_transferred = 0
+        self.images_deleted = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Gets the status of the job.
+        :return: the status, as can be serialised to JSON
+        """
+        return OrderedDict([
+            ("id", self.id), ("kind", self.kind), ("status", self.status), ("environments", self.environments),
+            ("request", self.request), ("submitted_at", _format_time(self.submitted_at)),
+            ("started_at", _format_time(self.started_at)), ("finished_at", _format_time(self.finished_at)),
+            ("seconds", (self.finished_at or time.time()) - self.started_at if self.started_at is not None else None),
+            ("bytes_transferred", self.bytes_transferred), ("images_deleted", self.images_deleted),
+            ("result", self.result), ("error", self.error)])
+
+
+def _format_time(timestamp: Optional[float]) -> Optional[str]:
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class JobScheduler(object):
+    """
+    Runs jobs on a bounded pool of workers, in the order they were submitted except that a job is held back (without
+    holding back those behind it) while any of its environments has as many jobs running as it is limited to.
+    """
+    def __init__(self, workers: int, environment_limit: int=None, environment_limits: Dict[str, int]=None,
+                 history: int=DEFAULT_HISTORY, throughput_window: float=DEFAULT_THROUGHPUT_WINDOW,
+                 log: Callable[[str], None]=None):
+        """
+        Constructor.
+        :param workers: the maximum number of jobs to run at once
+        :param environment_limit: the maximum number of jobs to run at once in any one environment (defaults to the
+        number of workers)
+        :param environment_limits: limits for particular environments, overriding `environment_limit`
+        :param history: the number of finished jobs to keep the status of
+        :param throughput_window: the period over which the recent throughput is measured in seconds
+        :param log: output for the starting and finishing of jobs
+        """
+        if workers < 1:
+            raise ValueError("Number of workers must be at least 1, not %d" % workers)
+        self.workers = workers
+        self.environment_limit = environment_limit if environment_limit is not None else workers
+        self.environment_limits = dict(environment_limits or {})
+        for env_name, limit in itertools.chain([("", self.environment_limit)], self.environment_limits.items()):
+            if limit < 1:
+                raise ValueError("Limit on the jobs run at once in environment '%s' must be at least 1, not %d"
+                                 % (env_name, limit))
+        self.history = history
+        self.throughput_window = throughput_window
+        self.log = log
+        self.started_at = time.time()
+
+        self._jobs = OrderedDict()     # type: Dict[str, Job]
+        self._queue = []               # type: List[Job]
+        self._running = {}             # type: Dict[str, int]
+        self._running_total = 0
+        self._finished = deque()       # type: deque
+        self._totals = {SUCCEEDED: 0, FAILED: 0, "bytes_transferred": 0, "images_deleted": 0}
+        self._recent = deque()         # type: deque
+        self._ids = itertools.count(1)
+        self._closed = False
+        self._condition = Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._dispatcher = Thread(target=self._dispatch, name="job-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, kind: str, environments: Iterable[str], function: Callable[[Job], Any],
+               request: Dict[str, Any]=None) -> Job:
+        """
+        Queues a job.
+        :param kind: the kind of job
+        :param environments: the environments the job uses
+        :param function: the function that runs the job, returning its result
+        :param request: what was requested
+        :return: the queued job
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Cannot submit jobs once the scheduler is closed")
+            job = Job(str(next(self._ids)), kind, environments, function, request)
+            self._jobs[job.id] = job
+            self._queue.append(job)
+            self._condition.notify_all()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def list(self, status: str=None) -> List[Job]:
+        """
+        Lists the jobs that are queued, running or recently finished.
+        :param status: only list the jobs with this status
+        :return: the jobs, in the order they were submitted
+        """
+        with self._condition:
+            return [job for job in self._jobs.values() if status is None or job.status == status]
+
+    def wait(self, job_id: str, timeout: float=None) -> Optional[Job]:
+        """
+        Waits for a job to finish.
+        :param job_id: the identifier of the job
+        :param timeout: the maximum time to wait in seconds (`None` to wait as long as it takes)
+        :return: the job (which may not have finished if the timeout was reached), or `None` if there is no such job
+        """
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._condition.wait_for(lambda: job.status in FINISHED_STATUSES, timeout)
+            return job
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Gets the statistics of the jobs run so far and the throughput over the recent window.
+        :return: the statistics, as can be serialised to JSON
+        """
+        now = time.time()
+        with self._condition:
+            self._expire_recent(now)
+            window = min(self.throughput_window, now - self.started_at) or 1.0
+            recent_bytes = sum(bytes_transferred for _, bytes_transferred, _ in self._recent)
+            recent_deleted = sum(images_deleted for _, _, images_deleted in self._recent)
+            return OrderedDict([
+                ("uptime", now - self.started_at), ("workers", self.workers),
+                ("queued", len(self._queue)), ("running", self._running_total),
+                ("running_by_environment", {env_name: count for env_name, count in sorted(self._running.items())
+                                            if count > 0}),
+                ("succeeded", self._totals[SUCCEEDED]), ("failed", self._totals[FAILED]),
+                ("bytes_transferred", self._totals["bytes_transferred"]),
+                ("images_deleted", self._totals["images_deleted"]),
+                ("throughput", OrderedDict([
+                    ("window", window), ("jobs_per_minute", len(self._recent) / window * 60),
+                    ("bytes_per_second", recent_bytes / window), ("images_deleted_per_second", recent_deleted / window)
+                ]))])
+
+    def close(self, wait: bool=True):
+        """
+        Stops accepting jobs and fails those that have not started, so that nothing waits for them.
+        :param wait: whether to wait for the running jobs to finish
+        """
+        with self._condition:
+            self._closed = True
+            finished_at = time.time()
+            for job in self._queue:
+                job.error = "scheduler closed"
+                job.finished_at = finished_at
+                job.status = FAILED
+                self._totals[FAILED] += 1
+                self._finished.append(job.id)
+            self._queue.clear()
+            while len(self._finished) > self.history:
+                del self._jobs[self._finished.popleft()]
+            self._condition.notify_all()
+        self._dispatcher.join()
+        self._executor.shutdown(wait=wait)
+
+    def _get_limit(self, env_name: str) -> int:
+        return self.environment_limits.get(env_name, self.environment_limit)
+
+    def _can_start(self, job: Job) -> bool:
+        return all(self._running.get(env_name, 0) < self._get_limit(env_name) for env_name in job.environments)
+
+    def _next_job(self) -> Optional[Job]:
+        if self._running_total >= self.workers:
+            return None
+        for index, job in enumerate(self._queue):
+            if self._can_start(job):
+                return self._queue.pop(index)
+        return None
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._closed or self._next_job_is_ready())
+                if self._closed:
+                    return
+                job = self._next_job()
+                job.status = RUNNING
+                job.started_at = time.time()
+                self._running_total += 1
+                for env_name in job.environments:
+                    self._running[env_name] = self._running.get(env_name, 0) + 1
+            self._executor.submit(self._run, job)
+
+    def _next_job_is_ready(self) -> bool:
+        return self._running_total < self.workers and any(self._can_start(job) for job in self._queue)
+
+    def _run(self, job: Job):
+        if self.log is not None:
+            self.log("Started %s job %s" % (job.kind, job.id))
+        try:
+            job.result = job.function(job)
+            status = SUCCEEDED
+        except Exception as e:
+            job.error = str(e) or type(e).__name__
+            status = FAILED
+        finished_at = time.time()
+        with self._condition:
+            job.finished_at = finished_at
+            job.status = status
+            self._running_total -= 1
+            for env_name in job.environments:
+                self._running[env_name] -= 1
+            self._totals[status] += 1
+            self._totals["bytes_transferred"] += job.bytes_transferred
+            self._totals["images_deleted"] += job.images_deleted
+            self._recent.append((finished_at, job.bytes_transferred, job.images_deleted))
+            self._expire_recent(finished_at)
+            self._finished.append(job.id)
+            while len(self._finished) > self.history:
+                del self._jobs[self._finished.popleft()]
+            self._condition.notify_all()
+        if self.log is not None:
+            self.log("%s %s job %s in %.1fs%s" % ("Finished" if status == SUCCEEDED else "Failed", job.kind, job.id,
+                                                  finished_at - job.started_at,
+                                                  ": %s" % job.error if job.error is not None else ""))
+
+    def _expire_recent(self, now: float):
+        while len(self._recent) > 0 and self._recent[0][0] < now - self.throughput_window:
+            self._recent.popleft()
@@ -0,0 +1,184 @@
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+from openstacktools._helpers import print_error
+
+DEFAULT_PROGRESS_INTERVAL = 10.0
+
+_BYTES_PER_MB = 1024 * 1024
+
+
+def format_size(size: float) -> str:
+    """
+    Formats a number of bytes for humans.
+    :param size: the number of bytes
+    :return: the formatted size
+    """
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if size < 1024:
+            return "%.1f %s" % (size, unit)
+        size /= 1024
+    return "%.1f TiB" % size
+
+
+def format_duration(seconds: float) -> str:
+    """
+    Formats a duration as hours, minutes and seconds.
+    :param seconds: the duration in seconds
+    :return: the formatted duration
+    """
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%d:%02d:%02d" % (hours, minutes, seconds)
+
+
+class Metrics(object):
+    """
+    Thread-safe record of how long each phase of a run took and how quickly data was transferred, which can be
+    written out as JSON.
+    """
+    def __init__(self, command: str):
+        self.command = command
+        self.started_at = datetime.now(timezone.utc)
+        self.phases = []
+        self.transfers = []
+        self._lock = Lock()
+
+    @contextmanager
+    def phase(self, name: str, **labels: Any):
+        """
+        Times the phase of the run in the `with` block.
+        :param name: the name of the phase (e.g. "auth" or "transfer")
+        :param labels: labels identifying what the phase was applied to
+        """
+        record = dict(labels, phase=name, succeeded=False)
+        started = time.monotonic()
+        try:
+            yield record
+            record["succeeded"] = True
+        finally:
+            record["seconds"] = time.monotonic() - started
+            with self._lock:
+                self.phases.append(record)
+
+    def add_transfer(self, **record: Any):
+        """
+        Records the statistics of a data transfer.
+        :param record: the statistics
+        """
+        with self._lock:
+            self.transfers.append(record)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "command": self.command,
+                "started_at": self.started_at.isoformat(),
+                "finished_at": datetime.now(timezone.utc).isoformat(),
+                "phases": list(self.phases),
+                "transfers": list(self.transfers)
+            }
+
+    def write_json(self, path: str):
+        """
+        Writes the metrics to the given path as JSON.
+        :param path: the path to write to
+        """
+        with open(path, "w") as metrics_file:
+            json.dump(self.to_dict(), metrics_file, indent=2, sort_keys=True)
+            metrics_file.write("\n")
+
+
+class ProgressReporter(object):
+    """
+    Reports the progress, throughput and estimated time remaining of a data transfer as the data streams past.
+    """
+    def __init__(self, description: str, total_size: Optional[int]=None, interval: float=DEFAULT_PROGRESS_INTERVAL,
+                 outputter: Callable[[str], None]=print_error):
+        self.description = description
+        self.total_size = total_size
+        self.interval = interval
+        self.outputter = outputter
+        self.transferred = 0
+        self.resumed_from = 0
+        self.started = None
+        self.finished = None
+        self._last_report = None
+        self._lock = Lock()
+
+    @property
+    def seconds(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def mb_per_second(self) -> float:
+        seconds = self.seconds
+        return (self.transferred - self.resumed_from) / _BYTES_PER_MB / seconds if seconds > 0 else 0.0
+
+    def wrap(self, data: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Wraps the given data so that its progress is reported as it is iterated over.
+        :param data: the data
+        :return: iterator over the same data
+        """
+        self.start()
+        for chunk in data:
+            self.update(len(chunk))
+            yield chunk
+        self.finish()
+
+    def start(self):
+        """
+        Marks the start of the transfer.
+        """
+        # anything already transferred (e.g. when resuming) does not count towards the throughput
+        self.resumed_from = self.transferred
+        self.started = self._last_report = time.monotonic()
+
+    def update(self, count: int):
+        """
+        Records that more data has been transferred, reporting the progress if it is time to. Can be called from
+        several threads at once.
+        :param count: the number of bytes transferred
+        """
+        with self._lock:
+            self.transferred += count
+            now = time.monotonic()
+            if self.interval > 0 and now - self._last_report >= self.interval:
+                self._last_report = now
+                self.outputter(self.describe())
+
+    def finish(self):
+        """
+        Marks the end of the transfer.
+        """
+        self.finished = time.monotonic()
+
+    def describe(self) -> str:
+        """
+        Describes the progress of the transfer.
+        :return: the description
+        """
+        description = "%s: %s" % (self.description, format_size(self.transferred))
+        if self.total_size:
+            description += " of %s (%.0f%%)" % (format_size(self.total_size), 100.0 * self.transferred / self.total_size)
+        description += ", %.1f MB/s" % self.mb_per_second
+        if self.total_size and self.transferred > self.resumed_from and self.finished is None:
+            remaining = (self.total_size - self.transferred) * self.seconds / (self.transferred - self.resumed_from)
+            description += ", ETA %s" % format_duration(max(remaining, 0))
+        return description
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "description": self.description,
+            "bytes": self.transferred,
+            "size": self.total_size,
+            "seconds": self.seconds,
+            "mb_per_second": self.mb_per_second
+        }
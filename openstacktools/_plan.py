@@ -0,0 +1,59 @@
+import json
+import os
+import tempfile
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+PLAN_VERSION = 1
+
+
+class DeletionPlan(object):
+    """
+    The images to delete in each of several OpenStack environments, which can be saved to a file to be reviewed and
+    then executed without listing the images again.
+    """
+    def __init__(self, images: Dict[str, List[Tuple[str, str]]]):
+        """
+        Constructor.
+        :param images: the identifiers and names of the images to delete, by environment ("" for the default one)
+        """
+        self.images = images
+
+    @property
+    def environments(self) -> List[str]:
+        return list(self.images.keys())
+
+    @property
+    def total(self) -> int:
+        return sum(len(images) for images in self.images.values())
+
+    def save(self, path: str):
+        """
+        Writes the plan to the given file.
+        :param path: the path of the file
+        """
+        plan = {
+            "version": PLAN_VERSION,
+            "created_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "environments": {env_name: [{"id": image_id, "name": name} for image_id, name in sorted(images)]
+                             for env_name, images in self.images.items()}
+        }
+        directory = os.path.dirname(os.path.abspath(path))
+        file_descriptor, temp_path = tempfile.mkstemp(prefix=".%s." % os.path.basename(path), dir=directory)
+        with os.fdopen(file_descriptor, "w") as plan_file:
+            json.dump(plan, plan_file, indent=2, sort_keys=True)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def load(path: str) -> "DeletionPlan":
+        """
+        Reads a plan from the given file.
+        :param path: the path of the file
+        :return: the plan
+        """
+        with open(path) as plan_file:
+            plan = json.load(plan_file)
+        if plan.get("version") != PLAN_VERSION:
+            raise ValueError("Unsupported deletion plan version in %s: %s" % (path, plan.get("version")))
+        return DeletionPlan({env_name: [(image["id"], image["name"]) for image in images]
+                             for env_name, images in plan["environments"].items()})
@@ -0,0 +1,65 @@
+import cProfile
+import pstats
+import sys
+import threading
+from contextlib import contextmanager
+from threading import Lock
+from typing import Iterator, List, Optional
+
+
+class Profiler(object):
+    """
+    Profiles every thread of the process with cProfile, so that the work done by pools of threads (deletes, segments of
+    downloads, uploads to several destinations) is included along with that of the main thread.
+    """
+    def __init__(self):
+        self._profiles = []     # type: List["cProfile.Profile"]
+        self._lock = Lock()
+
+    def start(self):
+        """
+        Starts profiling the current thread and any threads started after it.
+        """
+        if sys.version_info < (3, 12):
+            # before Python 3.12, a profiler only profiles the thread that enabled it, so each thread gets its own
+            threading.setprofile(self._profile_thread)
+        self._profile_thread()
+
+    def stop(self) -> "pstats.Stats":
+        """
+        Stops profiling.
+        :return: the statistics of every profiled thread, combined
+        """
+        threading.setprofile(None)
+        with self._lock:
+            profiles = list(self._profiles)
+        profiles[0].disable()
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    def _profile_thread(self, *args):
+        # called in place of the thread's profile function, which the profiler replaces when enabled
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+
+
+@contextmanager
+def profiled(path: Optional[str]) -> Iterator[None]:
+    """
+    Profiles the code in the `with` block, writing the statistics to a file in the format read by `pstats`.
+    :param path: the path of the file to write the statistics to (`None` to not profile)
+    """
+    if path is None:
+        yield
+        return
+    profiler = Profiler()
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop().dump_stats(path)
+        print("Profile written to %s (view with: python -m pstats %s)" % (path, path), file=sys.stderr)
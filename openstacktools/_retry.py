@@ -0,0 +1,92 @@
+import heapq
+import itertools
+import random
+import time
+from threading import Condition, Thread
+from typing import Callable, List, Tuple
+
+DEFAULT_RETRIES = 4
+DEFAULT_RETRY_DELAY = 1.0
+DEFAULT_MAX_RETRY_DELAY = 60.0
+
+
+class RetryPolicy(object):
+    """
+    How often, and after how long, to retry an operation that failed transiently: exponential backoff with "full
+    jitter", so that operations that failed together are not all retried together.
+    """
+    def __init__(self, retries: int=DEFAULT_RETRIES, delay: float=DEFAULT_RETRY_DELAY,
+                 max_delay: float=DEFAULT_MAX_RETRY_DELAY):
+        """
+        Constructor.
+        :param retries: the maximum number of times to retry an operation
+        :param delay: the longest to wait before the first retry in seconds (doubled for each retry after)
+        :param max_delay: the longest to wait before any retry in seconds
+        """
+        if retries < 0:
+            raise ValueError("Number of retries cannot be negative, not %d" % retries)
+        if delay < 0 or max_delay < 0:
+            raise ValueError("Retry delays cannot be negative")
+        self.retries = retries
+        self.delay = delay
+        self.max_delay = max_delay
+
+    @property
+    def max_attempts(self) -> int:
+        return self.retries + 1
+
+    def get_delay(self, attempts: int) -> float:
+        """
+        Gets how long to wait before the next attempt.
+        :param attempts: the number of attempts made so far
+        :return: the time to wait in seconds
+        """
+        return random.uniform(0, min(self.max_delay, self.delay * 2 ** (attempts - 1)))
+
+
+class RetryScheduler(object):
+    """
+    Calls functions after a delay from a thread of its own, so that the threads that schedule retries are not blocked
+    waiting for them.
+    """
+    def __init__(self):
+        self._scheduled = []    # type: List[Tuple[float, int, Callable, tuple]]
+        self._sequence = itertools.count()
+        self._closed = False
+        self._condition = Condition()
+        self._thread = Thread(target=self._run, name="retry-scheduler", daemon=True)
+        self._thread.start()
+
+    def schedule(self, delay: float, function: Callable, *args):
+        """
+        Schedules the given function to be called with the given arguments.
+        :param delay: how long to wait before calling the function in seconds
+        :param function: the function to call
+        :param args: the arguments to call it with
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Cannot schedule retries after the scheduler has been closed")
+            heapq.heappush(self._scheduled, (time.monotonic() + delay, next(self._sequence), function, args))
+            self._condition.notify()
+
+    def close(self):
+        """
+        Stops the scheduler, dropping any calls still waiting to be made.
+        """
+        with self._condition:
+            self._closed = True
+            self._scheduled.clear()
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and (len(self._scheduled) == 0 or self._scheduled[0][0] > time.monotonic()):
+                    self._condition.wait(None if len(self._scheduled) == 0
+                                         else self._scheduled[0][0] - time.monotonic())
+                if self._closed:
+                    return
+                _, _, function, args = heapq.heappop(self._scheduled)
+            function(*args)
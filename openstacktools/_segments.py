@@ -0,0 +1,195 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Optional, Tuple
+
+from openstacktools._helpers import get_image_api_version
+
+if TYPE_CHECKING:
+    from glanceclient import Client
+
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+
+
+def supports_range_requests(client: "Client") -> bool:
+    """
+    Whether byte ranges of image data can be requested from the given client (only the v2 image-data endpoint is
+    used for this).
+    :param client: the glance client
+    :return: whether range requests can be attempted
+    """
+    return get_image_api_version(client) == 2
+
+
+def get_image_data_range(client: "Client", image_id: str, start: int, end: int=None) -> Optional[Iterable[bytes]]:
+    """
+    Gets the data of an image from the given byte offset using a HTTP Range request.
+    :param client: the glance client that can access the image
+    :param image_id: the identifier of the image
+    :param start: the offset of the first byte to get
+    :param end: the offset of the last byte to get (inclusive), or `None` to get everything from `start` onwards
+    :return: iterable of the requested data or `None` if the server did not honour the range request
+    """
+    from glanceclient import exc
+    if not supports_range_requests(client):
+        return None
+    byte_range = "bytes=%d-%s" % (start, "" if end is None else end)
+    response = _get_unencoded(client, "/v2/images/%s/file" % image_id, {"Range": byte_range})
+    if not response.ok:
+        raise exc.from_response(response, response.content)
+    if response.status_code != 206:
+        response.close()
+        return None
+    return _iterate_and_close(response)
+
+
+def _get_unencoded(client: "Client", url: str, headers: dict) -> "requests.Response":
+    """
+    Makes a GET request with the given headers sent as they are. glanceclient percent-encodes the values of headers
+    (making "bytes=0-" "bytes%3D0-", which servers do not recognise as a range), so the request is made through the
+    session underneath the client instead.
+    :param client: the glance client
+    :param url: the URL to get, relative to the image endpoint
+    :param headers: the headers to send
+    :return: the (streamed) response
+    """
+    import requests
+    from glanceclient import exc
+    from glanceclient.common import http as glance_http
+    from keystoneauth1 import adapter as ksa_adapter
+    from keystoneauth1 import exceptions as ksa_exceptions
+    http_client = client.http_client
+    try:
+        if isinstance(http_client, glance_http.SessionClient):
+            return ksa_adapter.Adapter.request(http_client, url, "GET", headers=headers, stream=True, raise_exc=False)
+        headers = dict(http_client.identity_headers or {}, **headers)
+        headers.setdefault("X-Auth-Token", http_client.auth_token)
+        return http_client.session.get("%s/%s" % (http_client.endpoint.rstrip("/"), url.lstrip("/")),
+                                       headers=headers, stream=True, timeout=http_client.timeout)
+    except (ksa_exceptions.ConnectionError, requests.ConnectionError) as e:
+        raise exc.CommunicationError(message="Error communicating with image endpoint: %s" % e) from e
+
+
+def _iterate_and_close(response: "requests.Response") -> Iterator[bytes]:
+    from glanceclient.common import http as glance_http
+    for chunk in response.iter_content(chunk_size=glance_http.CHUNKSIZE):
+        yield chunk
+    response.close()
+
+
+def get_segments(start: int, size: int, segment_size: int) -> List[Tuple[int, int]]:
+    """
+    Splits the given range of bytes into segments.
+    :param start: the offset of the first byte
+    :param size: the offset after the last byte
+    :param segment_size: the maximum number of bytes in each segment
+    :return: the offsets of the first and last (inclusive) byte of each segment
+    """
+    return [(offset, min(offset + segment_size, size) - 1) for offset in range(start, size, segment_size)]
+
+
+class SegmentedDownload(object):
+    """
+    Downloads the data of an image as byte-range segments, several at a time over separate connections, for when a
+    single stream cannot make use of all of the bandwidth to the source.
+    """
+    def __init__(self, client: "Client", image_id: str, size: int, segments: int,
+                 segment_size: int=DEFAULT_SEGMENT_SIZE, start: int=0):
+        if segments < 1:
+            raise ValueError("Number of segments must be at least 1, not %d" % segments)
+        if segment_size < 1:
+            raise ValueError("Segment size must be at least 1 byte, not %d" % segment_size)
+        self.client = client
+        self.image_id = image_id
+        self.segments = segments
+        self.ranges = get_segments(start, size, segment_size)
+        self._first_body = None
+
+    def start(self) -> bool:
+        """
+        Starts downloading the first segment, finding out whether the server honours range requests.
+        :return: whether the data can be downloaded in segments (if not, it must be downloaded in a single stream)
+        """
+        if len(self.ranges) == 0:
+            return True
+        self._first_body = get_image_data_range(self.client, self.image_id, *self.ranges[0])
+        return self._first_body is not None
+
+    def __iter__(self) -> Iterator[bytes]:
+        """
+        Iterates over the data in order. The first outstanding segment is streamed while the segments after it (up to
+        the number being downloaded at once) are buffered in memory.
+        :return: iterator over the data
+        """
+        if len(self.ranges) == 0:
+            return
+        executor = ThreadPoolExecutor(max_workers=self.segments)
+        pending = deque()
+        try:
+            next_index = 1
+            while next_index < len(self.ranges) and next_index < self.segments:
+                pending.append(executor.submit(self._read_segment, next_index))
+                next_index += 1
+            yield from self._check_length(0, self._first_body)
+            while len(pending) > 0:
+                chunks = pending.popleft().result()
+                if next_index < len(self.ranges):
+                    pending.append(executor.submit(self._read_segment, next_index))
+                    next_index += 1
+                yield from chunks
+        finally:
+            # segments that have not started downloading are not needed if the data has stopped being read
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def write_to(self, file_descriptor: int, on_written: Callable[[int, int], None]=None):
+        """
+        Downloads all of the segments concurrently, writing each to its position in the given file.
+        :param file_descriptor: descriptor of the file, opened for writing
+        :param on_written: called (from the downloading threads) with the offset and length of each chunk written
+        """
+        def write_segment(index, body=None):
+            if body is None:
+                body = self._fetch_segment(index)
+            offset = self.ranges[index][0]
+            for chunk in self._check_length(index, body):
+                os.pwrite(file_descriptor, chunk, offset)
+                if on_written is not None:
+                    on_written(offset, len(chunk))
+                offset += len(chunk)
+
+        if len(self.ranges) == 0:
+            return
+        executor = ThreadPoolExecutor(max_workers=self.segments)
+        futures = []
+        try:
+            futures.append(executor.submit(write_segment, 0, self._first_body))
+            futures.extend(executor.submit(write_segment, index) for index in range(1, len(self.ranges)))
+            for future in futures:
+                future.result()
+        finally:
+            # if a segment fails, those that have not started downloading are not worth downloading
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def _read_segment(self, index: int) -> List[bytes]:
+        return list(self._check_length(index, self._fetch_segment(index)))
+
+    def _fetch_segment(self, index: int) -> Iterable[bytes]:
+        body = get_image_data_range(self.client, self.image_id, *self.ranges[index])
+        if body is None:
+            raise IOError("Server did not honour the range request for segment %d (bytes %d-%d) of image %s"
+                          % (index, self.ranges[index][0], self.ranges[index][1], self.image_id))
+        return body
+
+    def _check_length(self, index: int, body: Iterable[bytes]) -> Iterator[bytes]:
+        start, end = self.ranges[index]
+        received = 0
+        for chunk in body:
+            received += len(chunk)
+            yield chunk
+        if received != end - start + 1:
+            raise IOError("Received %d bytes for segment %d (bytes %d-%d) of image %s, expected %d"
+                          % (received, index, start, end, self.image_id, end - start + 1))
@@ -0,0 +1,158 @@
+import fnmatch
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from oslo_utils import timeutils
+
+from openstacktools._helpers import get_image_property
+
+AGE_UNITS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60, "w": 7 * 24 * 60 * 60}
+
+_AGE_PATTERN = re.compile(r"^(\d+)([%s])$" % "".join(AGE_UNITS))
+_WILDCARD_CHARACTERS = "*?["
+
+
+def parse_time(value: str, now: datetime=None) -> datetime:
+    """
+    Parses a point in time, given either as an ISO 8601 timestamp (taken to be in UTC if it has no timezone) or as an
+    age, i.e. a number followed by s, m, h, d or w (e.g. "30d" for 30 days ago).
+    :param value: the time to parse
+    :param now: the time ages are relative to (defaults to the current time)
+    :return: the (timezone aware) point in time
+    """
+    value = value.strip()
+    match = _AGE_PATTERN.match(value)
+    if match is not None:
+        now = now if now is not None else datetime.now(timezone.utc)
+        return now - timedelta(seconds=int(match.group(1)) * AGE_UNITS[match.group(2)])
+    # unlike `datetime.fromisoformat`, this accepts the "Z" suffix that glance's timestamps have on all Pythons
+    return timeutils.parse_isotime(value)
+
+
+def format_time(time: datetime) -> str:
+    """
+    Formats the given point in time as glance does.
+    :param time: the point in time
+    :return: the time in UTC, in ISO 8601 format
+    """
+    return time.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class ImageSelection(object):
+    """
+    Criteria for selecting images, which are passed to glance as filters wherever its API supports them, so that only
+    the metadata of candidate images is listed. Every criterion is also checked on each listed image, as filters that
+    glance does not support may be ignored rather than rejected.
+    """
+    def __init__(self, names: List[str]=(), owner: str=None, visibility: str=None, statuses: List[str]=(),
+                 tags: List[str]=(), created_before: datetime=None, updated_before: datetime=None,
+                 min_size: int=None, max_size: int=None, include_protected: bool=False):
+        """
+        Constructor.
+        :param names: names or shell-style patterns (e.g. "test-*") that image names must match one of
+        :param owner: the identifier of the project that must own the images
+        :param visibility: the visibility the images must have (e.g. "private")
+        :param statuses: statuses that the images must have one of
+        :param tags: tags that the images must all have
+        :param created_before: time before which the images must have been created
+        :param updated_before: time before which the images must have last been updated
+        :param min_size: the minimum size of the images in bytes
+        :param max_size: the maximum size of the images in bytes
+        :param include_protected: whether to select protected images
+        """
+        self.names = list(names)
+        self.owner = owner
+        self.visibility = visibility
+        self.statuses = list(statuses)
+        self.tags = list(tags)
+        self.created_before = created_before
+        self.updated_before = updated_before
+        self.min_size = min_size
+        self.max_size = max_size
+        self.include_protected = include_protected
+
+    def is_everything(self) -> bool:
+        """
+        Whether every (non-protected, unless protected images are included) image is selected.
+        """
+        return len(self.names) == 0 and self.owner is None and self.visibility is None and len(self.statuses) == 0 \
+            and len(self.tags) == 0 and self.created_before is None and self.updated_before is None \
+            and self.min_size is None and self.max_size is None
+
+    def get_filters(self, api_version: Optional[int]) -> Dict[str, Any]:
+        """
+        Gets the filters with which to have glance select the images.
+        :param api_version: the major version of the image API that the filters are for
+        :return: the filters to list images with
+        """
+        filters = {}    # type: Dict[str, Any]
+        literal_names = [name for name in self.names if not any(c in name for c in _WILDCARD_CHARACTERS)]
+        if len(self.names) > 0 and len(literal_names) == len(self.names):
+            if len(literal_names) == 1:
+                filters["name"] = literal_names[0]
+            elif api_version == 2:
+                filters["name"] = "in:%s" % ",".join('"%s"' % name.replace('"', '\\"') for name in literal_names)
+        if len(self.statuses) == 1:
+            filters["status"] = self.statuses[0]
+        if self.min_size is not None:
+            filters["size_min"] = self.min_size
+        if self.max_size is not None:
+            filters["size_max"] = self.max_size
+        if api_version == 2:
+            if not self.include_protected:
+                filters["protected"] = "false"
+            if self.owner is not None:
+                filters["owner"] = self.owner
+            if self.visibility is not None:
+                filters["visibility"] = self.visibility
+            if len(self.tags) > 0:
+                filters["tag"] = list(self.tags)
+            if self.created_before is not None:
+                filters["created_at"] = "lt:%s" % format_time(self.created_before)
+            if self.updated_before is not None:
+                filters["updated_at"] = "lt:%s" % format_time(self.updated_before)
+        return filters
+
+    def matches(self, image) -> bool:
+        """
+        Whether the given image is selected.
+        :param image: the image
+        :return: whether the image matches every criterion
+        """
+        if not self.include_protected and get_image_property(image, "protected", False):
+            return False
+        if len(self.names) > 0 and not any(fnmatch.fnmatchcase(get_image_property(image, "name", ""), name)
+                                           for name in self.names):
+            return False
+        if self.owner is not None and get_image_property(image, "owner") != self.owner:
+            return False
+        if self.visibility is not None and self._get_visibility(image) != self.visibility:
+            return False
+        if len(self.statuses) > 0 and get_image_property(image, "status") not in self.statuses:
+            return False
+        if len(self.tags) > 0 and not set(self.tags).issubset(get_image_property(image, "tags", [])):
+            return False
+        if self.created_before is not None and not self._is_before(image, "created_at", self.created_before):
+            return False
+        if self.updated_before is not None and not self._is_before(image, "updated_at", self.updated_before):
+            return False
+        size = get_image_property(image, "size")
+        if self.min_size is not None and (size is None or size < self.min_size):
+            return False
+        if self.max_size is not None and (size is None or size > self.max_size):
+            return False
+        return True
+
+    @staticmethod
+    def _get_visibility(image) -> Optional[str]:
+        visibility = get_image_property(image, "visibility")
+        if visibility is None and get_image_property(image, "is_public") is not None:
+            # v1 images only have a public flag
+            visibility = "public" if get_image_property(image, "is_public") else "private"
+        return visibility
+
+    @staticmethod
+    def _is_before(image, key: str, time: datetime) -> bool:
+        value = get_image_property(image, key)
+        return value is not None and parse_time(value) < time
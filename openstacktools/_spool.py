@@ -0,0 +1,250 @@
+import errno
+import fcntl
+import json
+import os
+from bisect import bisect_right
+from threading import Lock
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+from openstacktools._helpers import get_image_property, print_error
+from openstacktools._metrics import ProgressReporter
+from openstacktools._segments import DEFAULT_SEGMENT_SIZE, SegmentedDownload, get_image_data_range
+
+if TYPE_CHECKING:
+    from glanceclient import Client
+
+DEFAULT_CHECKPOINT_INTERVAL = 64 * 1024 * 1024
+
+_CHECKPOINT_IDENTITY_PROPERTIES = ["id", "size", "checksum", "os_hash_value", "updated_at"]
+
+
+class Spool(object):
+    """
+    Local copy of the data of a source image, together with a checkpoint recording how much of that data has been
+    durably written and which destination images it is being uploaded to, so that an interrupted copy can be resumed.
+    """
+    def __init__(self, spool_dir: str, source_image, log: Callable[[str], None]=print_error):
+        os.makedirs(spool_dir, exist_ok=True)
+        self.source_image = source_image
+        self.log = log
+        self.data_path = os.path.join(spool_dir, "%s.data" % source_image["id"])
+        self.checkpoint_path = os.path.join(spool_dir, "%s.checkpoint" % source_image["id"])
+        self.lock_path = os.path.join(spool_dir, "%s.lock" % source_image["id"])
+        with self._locked():
+            self.checkpoint = self._load_checkpoint()
+
+    @property
+    def downloaded(self) -> int:
+        return self.checkpoint["downloaded"]
+
+    @property
+    def complete(self) -> bool:
+        return self.checkpoint["complete"]
+
+    def get_destination(self, dest_key: str) -> Tuple[Optional[str], List[str]]:
+        """
+        Gets the destination image that was created by a previous attempt to copy to the given destination.
+        :param dest_key: key identifying the destination
+        :return: tuple where the first element is the id of the destination image (`None` if there is not one) and the
+        second is the ids of images that are to be deleted once the copy has succeeded
+        """
+        with self._locked():
+            self.checkpoint = self._load_checkpoint()
+        destination = self.checkpoint["destinations"].get(dest_key, {})
+        return destination.get("image_id"), destination.get("delete_images", [])
+
+    def set_destination(self, dest_key: str, image_id: str, delete_images: List[str]):
+        """
+        Records the destination image that the spooled data is being uploaded to.
+        :param dest_key: key identifying the destination
+        :param image_id: the id of the destination image
+        :param delete_images: the ids of images to delete once the copy has succeeded
+        """
+        with self._locked():
+            self.checkpoint = self._load_checkpoint()
+            self.checkpoint["destinations"][dest_key] = {"image_id": image_id, "delete_images": delete_images}
+            self._save_checkpoint()
+
+    def finish_destination(self, dest_key: str):
+        """
+        Records that the copy to the given destination has finished, removing the spool once there are no more
+        destinations waiting on it.
+        :param dest_key: key identifying the destination
+        """
+        with self._locked():
+            self.checkpoint = self._load_checkpoint()
+            self.checkpoint["destinations"].pop(dest_key, None)
+            if len(self.checkpoint["destinations"]) > 0:
+                self._save_checkpoint()
+                return
+        self.discard()
+
+    def discard(self):
+        """
+        Discards the spooled data and checkpoint.
+        """
+        with self._locked():
+            for path in [self.data_path, self.checkpoint_path]:
+                if os.path.exists(path):
+                    os.remove(path)
+            self.checkpoint = self._load_checkpoint()
+
+    def download(self, client: "Client", checkpoint_interval: int=DEFAULT_CHECKPOINT_INTERVAL,
+                 progress: ProgressReporter=None, segments: int=1, segment_size: int=DEFAULT_SEGMENT_SIZE):
+        """
+        Downloads the source image into the spool, resuming from the last checkpoint if the server supports range
+        requests.
+        :param client: the glance client that can access the source image
+        :param checkpoint_interval: number of bytes to download between checkpoints
+        :param progress: reporter of the progress of the download
+        :param segments: number of byte-range segments to download at once (if the server supports range requests)
+        :param segment_size: maximum size of each segment
+        """
+        with self._locked():
+            self.checkpoint = self._load_checkpoint()
+            if self.complete:
+                return
+
+            offset = self.downloaded
+            size = get_image_property(self.source_image, "size")
+            if segments > 1 and size is not None and offset < size:
+                segmented_download = SegmentedDownload(client, self.source_image["id"], size, segments, segment_size,
+                                                       start=offset)
+                if segmented_download.start():
+                    self.log("downloading source image %s from byte %d in %d segments, %d at a time" % (
+                        self.source_image["id"], offset, len(segmented_download.ranges), segments))
+                    self._download_segments(segmented_download, offset, size, checkpoint_interval, progress)
+                    self.checkpoint["complete"] = True
+                    self._save_checkpoint()
+                    return
+                self.log("WARNING: cannot download source image %s in segments as the server does not support range "
+                         "requests" % self.source_image["id"])
+
+            data = None
+            if offset > 0 and offset == size:
+                data = []
+            elif offset > 0:
+                data = get_image_data_range(client, self.source_image["id"], offset)
+                if data is None:
+                    self.log("WARNING: cannot resume download of source image %s as the server does not support "
+                             "range requests, downloading it again" % self.source_image["id"])
+                    offset = 0
+                else:
+                    self.log("resuming download of source image %s from byte %d" % (self.source_image["id"], offset))
+            if data is None:
+                data = client.images.data(self.source_image["id"]) or []
+            if progress is not None:
+                progress.transferred = offset
+                data = progress.wrap(data)
+
+            with open(self.data_path, "r+b" if os.path.exists(self.data_path) else "wb") as spool_file:
+                # discard anything written after the last checkpoint, as it may not have been durably written
+                spool_file.truncate(offset)
+                spool_file.seek(offset)
+                since_checkpoint = 0
+                for chunk in data:
+                    spool_file.write(chunk)
+                    offset += len(chunk)
+                    since_checkpoint += len(chunk)
+                    if since_checkpoint >= checkpoint_interval:
+                        self._checkpoint_data(spool_file, offset)
+                        since_checkpoint = 0
+                self._checkpoint_data(spool_file, offset)
+
+            if size is not None and offset != size:
+                raise IOError("Downloaded %d bytes of source image %s but expected %d"
+                              % (offset, self.source_image["id"], size))
+            self.checkpoint["complete"] = True
+            self._save_checkpoint()
+
+    def _download_segments(self, segmented_download: SegmentedDownload, offset: int, size: int,
+                           checkpoint_interval: int, progress: Optional[ProgressReporter]):
+        # the checkpoint records how far the data has been written without gaps, which is the end of the segments that
+        # have been completely written plus whatever has been written of the segment after them
+        segment_starts = [start for start, _ in segmented_download.ranges]
+        segment_lengths = [end - start + 1 for start, end in segmented_download.ranges]
+        written = [0] * len(segment_starts)
+        state = {"first_incomplete": 0, "checkpointed": offset}
+        lock = Lock()
+
+        def on_written(chunk_offset, length):
+            if progress is not None:
+                progress.update(length)
+            with lock:
+                written[bisect_right(segment_starts, chunk_offset) - 1] += length
+                index = state["first_incomplete"]
+                while index < len(written) and written[index] == segment_lengths[index]:
+                    index += 1
+                state["first_incomplete"] = index
+                contiguous = size if index == len(written) else segment_starts[index] + written[index]
+                if contiguous - state["checkpointed"] >= checkpoint_interval:
+                    self._checkpoint_data(spool_file, contiguous)
+                    state["checkpointed"] = contiguous
+
+        with open(self.data_path, "r+b" if os.path.exists(self.data_path) else "wb") as spool_file:
+            # discard anything written after the last checkpoint, then allocate the rest of the file so that each
+            # segment can be written at its position (and running out of space is found out before downloading)
+            spool_file.truncate(offset)
+            try:
+                os.posix_fallocate(spool_file.fileno(), offset, size - offset)
+            except (AttributeError, OSError) as e:
+                if getattr(e, "errno", None) == errno.ENOSPC:
+                    raise
+                # not supported by the platform or file system
+                spool_file.truncate(size)
+            if progress is not None:
+                progress.transferred = offset
+                progress.start()
+            segmented_download.write_to(spool_file.fileno(), on_written)
+            if progress is not None:
+                progress.finish()
+            self._checkpoint_data(spool_file, size)
+
+    def open(self):
+        """
+        Opens the spooled data for reading.
+        :return: binary file object
+        """
+        return open(self.data_path, "rb")
+
+    def _checkpoint_data(self, spool_file, offset: int):
+        spool_file.flush()
+        os.fsync(spool_file.fileno())
+        self.checkpoint["downloaded"] = offset
+        self._save_checkpoint()
+
+    def _load_checkpoint(self) -> Dict:
+        identity = {key: get_image_property(self.source_image, key) for key in _CHECKPOINT_IDENTITY_PROPERTIES}
+        checkpoint = None
+        if os.path.isfile(self.checkpoint_path):
+            with open(self.checkpoint_path) as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+            if checkpoint.get("source_image") != identity:
+                # the source image has changed since the spool was written so the spooled data cannot be trusted
+                self.log("WARNING: discarding spool for source image %s as the image has changed"
+                         % self.source_image["id"])
+                for path in [self.data_path, self.checkpoint_path]:
+                    if os.path.exists(path):
+                        os.remove(path)
+                checkpoint = None
+        if checkpoint is None:
+            checkpoint = {"source_image": identity, "downloaded": 0, "complete": False, "destinations": {}}
+        return checkpoint
+
+    def _save_checkpoint(self):
+        temp_path = "%s.tmp" % self.checkpoint_path
+        with open(temp_path, "w") as checkpoint_file:
+            json.dump(self.checkpoint, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temp_path, self.checkpoint_path)
+
+    @contextmanager
+    def _locked(self):
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,42 @@
+from typing import Dict, Iterable, List, Tuple
+
+from openstacktools._checksum import has_same_data
+
+MISSING = "missing"
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+AMBIGUOUS = "ambiguous"
+
+
+def plan_sync(source_images: Iterable, dest_images: Iterable) -> List[Tuple[str, object, List]]:
+    """
+    Works out what needs to be done to sync the given source images to the destination, matching them with the
+    destination images by name and then by checksum.
+    :param source_images: the (active) source images to sync
+    :param dest_images: the destination images with the names of the source images
+    :return: for each source image, a tuple of the action (`MISSING`, `CHANGED`, `UNCHANGED` or `AMBIGUOUS` if there
+    are several source images with its name), the source image and the destination images with its name (for
+    `UNCHANGED`, the first is the one that matches)
+    """
+    dest_images_by_name = {}    # type: Dict[str, List]
+    for dest_image in dest_images:
+        dest_images_by_name.setdefault(dest_image["name"], []).append(dest_image)
+    source_images_by_name = {}  # type: Dict[str, List]
+    for source_image in source_images:
+        source_images_by_name.setdefault(source_image["name"], []).append(source_image)
+
+    plan = []
+    for name, named_source_images in sorted(source_images_by_name.items()):
+        named_dest_images = dest_images_by_name.get(name, [])
+        if len(named_source_images) > 1:
+            plan.extend((AMBIGUOUS, source_image, named_dest_images) for source_image in named_source_images)
+            continue
+        source_image, = named_source_images
+        active_dest_images = [image for image in named_dest_images if image["status"] == "active"]
+        matching = [image for image in active_dest_images if has_same_data(source_image, image)]
+        if len(matching) > 0:
+            others = [image for image in named_dest_images if image["id"] != matching[0]["id"]]
+            plan.append((UNCHANGED, source_image, [matching[0]] + others))
+        else:
+            plan.append((CHANGED if len(named_dest_images) > 0 else MISSING, source_image, named_dest_images))
+    return plan
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import stat
+import tempfile
+from typing import Any, Callable, Dict, Optional
+
+from keystoneclient import access
+
+from openstacktools._helpers import null_op
+
+DEFAULT_EXPIRY_MARGIN = 10 * 60
+
+_KEY_PROPERTIES = ["auth_url", "username", "user_id", "user_domain_id", "user_domain_name", "project_name",
+                   "project_id", "project_domain_name", "project_domain_id"]
+
+
+def get_token_cache_key(auth_kwargs: Dict[str, Any], **endpoint_filter: Any) -> str:
+    """
+    Gets the key under which the authentication for the given credentials is cached. The key includes a hash of the
+    password, so that a token is not used once the password has changed (the password itself is never written to the
+    cache).
+    :param auth_kwargs: the keyword arguments used to create the Keystone session
+    :param endpoint_filter: the service type, interface and region used to find the image endpoint
+    :return: the cache key
+    """
+    identity = {key: auth_kwargs.get(key) for key in _KEY_PROPERTIES}
+    identity["secret"] = hashlib.sha256((auth_kwargs.get("password") or "").encode("utf-8")).hexdigest()
+    identity.update(endpoint_filter)
+    return hashlib.sha256(json.dumps(identity, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class CachedAuthentication(object):
+    """
+    Result of a previous authentication with Keystone.
+    """
+    def __init__(self, v2_auth_url: Optional[str], v3_auth_url: Optional[str], access_info: Optional[access.AccessInfo],
+                 endpoint: Optional[str]):
+        self.v2_auth_url = v2_auth_url
+        self.v3_auth_url = v3_auth_url
+        self.access_info = access_info
+        self.endpoint = endpoint
+
+
+class TokenCache(object):
+    """
+    On-disk cache of the auth URLs discovered from Keystone, the token (with its service catalog) and the image endpoint
+    resolved from it, readable only by the current user. Tokens are not used once they are close to expiring.
+    """
+    def __init__(self, cache_dir: str, expiry_margin: int=DEFAULT_EXPIRY_MARGIN, log: Callable[[str], None]=null_op):
+        """
+        Constructor.
+        :param cache_dir: the directory to cache in, which is created (readable only by the current user) if it does
+        not exist
+        :param expiry_margin: seconds before a token expires from which it is no longer used
+        :param log: output for cache entries that are ignored
+        :raises PermissionError: if the directory exists but other users can access it
+        """
+        try:
+            os.mkdir(cache_dir, 0o700)
+            # the mode given to mkdir is limited by the umask
+            os.chmod(cache_dir, 0o700)
+        except FileExistsError:
+            mode = os.stat(cache_dir).st_mode
+            if not stat.S_ISDIR(mode):
+                raise NotADirectoryError("Token cache path %s exists but is not a directory" % cache_dir)
+            if mode & (stat.S_IRWXG | stat.S_IRWXO):
+                raise PermissionError("Token cache directory %s can be accessed by other users (mode %o): not caching "
+                                      "tokens in it" % (cache_dir, stat.S_IMODE(mode)))
+        self.cache_dir = cache_dir
+        self.expiry_margin = expiry_margin
+        self.log = log
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, "%s.json" % key)
+
+    def lookup(self, key: str) -> Optional[CachedAuthentication]:
+        """
+        Looks up the cached authentication with the given key.
+        :param key: the cache key
+        :return: the cached authentication, without the token if it is close to expiring, or `None` if nothing usable
+        is cached
+        """
+        try:
+            with open(self.get_path(key)) as cache_file:
+                entry = json.load(cache_file)
+            access_dict = {key: value for key, value in entry["access"].items() if key != "auth_token"}
+            access_info = access.AccessInfo.factory(auth_token=entry["auth_token"], **access_dict)
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError, NotImplementedError) as e:
+            self.log("WARNING: ignoring unreadable token cache entry %s: %s" % (self.get_path(key), e))
+            return None
+        if access_info.will_expire_soon(self.expiry_margin):
+            access_info = None
+        return CachedAuthentication(entry.get("v2_auth_url"), entry.get("v3_auth_url"), access_info,
+                                    entry.get("endpoint"))
+
+    def store(self, key: str, authentication: CachedAuthentication):
+        """
+        Stores the given authentication in the cache.
+        :param key: the cache key
+        :param authentication: the authentication to store
+        """
+        entry = {
+            "v2_auth_url": authentication.v2_auth_url,
+            "v3_auth_url": authentication.v3_auth_url,
+            "auth_token": authentication.access_info.auth_token,
+            "access": dict(authentication.access_info),
+            "endpoint": authentication.endpoint
+        }
+        # mkstemp creates the file readable and writable only by the current user
+        file_descriptor, temp_path = tempfile.mkstemp(prefix="%s." % key, suffix=".tmp", dir=self.cache_dir)
+        try:
+            with os.fdopen(file_descriptor, "w") as cache_file:
+                json.dump(entry, cache_file, default=str)
+            os.replace(temp_path, self.get_path(key))
+        except BaseException:
+            os.remove(temp_path)
+            raise
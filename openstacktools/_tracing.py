@@ -0,0 +1,187 @@
+import json
+import math
+import re
+import sys
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+DEFAULT_SLOWEST_CALLS = 10
+PERCENTILES = [50, 90, 99]
+
+IDENTITY_SERVICE = "identity"
+IMAGE_SERVICE = "image"
+
+# path segments that identify a particular resource (e.g. the UUID of an image, or the hex ID of a project)
+_IDENTIFIER_PATTERN = re.compile(r"^([0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+                                 r"|[0-9a-fA-F]{32})$")
+# collections whose members are identified by the path segment that follows them (images are also looked up by name)
+_COLLECTIONS = {"images", "tags", "members", "projects", "users", "domains"}
+# segments that follow collections without identifying a member (e.g. v1's /images/detail)
+_COLLECTION_VIEWS = {"detail"}
+
+
+def get_url_template(url: str) -> str:
+    """
+    Gets the template of the given URL, so that calls to the same API can be grouped: the path, with identifiers
+    replaced by "{id}", followed by the names (but not the values) of any query parameters.
+    :param url: the URL
+    :return: the template (e.g. "/v2/images/{id}/file" or "/v2/images?limit&marker")
+    """
+    parts = urlsplit(url)
+    segments = parts.path.split("/")
+    path = "/".join("{id}" if _is_identifier(segment, segments[index - 1] if index > 0 else None) else segment
+                    for index, segment in enumerate(segments))
+    parameters = sorted(set(name for name, _ in parse_qsl(parts.query, keep_blank_values=True)))
+    return path + ("?%s" % "&".join(parameters) if len(parameters) > 0 else "")
+
+
+def _is_identifier(segment: str, previous_segment: Optional[str]) -> bool:
+    if segment == "":
+        return False
+    return _IDENTIFIER_PATTERN.match(segment) is not None \
+        or (previous_segment in _COLLECTIONS and segment not in _COLLECTION_VIEWS)
+
+
+def get_percentile(sorted_values: List[float], percentile: float) -> float:
+    """
+    Gets the given percentile of some values (using the nearest rank).
+    :param sorted_values: the values, in ascending order
+    :param percentile: the percentile (between 0 and 100)
+    :return: the value at the percentile
+    """
+    rank = max(int(math.ceil(percentile / 100.0 * len(sorted_values))), 1)
+    return sorted_values[rank - 1]
+
+
+class _SessionTrace(object):
+    """
+    Response hook recording the calls made through the requests session of one client.
+    """
+    def __init__(self, tracer: "ApiCallTracer", client_name: str):
+        self.tracer = tracer
+        self.client_name = client_name
+        # calls to URLs under the image endpoint are to glance; any others are to keystone
+        self.image_endpoint = None  # type: Optional[str]
+
+    def __call__(self, response, *args, **kwargs):
+        request = response.request
+        service = IMAGE_SERVICE if self.image_endpoint is not None \
+            and response.url.startswith(self.image_endpoint.rstrip("/")) else IDENTITY_SERVICE
+        self.tracer.record(client=self.client_name, service=service, method=request.method,
+                           url=get_url_template(response.url), status=response.status_code,
+                           seconds=response.elapsed.total_seconds(), request_bytes=_get_request_size(request),
+                           response_bytes=_get_response_size(response))
+        return response
+
+
+def _get_request_size(request) -> Optional[int]:
+    if request.body is None:
+        return 0
+    if isinstance(request.body, (bytes, str)):
+        return len(request.body)
+    # streamed (chunked) bodies are only sized if a length was given up front
+    content_length = request.headers.get("Content-Length")
+    return int(content_length) if content_length is not None else None
+
+
+def _get_response_size(response) -> Optional[int]:
+    content_length = response.headers.get("Content-Length")
+    return int(content_length) if content_length is not None else None
+
+
+class ApiCallTracer(object):
+    """
+    Records every call made to Glance and Keystone through the clients that it is hooked into, writing each as a line
+    of JSON, and summarises the latency of the calls at the end of a run.
+
+    The latency of a call is the time until its response headers arrived, so it includes the upload of a request body
+    but not the download of a streamed response body (such as image data). Sizes are those of the bodies, where known.
+    """
+    def __init__(self, path: str):
+        """
+        Constructor.
+        :param path: the path of the file to write the calls to, as JSON lines
+        """
+        self.path = path
+        self.calls = []    # type: List[Dict[str, Any]]
+        self._lock = Lock()
+        self._trace_file = open(path, "w")
+
+    def create_hook(self, client_name: str) -> _SessionTrace:
+        """
+        Creates a hook that traces the calls made through a requests session once added to its response hooks.
+        :param client_name: the name of the client the session belongs to
+        :return: the hook, whose `image_endpoint` should be set once the endpoint is known
+        """
+        return _SessionTrace(self, client_name)
+
+    def record(self, **call: Any):
+        """
+        Records a call.
+        :param call: the details of the call
+        """
+        call = OrderedDict([("time", datetime.now(timezone.utc).isoformat())] + list(call.items()))
+        with self._lock:
+            self.calls.append(call)
+            if not self._trace_file.closed:
+                self._trace_file.write(json.dumps(call) + "\n")
+
+    def close(self):
+        with self._lock:
+            self._trace_file.close()
+
+    def summarise(self, slowest: int=DEFAULT_SLOWEST_CALLS) -> List[str]:
+        """
+        Summarises the calls recorded so far: the number of calls to each API and percentiles of their latencies,
+        followed by the slowest individual calls.
+        :param slowest: the number of slowest calls to list
+        :return: the lines of the summary
+        """
+        with self._lock:
+            calls = list(self.calls)
+        by_api = OrderedDict()    # type: Dict[Tuple[str, str, str], List[Dict[str, Any]]]
+        for call in calls:
+            by_api.setdefault((call["service"], call["method"], call["url"]), []).append(call)
+
+        lines = ["%d API %s traced to %s" % (len(calls), "call" if len(calls) == 1 else "calls", self.path)]
+        if len(calls) == 0:
+            return lines
+        lines.append("%-8s %-6s %-40s %6s %6s %s %9s %9s" % (
+            "service", "method", "url", "calls", "errors",
+            " ".join("%9s" % ("p%d (ms)" % percentile) for percentile in PERCENTILES), "max (ms)", "MiB"))
+        for (service, method, url), api_calls in sorted(by_api.items(), key=lambda item: -sum(
+                call["seconds"] for call in item[1])):
+            latencies = sorted(call["seconds"] for call in api_calls)
+            transferred = sum((call["request_bytes"] or 0) + (call["response_bytes"] or 0) for call in api_calls)
+            lines.append("%-8s %-6s %-40s %6d %6d %s %9.1f %9.1f" % (
+                service, method, url, len(api_calls), sum(1 for call in api_calls if call["status"] >= 400),
+                " ".join("%9.1f" % (get_percentile(latencies, percentile) * 1000) for percentile in PERCENTILES),
+                latencies[-1] * 1000, transferred / 1024 / 1024))
+
+        lines.append("slowest calls:")
+        for call in sorted(calls, key=lambda call: -call["seconds"])[:slowest]:
+            lines.append("%9.1f ms\t%s\t%s\t%s\t%s" % (call["seconds"] * 1000, call["status"], call["method"],
+                                                      call["url"], call["client"]))
+        return lines
+
+
+@contextmanager
+def traced(path: Optional[str]) -> Iterator[Optional[ApiCallTracer]]:
+    """
+    Traces the API calls made in the `with` block, printing a summary of them to stderr at the end.
+    :param path: the path of the file to write the calls to, as JSON lines (`None` to not trace)
+    :return: the tracer to trace clients with (`None` if not tracing)
+    """
+    if path is None:
+        yield None
+        return
+    tracer = ApiCallTracer(path)
+    try:
+        yield tracer
+    finally:
+        tracer.close()
+        print("\n".join(tracer.summarise()), file=sys.stderr)
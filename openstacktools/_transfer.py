@@ -0,0 +1,141 @@
+import time
+from queue import Empty, Full, Queue
+from threading import Thread
+from typing import Iterable, Iterator
+
+DEFAULT_FAN_OUT_QUEUE_DEPTH = 16
+DEFAULT_READ_AHEAD_DEPTH = 16
+# the longest to wait for the reading thread of a read-ahead to stop once it has been closed
+DEFAULT_CLOSE_TIMEOUT = 10.0
+
+_END_OF_DATA = None
+_POLL_INTERVAL = 0.1
+
+
+class _SourceFailure(object):
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+class FanOut(object):
+    """
+    Feeds the chunks of a single stream of data to several consumers, each through its own bounded queue, so that
+    the slowest consumer holds back the producer rather than the queues growing without limit. A consumer that fails
+    is abandoned and no longer holds back the others.
+
+    The time the producer spends waiting for the consumers to make room and the time each consumer spends waiting for
+    the producer to supply data is recorded, showing which side is the bottleneck.
+    """
+    def __init__(self, consumers: int, queue_depth: int=DEFAULT_FAN_OUT_QUEUE_DEPTH):
+        self._queues = [Queue(maxsize=queue_depth) for _ in range(consumers)]
+        self._abandoned = [False] * consumers
+        self.producer_wait_seconds = 0.0
+        self.consumer_wait_seconds = [0.0] * consumers
+
+    def feed(self, data: Iterable[bytes]):
+        """
+        Feeds the given data to all consumers that have not been abandoned, returning once it has been exhausted or
+        all consumers have been abandoned. If reading the data fails, `fail` must be called to release the consumers.
+        :param data: the data
+        """
+        for chunk in data:
+            if all(self._abandoned):
+                return
+            for index in range(len(self._queues)):
+                self._put(index, chunk)
+        for index in range(len(self._queues)):
+            self._put(index, _END_OF_DATA)
+
+    def fail(self, error: Exception):
+        """
+        Signals to all consumers that the data could not be read.
+        :param error: the reason the data could not be read
+        """
+        for index in range(len(self._queues)):
+            self._put(index, _SourceFailure(error))
+
+    def consume(self, index: int) -> Iterator[bytes]:
+        """
+        Consumes the data fed to the consumer with the given index.
+        :param index: the index of the consumer
+        :return: iterator over the data
+        """
+        while True:
+            started = time.monotonic()
+            chunk = self._queues[index].get()
+            self.consumer_wait_seconds[index] += time.monotonic() - started
+            if chunk is _END_OF_DATA:
+                return
+            if isinstance(chunk, _SourceFailure):
+                raise IOError("Failed to read source data: %s" % chunk.error)
+            yield chunk
+
+    def abandon(self, index: int):
+        """
+        Abandons the consumer with the given index, so that no more data is fed to it.
+        :param index: the index of the consumer
+        """
+        self._abandoned[index] = True
+        try:
+            while True:
+                self._queues[index].get_nowait()
+        except Empty:
+            pass
+
+    def _put(self, index: int, item):
+        started = time.monotonic()
+        try:
+            while not self._abandoned[index]:
+                try:
+                    self._queues[index].put(item, timeout=_POLL_INTERVAL)
+                    return
+                except Full:
+                    pass
+        finally:
+            self.producer_wait_seconds += time.monotonic() - started
+
+
+class ReadAhead(object):
+    """
+    Reads data on a separate thread, up to a bounded number of chunks ahead of its consumer, so that a stall in reading
+    the data does not leave the consumer idle and vice versa. `close` must be called once the consumer has finished.
+    """
+    def __init__(self, data: Iterable[bytes], queue_depth: int=DEFAULT_READ_AHEAD_DEPTH):
+        self._fan_out = FanOut(1, queue_depth)
+        self._thread = Thread(target=self._read, args=(data, ), daemon=True)
+        self._thread.start()
+
+    @property
+    def reader_wait_seconds(self) -> float:
+        """
+        Time the reading thread has spent waiting for the consumer to make room for more data.
+        """
+        return self._fan_out.producer_wait_seconds
+
+    @property
+    def consumer_wait_seconds(self) -> float:
+        """
+        Time the consumer has spent waiting for data to be read.
+        """
+        return self._fan_out.consumer_wait_seconds[0]
+
+    def __iter__(self) -> Iterator[bytes]:
+        return self._fan_out.consume(0)
+
+    def close(self, timeout: float=DEFAULT_CLOSE_TIMEOUT) -> bool:
+        """
+        Stops reading ahead (if the data has not been read to the end) and waits for the reading thread to finish. The
+        thread cannot be interrupted while it is reading (e.g. from a hung connection), so it is left to finish in the
+        background if it has not within the timeout.
+        :param timeout: the longest to wait for the thread to finish in seconds
+        :return: whether the thread has finished
+        """
+        self._fan_out.abandon(0)
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _read(self, data: Iterable[bytes]):
+        try:
+            self._fan_out.feed(data)
+        except Exception as e:
+            self._fan_out.fail(e)
@@ -0,0 +1,105 @@
+"""
+Library API for copying and deleting glance images, for use from other Python programs.
+
+The functions take glance clients that have already been authenticated (e.g. with a keystoneauth session the caller
+manages), return result objects rather than printing, and raise the errors in `openstacktools._errors` (all subclasses
+of `OpenStackToolsError`) rather than exiting. glancecp, glancesync and glancenuke are thin wrappers around the same
+code.
+
+Example:
+    from glanceclient import Client
+    from openstacktools import api
+
+    result = api.copy_image(Client("2", session=source_session), "ubuntu-22.04", Client("2", session=dest_session),
+                            duplicate_name_strategy="replace")
+    api.delete_images(Client("2", session=dest_session), result.replaced_image_ids).raise_for_failures()
+"""
+
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Tuple, Union
+
+from openstacktools._catalog import ImageCatalog
+from openstacktools._copy import CopyOptions, CopyResult, DEDUP_POLICIES, DESTINATION_OPTIONS, \
+    DUPLICATE_NAME_STRATEGIES, ImageCopier, find_images_by_name
+from openstacktools._delete import DeletionResult, ImageDeletion
+from openstacktools._delete import delete_images as _delete_images
+from openstacktools._errors import AmbiguousImageNameError, ChecksumMismatchError, DuplicateImageNameError, \
+    ImageNotFoundError, ImageOperationError, ImagesNotDeletedError, ImageTransferError, OpenStackToolsError
+from openstacktools._helpers import null_op
+from openstacktools._metrics import Metrics
+from openstacktools._retry import RetryPolicy
+
+if TYPE_CHECKING:
+    from glanceclient import Client
+
+__all__ = ["copy_image", "copy_image_to_destinations", "delete_images", "find_images_by_name", "CopyOptions",
+           "CopyResult", "DeletionResult", "ImageCatalog", "ImageCopier", "ImageDeletion", "DUPLICATE_NAME_STRATEGIES",
+           "DEDUP_POLICIES", "DESTINATION_OPTIONS", "OpenStackToolsError", "ImageNotFoundError",
+           "AmbiguousImageNameError", "DuplicateImageNameError", "ImageOperationError", "ImageTransferError",
+           "ChecksumMismatchError", "ImagesNotDeletedError"]
+
+
+def copy_image(source_client: "Client", source_id_or_name: str, dest_client: "Client", dest_name: str="",
+               options: CopyOptions=None, metrics: Metrics=None, log: Callable[[str], None]=null_op,
+               **option_overrides) -> CopyResult:
+    """
+    Copies an image from one glance to another.
+    :param source_client: authenticated client of the glance that has the image
+    :param source_id_or_name: the identifier or (unique) name of the image
+    :param dest_client: authenticated client of the glance to copy the image to
+    :param dest_name: the name of the copy ("" for that of the source image)
+    :param options: the options to copy with (the defaults if not given)
+    :param metrics: record of the timings of the copy
+    :param log: output for what is being done (nothing is output by default)
+    :param option_overrides: options to set, overriding those given (e.g. `duplicate_name_strategy="replace"`)
+    :return: the result of the copy
+    :raises OpenStackToolsError: if the copy fails
+    """
+    copier = ImageCopier(_get_options(options, option_overrides), metrics=metrics, log=log)
+    return copier.copy_image(source_client, source_id_or_name, dest_client, dest_name)
+
+
+def copy_image_to_destinations(source_client: "Client", source_id_or_name: str,
+                               destinations: List[Union[Tuple["Client", str], Tuple["Client", str, Dict[str, Any]]]],
+                               options: CopyOptions=None,
+                               metrics: Metrics=None, log: Callable[[str], None]=null_op,
+                               **option_overrides) -> List[Union[CopyResult, Exception]]:
+    """
+    Copies an image from one glance to several others, downloading it only once.
+    :param source_client: authenticated client of the glance that has the image
+    :param source_id_or_name: the identifier or (unique) name of the image
+    :param destinations: the authenticated clients of the glances to copy the image to, each with the name of the
+    copy ("" for that of the source image) and optionally a dictionary of the options to set for that destination
+    alone (those of `DESTINATION_OPTIONS`, e.g. `{"duplicate_name_strategy": "replace"}`)
+    :param options: the options to copy with to every destination (the defaults if not given)
+    :param metrics: record of the timings of the copies
+    :param log: output for what is being done (nothing is output by default)
+    :param option_overrides: options to set, overriding those given
+    :return: for each destination (in the order given), the result of its copy or the error that stopped it
+    :raises OpenStackToolsError: if the source image cannot be found
+    :raises ValueError: if options other than `DESTINATION_OPTIONS` (or invalid options) are given for a destination
+    """
+    copier = ImageCopier(_get_options(options, option_overrides), metrics=metrics, log=log)
+    return copier.fan_out_copy(source_client, source_id_or_name, destinations)
+
+
+def delete_images(client: "Client", images: Iterable[Union[str, Tuple[str, str]]], max_simultaneous_deletes: int=5,
+                  retries: int=0, log: Callable[[str], None]=null_op, **kwargs) -> DeletionResult:
+    """
+    Deletes images from glance, checking afterwards whether those whose deletes failed still exist.
+    :param client: authenticated client of the glance that has the images
+    :param images: the identifiers of the images to delete, or tuples of their identifiers and names
+    :param max_simultaneous_deletes: the maximum number of deletes to request simultaneously
+    :param retries: the number of times to retry deletes that fail with a transient error
+    :param log: output for errors (nothing is output by default)
+    :param kwargs: further arguments of `openstacktools._delete.delete_images` (e.g. `retry_policy`)
+    :return: the result of the deletes, whose `raise_for_failures` raises `ImagesNotDeletedError` if any of the images
+    still exist
+    """
+    if "retry_policy" not in kwargs:
+        kwargs["retry_policy"] = RetryPolicy(retries)
+    return _delete_images(client, images, max_simultaneous_deletes=max_simultaneous_deletes, log=log, **kwargs)
+
+
+def _get_options(options: CopyOptions, option_overrides: dict) -> CopyOptions:
+    return (options if options is not None else CopyOptions()).replace(**option_overrides)
+
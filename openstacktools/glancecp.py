@@ -46,24 +46,35 @@ Copies images from one OpenStack glance environment to another.
 """
 
 import argparse
-import copy
-import io
 import os.path
-import random
 import re
+import shlex
 import sys
 import traceback
+from concurrent.futures import ThreadPoolExecutor, wait
 from configparser import ConfigParser
-
-from glanceclient import exc
-from glanceclient.common import utils
-from oslo_utils import encodeutils
-
-from openstacktools._arguments import add_openstack_args
-from openstacktools._client import create_authenticated_client
+from contextlib import contextmanager
+
+from openstacktools._arguments import add_image_index_args, add_openstack_args, get_env, resolve_openstack_args
+from openstacktools._cache import DEFAULT_CACHE_SIZE
+from openstacktools._copy import DEFAULT_CHUNK_SIZE, DEFAULT_PROPERTIES, DEFAULT_UPLOAD_RETRIES, \
+    DEDUP_POLICIES, DUPLICATE_NAME_STRATEGIES, CopyOptions, CopyResult, ImageCopier, \
+    set_transfer_chunk_size
+from openstacktools._helpers import parse_size
+from openstacktools._metrics import DEFAULT_PROGRESS_INTERVAL, Metrics
+from openstacktools._profiling import profiled
+from openstacktools._segments import DEFAULT_SEGMENT_SIZE
+from openstacktools._spool import DEFAULT_CHECKPOINT_INTERVAL
+from openstacktools._tracing import traced
+from openstacktools._transfer import DEFAULT_FAN_OUT_QUEUE_DEPTH, DEFAULT_READ_AHEAD_DEPTH
 
 
 class GlanceCPShell(object):
+    def __init__(self):
+        self.copier = None
+        self.metrics = Metrics("glancecp")
+        self.tracer = None
+
     def load_config(self, config_file):
         if os.path.isfile(config_file):
             config = ConfigParser(default_section="common")
@@ -100,14 +111,13 @@ class GlanceCPShell(object):
 
         raise ValueError("Failed to parse specification [%s]" % spec)
 
-    def parse_args(self, argv, initial=True, source_env="", dest_env="", config=ConfigParser()):
+    def parse_args(self, argv):
         parser = argparse.ArgumentParser(
             prog="glancecp",
             description=__doc__.strip(),
-            add_help=(not initial),
             formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
-        parser.add_argument("source", help='''
+        parser.add_argument("source", nargs="?", help='''
                A specification of the source image, in the format
                [<os_environment>:]<image_id|image_name>, where <os_environment>
                names an OpenStack environment from which to copy the source image
@@ -115,16 +125,94 @@ class GlanceCPShell(object):
                can optionally be single or double-quoted.
         ''')
 
-        parser.add_argument("dest", help='''
+        parser.add_argument("dest", nargs="*", help='''
                A specification of the destination image, in the format
                [<os_environment>:]<image_id|image_name>, where <os_environment>
                names an OpenStack environment from which to copy the source image
                which must match the regex [a-zA-Z0-9_.-]+ and <image_id|image_name>
-               can optionally be single or double-quoted.
+               can optionally be single or double-quoted. Several destinations
+               can be given, in which case the source image is downloaded once
+               and uploaded to all of them concurrently.
+        ''')
+
+        parser.add_argument("--copy",
+                            nargs=2,
+                            action="append",
+                            default=[],
+                            metavar=("SOURCE", "DEST"),
+                            help='''
+               A pair of source and destination specifications (in the same
+               format as the positional arguments) to copy in batch mode. May
+               be given multiple times.
+        ''')
+
+        parser.add_argument("--manifest",
+                            help='''
+               Path to a file listing copies to make in batch mode, one per
+               line as a source specification followed by one or more
+               destination specifications, separated by whitespace. Specifications
+               containing whitespace must be quoted. Blank lines and lines
+               starting with '#' are ignored.
+        ''')
+
+        self.add_copy_args(parser)
+        return parser.parse_args(argv)
+
+    def add_copy_args(self, parser):
+        parser.add_argument("--fan-out-queue-depth",
+                            dest="fan_out_queue_depth",
+                            type=int,
+                            default=DEFAULT_FAN_OUT_QUEUE_DEPTH,
+                            help='''
+               Maximum number of chunks buffered for each destination when
+               copying to several destinations. The slowest destination
+               holds back the download once its buffer is full.
+        ''')
+
+        parser.add_argument("--read-ahead",
+                            dest="read_ahead",
+                            type=int,
+                            default=DEFAULT_READ_AHEAD_DEPTH,
+                            help='''
+               Maximum number of chunks to download ahead of the upload, on a
+               separate thread, so that a stall on one side does not leave
+               the other idle (0 to download and upload in lockstep). The
+               time each side spent waiting for the other is reported.
+        ''')
+
+        parser.add_argument("--segments",
+                            dest="segments",
+                            type=int,
+                            default=1,
+                            help='''
+               Number of byte-range segments of the source image to download
+               at once, over separate connections, if the source supports
+               HTTP Range requests (the v2 image API is needed). Otherwise the
+               source image is downloaded in a single stream.
+        ''')
+
+        parser.add_argument("--segment-size",
+                            dest="segment_size",
+                            type=parse_size,
+                            default=DEFAULT_SEGMENT_SIZE,
+                            help='''
+               Size of each segment (in bytes, or with a K, M, G or T suffix)
+               when downloading in segments. Unless spooling, up to this many
+               bytes are buffered in memory for each segment downloaded ahead
+               of the one being uploaded.
+        ''')
+
+        parser.add_argument("--parallel-copies",
+                            dest="parallel_copies",
+                            type=int,
+                            default=1,
+                            help='''
+               Maximum number of copies to run in parallel in batch (or sync)
+               mode.
         ''')
 
         parser.add_argument("--config",
-                            default=utils.env('GLANCECP_CONFIG_FILE', default="glancecp.config"),
+                            default=get_env('GLANCECP_CONFIG_FILE', default="glancecp.config"),
                             help='''
                Path to an INI-style config file (or '-' to read configuration from
                standard input).
@@ -153,7 +241,7 @@ class GlanceCPShell(object):
         ''')
 
         parser.add_argument("--properties",
-                            default="min_disk,min_ram",
+                            default=",".join(DEFAULT_PROPERTIES),
                             help='''
                Comma-delimited list of properties to copy from the source
                image to the destination image. Note that some properties
@@ -163,7 +251,7 @@ class GlanceCPShell(object):
 
         parser.add_argument("--duplicate-name-strategy",
                             default="none",
-                            choices=["none", "allow", "replace", "rename"],
+                            choices=DUPLICATE_NAME_STRATEGIES,
                             help='''
                Strategy for handling duplicate names at destination:
                  - "none":    Do not allow duplicate names, copying will fail
@@ -181,8 +269,147 @@ class GlanceCPShell(object):
         parser.add_argument("--duplicate_name_strategy",
                             help=argparse.SUPPRESS)
 
-        add_openstack_args(parser, source_env, config, prefix="source")
-        add_openstack_args(parser, dest_env, config, prefix="dest")
+        parser.add_argument("--dedup",
+                            default="none",
+                            choices=DEDUP_POLICIES,
+                            help='''
+               What to do when the destination already has an active image
+               with the same data as the source image (going by its size and
+               checksums, which glance is asked to filter by):
+                 - "none":   Copy the image anyway.
+                 - "reuse":  Use the existing image as the copy, as it is.
+                 - "rename": Rename the existing image to the destination
+                             name (other images with that name are handled
+                             according to --duplicate-name-strategy).
+                 - "tag":    Tag the existing image with the destination
+                             name, keeping its own name.
+               Only destinations with the v2 image API are checked.
+        ''')
+
+        parser.add_argument("--chunk-size", "--buffer-size",
+                            dest="chunk_size",
+                            type=parse_size,
+                            default=DEFAULT_CHUNK_SIZE,
+                            help='''
+               Size (in bytes, or with a K, M, G or T suffix) of the chunks
+               in which image data is downloaded from the source and of the
+               buffer used to stream it to the destination.
+        ''')
+
+        parser.add_argument("--no-verify-checksum",
+                            dest="verify_checksum",
+                            action="store_false",
+                            default=True,
+                            help='''
+               Do not verify the checksums of the copied data against those
+               of the source image and those reported by the destination.
+               By default, the MD5 checksum and the digest in the source
+               image's os_hash_algo are calculated (on a separate thread)
+               as the data is transferred, and the destination image is
+               deleted if either does not match.
+        ''')
+
+        parser.add_argument("--progress-interval",
+                            dest="progress_interval",
+                            type=float,
+                            default=DEFAULT_PROGRESS_INTERVAL,
+                            help='''
+               Number of seconds between reports of the progress,
+               throughput and estimated time remaining of each transfer
+               (0 to disable progress reports).
+        ''')
+
+        parser.add_argument("--metrics-json",
+                            dest="metrics_json",
+                            help='''
+               Path of a file to write metrics about the run to as JSON,
+               including the time taken by each phase (authentication,
+               lookup, duplicate handling, creation, transfer and
+               deletion) and the throughput of each transfer.
+        ''')
+
+        parser.add_argument("--profile",
+                            dest="profile",
+                            help='''
+               Path of a file to write a profile of the run to (covering
+               every thread), in the format read by Python's pstats module
+               (e.g. 'python -m pstats <path>').
+        ''')
+
+        parser.add_argument("--trace",
+                            dest="trace",
+                            help='''
+               Path of a file to write a trace of every Glance and Keystone
+               API call to, as JSON lines recording the method, URL template,
+               status, latency and bytes of each call. A summary of the
+               latency percentiles of each API and of the slowest calls is
+               printed at the end of the run.
+        ''')
+
+        parser.add_argument("--cache-dir",
+                            dest="cache_dir",
+                            help='''
+               Directory in which to cache the data of source images, keyed
+               by their checksums. Data is added to the cache as it is
+               downloaded and, when a source image is already in the cache,
+               it is uploaded from there instead of being downloaded again.
+        ''')
+
+        parser.add_argument("--cache-size",
+                            dest="cache_size",
+                            type=parse_size,
+                            default=DEFAULT_CACHE_SIZE,
+                            help='''
+               Maximum size of the cache (in bytes, or with a K, M, G or T
+               suffix), beyond which the least recently used images are
+               evicted.
+        ''')
+
+        parser.add_argument("--spool-dir",
+                            dest="spool_dir",
+                            help='''
+               Directory in which to spool the source image data before
+               uploading it to the destination. If the copy fails, the
+               spooled data and the destination image are kept and running
+               the same copy again with the same spool directory resumes it:
+               the download continues from its last checkpoint (using HTTP
+               Range requests if the source supports them) and only the
+               upload is retried.
+        ''')
+
+        parser.add_argument("--checkpoint-interval",
+                            dest="checkpoint_interval",
+                            type=parse_size,
+                            default=DEFAULT_CHECKPOINT_INTERVAL,
+                            help='''
+               Number of bytes (or size with a K, M, G or T suffix) to spool
+               between checkpoints.
+        ''')
+
+        parser.add_argument("--upload-retries",
+                            dest="upload_retries",
+                            type=int,
+                            default=DEFAULT_UPLOAD_RETRIES,
+                            help='''
+               Number of times to retry uploading spooled data to the
+               destination before giving up (only used with '--spool-dir').
+        ''')
+
+        add_image_index_args(parser)
+
+        parser.add_argument("--token-cache-dir",
+                            dest="token_cache_dir",
+                            help='''
+               Directory in which to cache Keystone tokens, the service
+               catalog and the image endpoints (readable only by the current
+               user), so that later runs can skip authentication until the
+               cached token is close to expiring.
+        ''')
+
+        # the defaults of the OpenStack arguments depend on the environments in the specifications, so they are
+        # resolved for each environment once the arguments have been parsed (see resolve_env_args)
+        add_openstack_args(parser, "<os_environment>", prefix="source", resolve_defaults=False)
+        add_openstack_args(parser, "<os_environment>", prefix="dest", resolve_defaults=False)
 
         parser.add_argument('--insecure', default=False,
                             help='''
@@ -195,228 +422,189 @@ class GlanceCPShell(object):
         parser.add_argument('--timeout', default=False,
                             help="Set request timeout (in seconds).")
 
-        if initial:
-            argv_copy = copy.deepcopy(argv)
-            args, extra = parser.parse_known_args(argv_copy)
-            return args
-        else:
-            return parser.parse_args(argv)
+    def resolve_env_args(self, args, source_env, dest_env, config):
+        args = resolve_openstack_args(args, source_env, config, prefix="source")
+        return resolve_openstack_args(args, dest_env, config, prefix="dest")
 
-    def authenticate_client(self, source_or_dest, env_name, args):
+    def authenticate_client(self, source_or_dest, env_name, args, connection_pool_size=None):
         os_args = {k[len(source_or_dest) + 1:]: v for k, v in vars(args).items() if
                    k.startswith("%s_os_" % source_or_dest)}
+        os_args["token_cache_dir"] = args.token_cache_dir
+        os_args["tracer"] = self.tracer
+        # pool as many connections as there can be requests at once (each segment of a download is a request)
+        os_args["connection_pool_size"] = connection_pool_size or \
+            args.parallel_copies * (args.segments if source_or_dest == "source" else 1)
+        from openstacktools._client import create_authenticated_client
         return create_authenticated_client(os_args, source_or_dest)
 
-    def random_suffix(self):
-        return '%08x' % random.randrange(16**8)
+    def get_copy_specifications(self, args):
+        copies = []
+        if args.source is not None or len(args.dest) > 0:
+            if args.source is None or len(args.dest) == 0:
+                raise ValueError("Both a source and a destination specification are required")
+            copies.append((args.source, args.dest))
+        copies.extend((source, [dest]) for source, dest in args.copy)
+        if args.manifest:
+            with open(args.manifest) as manifest:
+                for line_number, line in enumerate(manifest, 1):
+                    if line.strip() == "" or line.strip().startswith("#"):
+                        continue
+                    specifications = shlex.split(line)
+                    if len(specifications) < 2:
+                        raise ValueError("Expected a source and at least one destination specification on line %d of "
+                                         "manifest %s, got: %s" % (line_number, args.manifest, line.strip()))
+                    copies.append((specifications[0], specifications[1:]))
+        if len(copies) == 0:
+            raise ValueError("No copies specified: give a source and destination, '--copy' or '--manifest'")
+        return copies
 
     def main(self, argv):
-        # parse args initially with no help option and ignoring unknown
-        init_args = self.parse_args(argv, initial=True)
+        args = self.parse_args(argv)
 
         # attempt to load configuration
-        config = self.load_config(init_args.config)
-
-        # parse source and destination
-        source_env, source_id_or_name = self.parse_specification(init_args.source)
-        dest_env, dest_name = self.parse_specification(init_args.dest)
-
-        # parse args again, this time with help enabled
-        args = self.parse_args(argv, initial=False, source_env=source_env, dest_env=dest_env, config=config)
-
-        # authenticate glance client for source and dest environments
-        source_client, source_client_desc = self.authenticate_client("source", source_env, args)
-        dest_client, dest_client_desc = self.authenticate_client("dest", dest_env, args)
-
-        # find source image
-        source_image = None
-        try:
-            source_image = source_client.images.get(source_id_or_name)
-        except exc.HTTPNotFound:
-            found = False
-            for image in source_client.images.list():
-                if image.name == source_id_or_name:
-                    if found:
-                        utils.exit("Multiple source images were found named %s, cannot continue." % source_id_or_name)
-                    else:
-                        source_image = source_client.images.get(image.id)
-                        found = True
-        except exc.CommunicationError as ce:
-            utils.exit("Communication error while attempting to get source image: %s" % (ce))
-        except exc.HTTPInternalServerError as hise:
-            utils.exit("Internal server error while attempting to get source image: %s" % (hise))
-
-        if not source_image:
-            utils.exit("Source image not found: %s" % source_id_or_name)
-
-        # prepare destination image properties
-        dest_image_properties = {}
-
-        # copy essential properties (cannot upload without these)
-        for key in ['disk_format', 'container_format']:
-            dest_image_properties[key] = source_image[key]
-
-        # copy extra properties according to user list
-        for key in args.properties.split(','):
-            k = key.strip()
-            dest_image_properties[k] = source_image[k]
-
-        # set or copy name
-        if dest_name != "":
-            dest_image_properties['name'] = dest_name
-        else:
-            dest_image_properties['name'] = source_image['name']
-
-        # inform user we are copying
-        # TODO: only if verbose?
-        print("copying source image %s ('%s') from %s to destination image '%s' on %s" % (
-        source_image.id, source_image.name, source_client_desc, dest_image_properties['name'], dest_client_desc),
-              file=sys.stderr)
-
-        # check for duplicates and plan strategy to deal with them
-        delete_images = []
-        rename_images = []
-        image_names = {}
-        if args.duplicate_name_strategy != "allow":
-            # check for existing images by that name at destination
-            for image in dest_client.images.list():
-                if args.duplicate_name_strategy in ["rename", "replace"]:
-                    image_names[image.name] = 1
-                if image.name == dest_image_properties['name']:
-                    if args.duplicate_name_strategy == "replace":
-                        rename_images.append(image.id)
-                        delete_images.append(image.id)
-                    elif args.duplicate_name_strategy == "rename":
-                        rename_images.append(image.id)
-                    elif args.duplicate_name_strategy == "none":
-                        utils.exit("An image named '%s' is already present at "
-                                   "destination. Please change to a unique name, "
-                                   "use the '--duplicate-name-strategy=allow' "
-                                   "option to allow creation of images with "
-                                   "duplicate names, use the "
-                                   "'--duplicate-name-strategy=replace' option "
-                                   "to remove any other images with the "
-                                   "destination name, or use the "
-                                   "'--duplicate-name-strategy=rename' option "
-                                   "to rename any existing images to make them "
-                                   "unique." % dest_image_properties['name'])
-                    else:
-                        raise ValueError("Unexpected value for '--duplicate-name-strategy': %s", args.duplicate_name_strategy)
-
-        suffix = self.random_suffix()
-        for image_id in rename_images:
-            while "%s.%s" % (dest_image_properties['name'], suffix) in image_names:
-                suffix = self.random_suffix()
-            new_name = "%s.%s" % (dest_image_properties['name'], suffix)
-            print("renaming existing image %s to '%s'" % (image_id, new_name), file=sys.stderr)
+        config = self.load_config(args.config)
+
+        # parse source and destination specifications
+        copies = [(self.parse_specification(source), [self.parse_specification(dest) for dest in dests])
+                  for source, dests in self.get_copy_specifications(args)]
+        batch = args.manifest is not None or len(args.copy) > 0
+
+        self.check_copy_args(args)
+
+        with self.diagnostics(args):
             try:
-                dest_client.images.update(image_id, name=new_name)
-            except exc.CommunicationError as ce:
-                utils.exit("Communication error while attempting to rename existing image: %s" % (ce))
-            except exc.HTTPInternalServerError as hise:
-                utils.exit("Internal server error while attempting to rename existing image: %s" % (hise))
-            except exc.HTTPException as he:
-                utils.exit("HTTP error while attempting to rename: %s" % (he))
-            except Exception as e:
-                utils.exit("Failed to rename existing image (exception type %s): %s" % (type(e), e))
-
-        # create destination image
-        print("creating image at destination: %s" % (dest_image_properties['name']), file=sys.stderr)
-        try:
-            dest_image = dest_client.images.create(**dest_image_properties)
-        except exc.CommunicationError as ce:
-            utils.exit("Communication error while attempting to create image: %s" % (ce))
-        except exc.HTTPInternalServerError as hise:
-            utils.exit("Internal server error while attempting to create image: %s" % (hise))
-        except Exception as e:
-            utils.exit("Failed to create destination image (exception type %s): %s" % (type(e), e))
-
-        # copy data from source to destination
-        failure_reason = ""
-        print("copying data from source image %s to destination image %s" % (source_image.id, dest_image.id), file=sys.stderr)
-        try:
-            data = source_client.images.data(source_image.id)
-            if data is not None:
-                dest_client.images.upload(dest_image.id, data_to_upload_stream(data))
-            else:
-                print("WARNING: source image %s contained no data" % (source_image.id), file=sys.stderr)
-        except exc.CommunicationError as ce:
-            failure_reason = "Communication error while attempting to transfer image: %s" % (ce)
-        except exc.HTTPInternalServerError as hise:
-            failure_reason = "Internal server error while attempting to transfer image: %s" % (hise)
-        except Exception as ue:
-            failure_reason = "Failed to transfer image (exception type %s): %s" % (type(ue), ue)
-
-        if failure_reason != "":
+                self.run_copies(config, args, copies, batch)
+            finally:
+                if args.metrics_json:
+                    self.metrics.write_json(args.metrics_json)
+
+    @contextmanager
+    def diagnostics(self, args):
+        """
+        Profiles the run and traces the API calls made by the clients authenticated within the `with` block, if asked
+        to.
+        :param args: the parsed arguments
+        """
+        with profiled(args.profile), traced(args.trace) as tracer:
+            self.tracer = tracer
             try:
-                dest_client.images.delete(dest_image.id)
-            except exc.CommunicationError as ce:
-                utils.exit("%s. In addition, there was a communication error while attempting to delete image after upload failed: %s" % (failure_reason, ce))
-            except exc.HTTPInternalServerError as hise:
-                utils.exit("%s. In addition, there was an internal server error while attempting to delete image after upload failed: %s" % (failure_reason, hise))
-            except Exception as de:
-                utils.exit("%s. In addition, failed to delete image after upload failed (exception type %s): %s" % (failure_reason, type(de), de))
-            utils.exit(failure_reason)
-
-        # successfully created image, now delete any images scheduled for deletion (because of duplicate_name_strategy=replace)
-        for image_id in delete_images:
-            print("deleting existing image %s because it had a duplicate name" % (image_id), file=sys.stderr)
+                yield
+            finally:
+                self.tracer = None
+
+    def prepare_transfers(self, args):
+        set_transfer_chunk_size(args.chunk_size)
+        self.copier = ImageCopier(CopyOptions.from_namespace(args), self.metrics)
+
+    def check_copy_args(self, args):
+        if args.parallel_copies < 1:
+            raise ValueError("Number of parallel copies must be at least 1, not %d" % args.parallel_copies)
+        CopyOptions.from_namespace(args).check()
+
+    def copy_image(self, source_client_and_desc, source_id_or_name, dest_client_and_desc, dest_name):
+        (source_client, source_client_desc), (dest_client, dest_client_desc) = source_client_and_desc, \
+            dest_client_and_desc
+        return self.copier.copy_image(source_client, source_id_or_name, dest_client, dest_name,
+                                      source_description=source_client_desc, dest_description=dest_client_desc)
+
+    def fan_out_copy(self, source_client_and_desc, source_id_or_name, destinations):
+        from oslo_utils import encodeutils
+        source_client, source_client_desc = source_client_and_desc
+        results = self.copier.fan_out_copy(
+            source_client, source_id_or_name, [(dest_client, dest_name) for (dest_client, _), dest_name in destinations],
+            source_description=source_client_desc,
+            dest_descriptions=[dest_client_desc for (_, dest_client_desc), _ in destinations])
+        return [(True, result.dest_image_id) if isinstance(result, CopyResult)
+                else (False, encodeutils.exception_to_unicode(result)) for result in results]
+
+    def run_copies(self, config, args, copies, batch):
+        from glanceclient import exc
+        from glanceclient.common import utils
+        from oslo_utils import encodeutils
+        self.prepare_transfers(args)
+
+        # authenticate glance client for each source and dest environment once, so that they can be reused across
+        # copies (the defaults of the OpenStack arguments depend on the environment, hence resolving per environment)
+        clients = {}
+        env_args = {}
+        for (source_env, _), dests in copies:
+            for dest_env, _ in dests:
+                if (source_env, dest_env) not in env_args:
+                    env_args[(source_env, dest_env)] = self.resolve_env_args(args, source_env, dest_env, config)
+                for source_or_dest, env_name in [("source", source_env), ("dest", dest_env)]:
+                    if (source_or_dest, env_name) not in clients:
+                        with self.metrics.phase("auth", side=source_or_dest, env=env_name):
+                            clients[(source_or_dest, env_name)] = self.authenticate_client(
+                                source_or_dest, env_name, env_args[(source_env, dest_env)])
+
+        def run_copy(source_env, source_id_or_name, dests):
+            if len(dests) > 1:
+                return self.fan_out_copy(
+                    clients[("source", source_env)], source_id_or_name,
+                    [(clients[("dest", dest_env)], dest_name) for dest_env, dest_name in dests])
+            (dest_env, dest_name), = dests
             try:
-                dest_client.images.delete(image_id)
-            except exc.CommunicationError as ce:
-                utils.exit("Communication error while attempting to delete image %s with duplicate name: %s" % (image_id, ce))
-            except exc.HTTPInternalServerError as hise:
-                utils.exit("Internal server error while attempting to delete image %s with duplicate name: %s" % (image_id, hise))
-            except exc.HTTPConflict as hc:
-                utils.exit("Conflict while attempting to delete image %s with duplicate name: %s" % (image_id, hc))
+                return [(True, self.copy_image(
+                    clients[("source", source_env)], source_id_or_name, clients[("dest", dest_env)],
+                    dest_name).dest_image_id)]
             except Exception as e:
-                utils.exit("Failed to delete image %s with duplicate "
-                           "name (exception type %s): %s" % (image_id, type(e), e))
-
-        # tell the user the id of their new image
-        print(dest_image.id)
+                if not batch:
+                    raise
+                return [(False, encodeutils.exception_to_unicode(e))]
+
+        if not batch:
+            (source_env, source_id_or_name), dests = copies[0]
+            results = run_copy(source_env, source_id_or_name, dests)
+            # tell the user the id of their new image(s)
+            for succeeded, detail in results:
+                if succeeded:
+                    print(detail)
+            failures = [detail for succeeded, detail in results if not succeeded]
+            if len(failures) > 0:
+                raise exc.CommandError("Failed to copy to %d of %d destinations: %s"
+                                       % (len(failures), len(results), "; ".join(failures)))
+            return
+
+        with ThreadPoolExecutor(max_workers=args.parallel_copies) as executor:
+            futures = [executor.submit(run_copy, source_env, source_id_or_name, dests)
+                       for (source_env, source_id_or_name), dests in copies]
+        wait(futures)
+
+        # summarise the result of each copy, in the order they were specified
+        failed = 0
+        total = 0
+        for ((source_env, source_id_or_name), dests), future in zip(copies, futures):
+            for (dest_env, dest_name), (succeeded, detail) in zip(dests, future.result()):
+                total += 1
+                if not succeeded:
+                    failed += 1
+                print("%s\t%s:%s\t%s:%s\t%s" % ("OK" if succeeded else "FAILED", source_env, source_id_or_name,
+                                                 dest_env, dest_name, detail))
+        if failed > 0:
+            utils.exit("Failed to copy %d of %d images" % (failed, total))
 
 
 def debug_enabled(argv):
-    if bool(utils.env('GLANCECP_DEBUG')) is True:
+    if bool(get_env('GLANCECP_DEBUG')) is True:
         return True
     if '--debug' in argv or '-d' in argv:
         return True
     return False
 
 
-def data_to_upload_stream(data, buffer_size=io.DEFAULT_BUFFER_SIZE):
-    class UploadStream(io.RawIOBase):
-        def __init__(self, data_iter, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-            self.remaining_data = None
-            self.data_iter = data_iter
-
-        def readable(self):
-            return True
-
-        def readinto(self, b):
-            try:
-                max_chunk_size = len(b)
-                chunk = self.remaining_data or next(self.data_iter)
-                output, self.remaining_data = chunk[:max_chunk_size], chunk[max_chunk_size:]
-                b[:len(output)] = output
-                return len(output)
-            except StopIteration:
-                return 0
-
-    return io.BufferedReader(UploadStream(iter(data)), buffer_size=buffer_size)
-
-
 def main():
+    # the OpenStack client libraries take a large share of the start-up time, so they are imported where they are used
+    from oslo_utils import encodeutils
     argv = [encodeutils.safe_decode(a) for a in sys.argv[1:]]
     try:
         GlanceCPShell().main(argv)
     except KeyboardInterrupt:
+        from glanceclient.common import utils
         utils.exit('... terminating glancecp', exit_code=130)
     except Exception as e:
         if debug_enabled(argv) is True:
             traceback.print_exc()
+        from glanceclient.common import utils
         utils.exit(encodeutils.exception_to_unicode(e))
 
 
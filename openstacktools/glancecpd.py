@@ -0,0 +1,461 @@
+"""
+Runs copies and deletes of OpenStack glance images as a service, taking jobs over an HTTP API (on a TCP port or a Unix
+socket) and keeping the clients of each environment authenticated between jobs.
+"""
+
+import argparse
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from openstacktools._copy import CopyResult, ImageCopier
+from openstacktools._errors import ImageOperationError
+from openstacktools._helpers import print_error
+from openstacktools._jobs import DEFAULT_HISTORY, JobScheduler
+from openstacktools._metrics import Metrics
+from openstacktools.glancecp import GlanceCPShell, debug_enabled
+
+DEFAULT_PORT = 9393
+DEFAULT_TOKEN_REFRESH_INTERVAL = 60.0
+# copy options that can be set per job (the others, such as the cache and spool directories, are shared by every job)
+JOB_COPY_OPTIONS = ["properties", "duplicate_name_strategy", "dedup", "verify_checksum", "read_ahead", "segments",
+                    "segment_size", "upload_retries"]
+COPY_JOB = "copy"
+DELETE_JOB = "delete"
+# the longest a request may wait for a job to finish
+MAX_WAIT = 3600.0
+# seconds after which the image index of an environment is brought up to date again when used
+IMAGE_INDEX_REFRESH_INTERVAL = 60.0
+
+
+class JobRequestError(ValueError):
+    """
+    Raised when a job is requested with invalid parameters.
+    """
+
+
+class GlanceCPDaemonShell(GlanceCPShell):
+    def __init__(self):
+        super().__init__()
+        self.config = None
+        self.args = None
+        self.clients = None
+        self.scheduler = None
+        self._stopped = threading.Event()
+
+    def parse_args(self, argv):
+        parser = argparse.ArgumentParser(
+            prog="glancecpd",
+            description=__doc__.strip(),
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+        listen = parser.add_mutually_exclusive_group()
+        listen.add_argument("--listen",
+                            default="127.0.0.1:%d" % DEFAULT_PORT,
+                            metavar="[HOST:]PORT",
+                            help='''
+               Address on which to serve the HTTP API. The API is not
+               authenticated, so it should only be reachable by those
+               allowed to copy and delete images.
+        ''')
+
+        listen.add_argument("--socket",
+                            metavar="PATH",
+                            help='''
+               Path of a Unix socket on which to serve the HTTP API instead
+               of a TCP port (e.g. for use with 'curl --unix-socket').
+        ''')
+
+        parser.add_argument("--env",
+                            action="append",
+                            default=[],
+                            dest="environments",
+                            metavar="ENV",
+                            help='''
+               Environment to authenticate with on startup (may be given
+               more than once). Defaults to every section of the config
+               file. Jobs can use other environments too, which are
+               authenticated with when first used.
+        ''')
+
+        parser.add_argument("--parallel-env-jobs",
+                            dest="environment_limit",
+                            type=int,
+                            default=None,
+                            help='''
+               Maximum number of jobs to run at once that use any one
+               environment (as the source or destination of a copy, or the
+               environment of a delete). Defaults to the number of parallel
+               copies.
+        ''')
+
+        parser.add_argument("--env-limit",
+                            dest="environment_limits",
+                            action="append",
+                            default=[],
+                            metavar="ENV=JOBS",
+                            type=_parse_environment_limit,
+                            help='''
+               Maximum number of jobs to run at once that use the given
+               environment, overriding '--parallel-env-jobs' (may be given
+               more than once).
+        ''')
+
+        parser.add_argument("--parallel-deletes",
+                            dest="max_simultaneous_deletes",
+                            type=int,
+                            default=5,
+                            help="Number of deletes to request at once within each delete job.")
+
+        parser.add_argument("--token-refresh-interval",
+                            dest="token_refresh_interval",
+                            type=float,
+                            default=DEFAULT_TOKEN_REFRESH_INTERVAL,
+                            help='''
+               Seconds between checks of the tokens of the authenticated
+               clients. Tokens that would expire before the next check are
+               renewed then, rather than by the first job to need them.
+        ''')
+
+        parser.add_argument("--history",
+                            type=int,
+                            default=DEFAULT_HISTORY,
+                            help="Number of finished jobs to keep the status of.")
+
+        self.add_copy_args(parser)
+        # jobs are run by the workers of the daemon, the number of which is set as for glancecp's batch mode
+        parser.set_defaults(parallel_copies=4)
+        return parser.parse_args(argv)
+
+    def main(self, argv):
+        args = self.parse_args(argv)
+        self.config = self.load_config(args.config)
+        self.args = args
+        self.check_copy_args(args)
+        if args.max_simultaneous_deletes < 1:
+            raise ValueError("Number of parallel deletes must be at least 1, not %d" % args.max_simultaneous_deletes)
+
+        with self.diagnostics(args):
+            self.prepare_transfers(args)
+            if self.copier.catalog is not None:
+                # unlike a single run, the daemon runs long enough for others to change the images it has indexed
+                self.copier.catalog.refresh_interval = IMAGE_INDEX_REFRESH_INTERVAL
+            from openstacktools._client import ClientPool
+            self.clients = ClientPool(self.authenticate_environment, log=print_error)
+            self.scheduler = JobScheduler(args.parallel_copies, args.environment_limit,
+                                          dict(args.environment_limits), history=args.history, log=print_error)
+            server = self.create_server(args)
+            try:
+                threading.Thread(target=server.serve_forever, name="server", daemon=True).start()
+                print_error("Serving on %s" % (args.socket or "http://%s:%d" % server.server_address[:2]))
+                self.authenticate_environments(args.environments or self.config.sections() or [""])
+                threading.Thread(target=self.refresh_tokens, name="token-refresher", daemon=True).start()
+                for signal_number in (signal.SIGINT, signal.SIGTERM):
+                    signal.signal(signal_number, lambda *_: self._stopped.set())
+                self._stopped.wait()
+                print_error("Stopping: waiting for %d running jobs to finish" % self.scheduler.stats()["running"])
+            finally:
+                server.shutdown()
+                server.server_close()
+                if args.socket:
+                    os.unlink(args.socket)
+                self.scheduler.close()
+                if args.metrics_json:
+                    self.metrics.write_json(args.metrics_json)
+
+    def create_server(self, args):
+        if args.socket:
+            if os.path.exists(args.socket):
+                # left behind by a previous run that was killed
+                os.unlink(args.socket)
+            server = _UnixHTTPServer(args.socket, _RequestHandler)
+        else:
+            host, _, port = args.listen.rpartition(":")
+            server = _HTTPServer((host or "127.0.0.1", int(port)), _RequestHandler)
+        server.daemon_shell = self
+        return server
+
+    def authenticate_environment(self, env_name):
+        env_args = self.resolve_env_args(self.args, env_name, env_name, self.config)
+        with self.metrics.phase("auth", env=env_name):
+            # every environment may be the source or destination of copies (and deletes use the destination
+            # credentials), so its client pools as many connections as there can be requests from either side at once
+            client, description = self.authenticate_client(
+                "dest", env_name, env_args, connection_pool_size=self.args.parallel_copies * max(
+                    self.args.segments, self.args.max_simultaneous_deletes))
+        print_error("Authenticated with %s" % description)
+        return client, description
+
+    def authenticate_environments(self, environments):
+        from oslo_utils import encodeutils
+        def authenticate(env_name):
+            try:
+                self.clients.get(env_name)
+            except Exception as e:
+                # retried when a job first uses the environment
+                print_error("Unable to authenticate with environment '%s': %s"
+                            % (env_name, encodeutils.exception_to_unicode(e)))
+
+        if len(environments) > 0:
+            with ThreadPoolExecutor(max_workers=len(environments)) as executor:
+                list(executor.map(authenticate, environments))
+
+    def refresh_tokens(self):
+        # tokens are renewed if they would otherwise expire before the check after next
+        while not self._stopped.wait(self.args.token_refresh_interval):
+            self.clients.refresh(2 * self.args.token_refresh_interval)
+
+    def with_client(self, env_names, function):
+        """
+        Calls the given function with the clients of the given environments, re-authenticating and calling it again if
+        a token turns out to have been revoked.
+        :param env_names: the names of the environments
+        :param function: the function, called with the clients (each a tuple of the client and its description)
+        :return: what the function returned
+        """
+        from glanceclient import exc
+        try:
+            return function(*[self.clients.get(env_name) for env_name in env_names])
+        except (exc.HTTPUnauthorized, ImageOperationError) as e:
+            # the copier raises the errors of glance as its own, with the original error as their cause
+            if not isinstance(getattr(e, "cause", e), exc.HTTPUnauthorized):
+                raise
+            for env_name in env_names:
+                self.clients.invalidate(env_name)
+            return function(*[self.clients.get(env_name) for env_name in env_names])
+
+    def submit(self, request):
+        """
+        Submits a job.
+        :param request: the parameters of the job, as JSON
+        :return: the job
+        :raises JobRequestError: if the parameters are invalid
+        """
+        if not isinstance(request, dict):
+            raise JobRequestError("Expected a JSON object describing the job")
+        kind = request.get("type")
+        if kind == COPY_JOB:
+            return self.submit_copy(request)
+        if kind == DELETE_JOB:
+            return self.submit_delete(request)
+        raise JobRequestError("Job type must be '%s' or '%s', not %s" % (COPY_JOB, DELETE_JOB, json.dumps(kind)))
+
+    def submit_copy(self, request):
+        from glanceclient import exc
+        from oslo_utils import encodeutils
+        source = request.get("source")
+        dests = request.get("dest")
+        if isinstance(dests, str):
+            dests = [dests]
+        # each destination is a specification, or an object of a specification and the options to set for it alone
+        if not isinstance(source, str) or not isinstance(dests, list) or len(dests) == 0 \
+                or not all(isinstance(dest, str) or (isinstance(dest, dict) and isinstance(dest.get("dest"), str))
+                           for dest in dests):
+            raise JobRequestError("A copy job needs a 'source' specification and one or more 'dest' specifications")
+        source_env, source_id_or_name = self.parse_specification(source)
+        dest_options = [(dest.get("options") or {}) if isinstance(dest, dict) else {} for dest in dests]
+        dests = [self.parse_specification(dest["dest"] if isinstance(dest, dict) else dest) for dest in dests]
+        copier = self.get_job_copier(request.get("options") or {})
+        for options in dest_options:
+            if not isinstance(options, dict):
+                raise JobRequestError("The 'options' of a copy job's destination must be a JSON object")
+            try:
+                copier.for_destination(options)
+            except (TypeError, ValueError) as e:
+                raise JobRequestError(str(e))
+
+        def copy(job):
+            copier.log = lambda message: print_error("[job %s] %s" % (job.id, message))
+            if len(dests) == 1:
+                (dest_env, dest_name), = dests
+                dest_copier = copier.for_destination(dest_options[0])
+                result = self.with_client([source_env, dest_env], lambda source_client, dest_client:
+                                          dest_copier.copy_image(source_client[0], source_id_or_name, dest_client[0],
+                                                                 dest_name, source_description=source_client[1],
+                                                                 dest_description=dest_client[1]))
+                results = [result]
+            else:
+                results = self.with_client([source_env] + [dest_env for dest_env, _ in dests],
+                                           lambda source_client, *dest_clients: copier.fan_out_copy(
+                                               source_client[0], source_id_or_name,
+                                               [(dest_client[0], dest_name, options) for dest_client, (_, dest_name),
+                                                options in zip(dest_clients, dests, dest_options)],
+                                               source_description=source_client[1],
+                                               dest_descriptions=[dest_client[1] for dest_client in dest_clients]))
+            job.bytes_transferred = sum(result.bytes_transferred for result in results
+                                        if isinstance(result, CopyResult))
+            job.result = {"destinations": [_describe_copy(dest_env, dest_name, result)
+                                           for (dest_env, dest_name), result in zip(dests, results)],
+                          "phases": copier.metrics.to_dict()["phases"]}
+            failures = [result for result in results if not isinstance(result, CopyResult)]
+            if len(failures) > 0:
+                raise exc.CommandError("Failed to copy to %d of %d destinations: %s" % (
+                    len(failures), len(results), "; ".join(encodeutils.exception_to_unicode(e) for e in failures)))
+            return job.result
+
+        return self.scheduler.submit(COPY_JOB, [source_env] + [dest_env for dest_env, _ in dests], copy, request)
+
+    def get_job_copier(self, options):
+        if not isinstance(options, dict):
+            raise JobRequestError("The 'options' of a copy job must be a JSON object")
+        not_allowed = sorted(set(options) - set(JOB_COPY_OPTIONS))
+        if len(not_allowed) > 0:
+            raise JobRequestError("Copy options that cannot be set per job: %s (allowed: %s)"
+                                  % (", ".join(not_allowed), ", ".join(JOB_COPY_OPTIONS)))
+        try:
+            job_options = self.copier.options.replace(**options)
+            job_options.check()
+        except (TypeError, ValueError) as e:
+            raise JobRequestError(str(e))
+        # each job has its own metrics, so that those of the daemon do not grow without bound
+        return ImageCopier(job_options, Metrics(COPY_JOB), log=print_error, image_cache=self.copier.image_cache,
+                           catalog=self.copier.catalog)
+
+    def submit_delete(self, request):
+        env_name = request.get("env", "")
+        image_ids = request.get("images")
+        if not isinstance(env_name, str) or not isinstance(image_ids, list) or len(image_ids) == 0 \
+                or not all(isinstance(image_id, str) for image_id in image_ids):
+            raise JobRequestError("A delete job needs the identifiers of the 'images' to delete (and optionally the "
+                                  "'env' to delete them from)")
+        from openstacktools._delete import delete_images
+
+        def delete(job):
+            log = lambda message: print_error("[job %s] %s" % (job.id, message))
+            def delete_with(client):
+                result = delete_images(client[0], image_ids,
+                                       max_simultaneous_deletes=self.args.max_simultaneous_deletes, log=log)
+                catalog = self.copier.catalog
+                if catalog is not None and catalog.supports(client[0]):
+                    not_deleted_ids = set(deletion.image_id for deletion in result.not_deleted)
+                    catalog.remove(client[0], [image_id for image_id in image_ids if image_id not in not_deleted_ids])
+                return result
+
+            result = self.with_client([env_name], delete_with)
+            job.images_deleted = result.deleted
+            job.result = {"attempted": result.attempted, "deleted": result.deleted,
+                          "not_deleted": [deletion.image_id for deletion in result.not_deleted]}
+            result.raise_for_failures()
+            return job.result
+
+        return self.scheduler.submit(DELETE_JOB, [env_name], delete, request)
+
+
+def _describe_copy(dest_env, dest_name, result):
+    from oslo_utils import encodeutils
+    if isinstance(result, CopyResult):
+        return {"dest": "%s:%s" % (dest_env, dest_name), "image_id": result.dest_image_id,
+                "replaced_image_ids": result.replaced_image_ids, "bytes_transferred": result.bytes_transferred,
+                "verified_checksums": result.verified_checksums, "deduplicated": result.deduplicated}
+    return {"dest": "%s:%s" % (dest_env, dest_name), "error": encodeutils.exception_to_unicode(result)}
+
+
+def _parse_environment_limit(value):
+    env_name, separator, limit = value.rpartition("=")
+    if separator == "" or not limit.isdigit():
+        raise argparse.ArgumentTypeError("Expected ENV=JOBS, got: %s" % value)
+    return env_name, int(limit)
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """
+    Handler of the HTTP API:
+    - POST /jobs: submits a job, given as a JSON object, e.g. {"type": "copy", "source": "env1:image", "dest":
+      ["env2:image", {"dest": "env3:image", "options": {"properties": ["min_disk"]}}], "options":
+      {"duplicate_name_strategy": "replace"}} (options given with a destination apply to it alone, and can be its
+      properties, duplicate name strategy and dedup policy) or {"type": "delete", "env": "env1", "images": ["<id>",
+      ...]}, responding with its status (202);
+    - GET /jobs[?status=STATUS]: the status of every queued, running or recently finished job;
+    - GET /jobs/<id>[?wait=SECONDS]: the status of a job, optionally waiting for it to finish;
+    - GET /stats: the number of jobs queued, running and finished, and the recent throughput.
+    """
+    server_version = "glancecpd"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        path = url.path.rstrip("/")
+        scheduler = self.server.daemon_shell.scheduler
+        if path == "/stats":
+            self.send_json(200, scheduler.stats())
+        elif path == "/jobs":
+            status = query.get("status", [None])[0]
+            self.send_json(200, {"jobs": [job.to_dict() for job in scheduler.list(status)]})
+        elif path.startswith("/jobs/"):
+            job_id = path[len("/jobs/"):]
+            try:
+                wait = min(float(query.get("wait", [0])[0]), MAX_WAIT)
+            except ValueError:
+                self.send_json(400, {"error": "wait must be a number of seconds"})
+                return
+            job = scheduler.wait(job_id, wait) if wait > 0 else scheduler.get(job_id)
+            if job is None:
+                self.send_json(404, {"error": "No job %s" % job_id})
+            else:
+                self.send_json(200, job.to_dict())
+        else:
+            self.send_json(404, {"error": "Not found: %s" % url.path})
+
+    def do_POST(self):
+        if urlsplit(self.path).path.rstrip("/") != "/jobs":
+            self.send_json(404, {"error": "Not found: %s" % self.path})
+            return
+        try:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            job = self.server.daemon_shell.submit(json.loads(body.decode("utf-8")))
+        except (JobRequestError, ValueError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        self.send_json(202, job.to_dict(), headers={"Location": "/jobs/%s" % job.id})
+
+    def send_json(self, status, content, headers=None):
+        body = (json.dumps(content, indent=2) + "\n").encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # clients of a Unix socket have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix socket"
+
+    def log_message(self, format, *args):
+        print_error("%s - %s" % (self.address_string(), format % args))
+
+
+class _HTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def main():
+    from oslo_utils import encodeutils
+    argv = [encodeutils.safe_decode(a) for a in sys.argv[1:]]
+    try:
+        GlanceCPDaemonShell().main(argv)
+    except KeyboardInterrupt:
+        from glanceclient.common import utils
+        utils.exit('... terminating glancecpd', exit_code=130)
+    except Exception as e:
+        if debug_enabled(argv) is True:
+            traceback.print_exc()
+        from glanceclient.common import utils
+        utils.exit(encodeutils.exception_to_unicode(e))
+
+
+if __name__ == "__main__":
+    main()
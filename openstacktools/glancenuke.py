@@ -1,19 +1,31 @@
 import argparse
+import os
 import sys
-from concurrent.futures import ThreadPoolExecutor, Future, wait
-from threading import Lock
-from typing import Tuple, Dict, List, Sized, Callable, Any
+from concurrent.futures import ThreadPoolExecutor
+from configparser import ConfigParser
+from threading import BoundedSemaphore
+from typing import Tuple, Dict, Iterable, Iterator, List, Optional, Callable, Any
 
 from glanceclient import Client
-from glanceclient.exc import HTTPException
+from glanceclient.exc import HTTPBadRequest
 
-from openstacktools._arguments import add_openstack_args
+from openstacktools._arguments import add_image_index_args, add_openstack_args, get_env, resolve_openstack_args
+from openstacktools._catalog import ImageCatalog
 from openstacktools._client import create_authenticated_client
-from openstacktools._helpers import get_consent, null_op
+from openstacktools._concurrency import AdaptiveConcurrencyLimit
+from openstacktools._delete import delete_images, describe_error
+from openstacktools._helpers import get_consent, get_correct_image_noun, get_image_api_version, null_op, parse_size, \
+    print_error, synchronised
+from openstacktools._plan import DeletionPlan
+from openstacktools._profiling import profiled
+from openstacktools._retry import DEFAULT_MAX_RETRY_DELAY, DEFAULT_RETRIES, DEFAULT_RETRY_DELAY, RetryPolicy
+from openstacktools._selection import ImageSelection, parse_time
+from openstacktools._tracing import ApiCallTracer, traced
 
-PROTECTED_PROPERTY = "protected"
 ID_PROPERTY = "id"
 NAME_PROPERTY = "name"
+# glance's default maximum page size
+LIST_PAGE_SIZE = 1000
 
 
 def main():
@@ -21,32 +33,91 @@ def main():
     Main method.
     """
     arguments = _parse_args(sys.argv[1:])
-    outputter = print if not arguments.quiet else null_op
+    with profiled(arguments.profile), traced(arguments.trace) as tracer:
+        _nuke(arguments, tracer)
 
-    client, client_description = create_authenticated_client(arguments)  # type: Tuple[Client, str]
 
-    to_delete, to_leave, id_name_map = _get_images(client)
+def _nuke(arguments, tracer: ApiCallTracer=None):
+    """
+    Deletes the images, as given by the CLI arguments.
+    :param arguments: namespace containing the CLI arguments
+    :param tracer: tracer of the API calls made by the clients
+    """
+    # deletes report their progress from several threads
+    outputter = synchronised(print) if not arguments.quiet else null_op
 
-    if to_delete == 0:
-        outputter("No images to delete")
-        exit(0)
+    plan = None
+    if arguments.execute_plan is not None:
+        plan = DeletionPlan.load(arguments.execute_plan)
+        environments = plan.environments
+    else:
+        environments = arguments.environments if len(arguments.environments) > 0 else [""]
+    config = _load_config(_get_config_file(arguments, environments))
+    clients = _create_clients(arguments, config, environments, tracer)
+    catalog = None
+    if arguments.image_index is not None:
+        catalog = ImageCatalog(arguments.image_index, arguments.image_index_max_age, arguments.rebuild_image_index)
 
-    to_delete_names = [id_name_map[image_id] for image_id in sorted(to_delete)]
-    outputter("Going to permanently delete %d %s:\n%s"
-              % (len(to_delete), _get_correct_image_noun(to_delete), to_delete_names))
+    if plan is None:
+        selection = _get_selection(arguments)
+        if arguments.no_consent_required and arguments.save_plan is None:
+            # nothing has to be shown before deleting, so deletes start as soon as the first page of images is listed
+            to_delete = {env_name: _iter_deletable_images(client, selection, catalog)
+                         for env_name, client in clients.items()}  # type: Dict[str, Iterable[Tuple[str, str]]]
+            totals = {env_name: None for env_name in environments}
+            outputter("Going to permanently delete all non-protected images%s%s"
+                      % ("" if selection.is_everything() else " matching the given criteria",
+                         _describe_environments(environments)))
+        else:
+            plan = _list_deletable_images(clients, selection, catalog)
+            if arguments.save_plan is not None:
+                plan.save(arguments.save_plan)
+                outputter("Saved the plan to delete %d %s%s to %s"
+                          % (plan.total, get_correct_image_noun(range(plan.total)),
+                             _describe_environments(environments), arguments.save_plan))
+                exit(0)
 
-    if not arguments.no_consent_required:
-        consent = get_consent()
-        if not consent:
-            print("Not deleting because of invalid consent", file=sys.stderr)
-            exit(1)
+    if plan is not None:
+        if plan.total == 0:
+            outputter("No images to delete")
+            exit(0)
+        for env_name, images in plan.images.items():
+            if len(images) == 0 and len(environments) > 1:
+                continue
+            to_delete_names = [name for _, name in sorted(images)]
+            outputter("Going to permanently delete %d %s%s:\n%s"
+                      % (len(images), get_correct_image_noun(images), _describe_environments([env_name]),
+                         to_delete_names))
 
-    _delete_images(client, to_delete, outputter, max_simultaneous_deletes=arguments.max_simultaneous_deletes)
+        if not arguments.no_consent_required:
+            consent = get_consent()
+            if not consent:
+                print("Not deleting because of invalid consent", file=sys.stderr)
+                exit(1)
+        to_delete = plan.images
+        totals = {env_name: len(images) for env_name, images in plan.images.items()}
 
-    after_delete, _, _ = _get_images(client)
-    not_deleted = [id_name_map[image_id] for image_id in sorted(list(set(to_delete).intersection(after_delete)))]
+    shared_limit = None
+    if arguments.global_simultaneous_deletes is not None:
+        shared_limit = BoundedSemaphore(arguments.global_simultaneous_deletes)
+
+    def nuke(env_name: str) -> Tuple[int, List[str]]:
+        environment_outputter = outputter if len(environments) == 1 else _prefixed(outputter, "%s: " % env_name)
+        return _nuke_environment(clients[env_name], to_delete[env_name], totals[env_name], arguments,
+                                 environment_outputter, shared_limit, catalog)
+
+    # every environment is nuked at once, within the global limit on parallel deletes
+    with ThreadPoolExecutor(max_workers=len(environments)) as executor:
+        results = dict(zip(environments, executor.map(nuke, environments)))
+
+    if sum(attempted for attempted, _ in results.values()) == 0:
+        outputter("No images to delete")
+        exit(0)
+
+    not_deleted = [name if len(environments) == 1 else "%s:%s" % (env_name, name)
+                   for env_name, (_, names) in results.items() for name in names]
     if len(not_deleted) > 0:
-        message = "Could not delete %d %s:\n%s" % (len(not_deleted), _get_correct_image_noun(not_deleted), not_deleted)
+        message = "Could not delete %d %s:\n%s" % (len(not_deleted), get_correct_image_noun(not_deleted), not_deleted)
         if not arguments.ignore_delete_failures:
             print(message, file=sys.stderr)
             exit(1)
@@ -57,83 +128,219 @@ def main():
     exit(0)
 
 
-def _delete_images(client: Client, image_ids: List[str], outputter: Callable[[Any], None],
-                   max_simultaneous_deletes: int=5) -> int:
+def _nuke_environment(client: Client, to_delete: Iterable[Tuple[str, str]], total: Optional[int], arguments,
+                      outputter: Callable[[Any], None], shared_limit: BoundedSemaphore=None,
+                      catalog: ImageCatalog=None) -> Tuple[int, List[str]]:
     """
-    Deletes the given images.
-    :param client: the glance client that can access OpenStack
-    :param image_ids: the identifiers of the images to delete
-    :param max_simultaneous_deletes: the maximum number of deletes to request simultaneously
-    :return: the number of images deleted
+    Deletes the given images from an environment and checks that those that may not have been deleted are gone.
+    :param client: the glance client that can access the environment
+    :param to_delete: the identifiers and names of the images to delete
+    :param total: the number of images to delete, if known
+    :param arguments: namespace containing the CLI arguments
+    :param outputter: output for the progress of the deletes
+    :param shared_limit: limit on the number of deletes requested simultaneously, shared with other environments
+    :param catalog: index of the images, from which the deleted images are removed
+    :return: tuple where the first element is the number of images that deletes were requested for and the second is
+    the names of the images that could not be deleted
     """
-    failed = 0
-    futures = []    # type: List[Future]
-    complete = 0
-    complete_lock = Lock()
+    concurrency_limit = None
+    if arguments.adaptive:
+        concurrency_limit = AdaptiveConcurrencyLimit(
+            arguments.min_simultaneous_deletes, arguments.max_simultaneous_deletes,
+            on_change=lambda old, new, reason: outputter("Parallel deletes changed from %d to %d (%s)"
+                                                         % (old, new, reason)))
+
+    attempted_ids = []
+    if catalog is not None:
+        to_delete = _recording_ids(to_delete, attempted_ids)
 
-    def on_complete(future: Future):
-        nonlocal failed, image_ids, complete
-        with complete_lock:
-            complete += 1
-            if not future.result():
-                failed += 1
-            outputter("Deleted %d/%d %s (%d failed)"
-                      % (complete - failed, len(image_ids), _get_correct_image_noun(image_ids), failed))
+    retry_policy = RetryPolicy(arguments.delete_retries, arguments.retry_delay, arguments.max_retry_delay)
+    result = delete_images(client, to_delete, outputter, max_simultaneous_deletes=arguments.max_simultaneous_deletes,
+                           max_in_flight=arguments.max_in_flight, total=total, concurrency_limit=concurrency_limit,
+                           retry_policy=retry_policy, shared_limit=shared_limit)
 
-    with ThreadPoolExecutor(max_workers=max_simultaneous_deletes) as executor:
-        for i in range(len(image_ids)):
-            image_id = image_ids[i]
-            future = executor.submit(_delete_image, client, image_id)
-            future.add_done_callback(on_complete)
-            futures.append(future)
-    wait(futures)
-    return len(image_ids) - failed
+    if len(result.noteworthy) > 0:
+        outputter("Deletes that were retried or failed:")
+        for deletion in result.noteworthy:
+            outputter("%s\t%s\t%s after %d %s%s"
+                      % (deletion.name, deletion.image_id, "deleted" if deletion.deleted else "failed",
+                         deletion.attempts, "attempt" if deletion.attempts == 1 else "attempts",
+                         "" if deletion.deleted else ": %s" % describe_error(deletion.error)))
 
+    if catalog is not None and catalog.supports(client):
+        not_deleted_ids = set(deletion.image_id for deletion in result.not_deleted)
+        catalog.remove(client, [image_id for image_id in attempted_ids if image_id not in not_deleted_ids])
 
-def _delete_image(client: Client, image_id: str) -> bool:
+    return result.attempted, [deletion.name for deletion in result.not_deleted]
+
+
+def _create_clients(arguments, config: ConfigParser, environments: List[str],
+                    tracer: ApiCallTracer=None) -> Dict[str, Client]:
     """
-    Deletes an OpenStack image with the given identifier.
-    :param client: the glance client that can access OpenStack
-    :param image_id: the identifier of the image to delete
-    :return: whether the image was successfully deleted
+    Creates authenticated glance clients for the given environments, authenticating with each at the same time.
+    :param arguments: namespace containing the CLI arguments
+    :param config: the configuration of the environments
+    :param environments: the names of the environments ("" for the default one)
+    :param tracer: tracer of the API calls made by the clients
+    :return: the clients by environment
     """
-    try:
-        client.images.delete(image_id)
-        return True
-    except HTTPException as e:
-        print("Unable to delete image %s: %s" % (image_id, e.details), file=sys.stderr)
-        return False
+    def create_client(env_name: str) -> Client:
+        client_arguments = resolve_openstack_args(arguments, env_name, config)
+        # the client is shared by all of the threads deleting images in the environment
+        client_arguments.connection_pool_size = arguments.max_simultaneous_deletes
+        client_arguments.tracer = tracer
+        client, _ = create_authenticated_client(client_arguments, env_name or "glance client")
+        return client
+
+    with ThreadPoolExecutor(max_workers=len(environments)) as executor:
+        return dict(zip(environments, executor.map(create_client, environments)))
+
+
+def _list_deletable_images(clients: Dict[str, Client], selection: ImageSelection,
+                           catalog: ImageCatalog=None) -> DeletionPlan:
+    """
+    Lists the images to delete in each of the given environments, listing each at the same time.
+    :param clients: the glance clients by environment
+    :param selection: criteria for the images to delete
+    :param catalog: index of the images to list them from, where it can be used
+    :return: the plan to delete the images
+    """
+    def list_images(client: Client) -> List[Tuple[str, str]]:
+        return list(_iter_deletable_images(client, selection, catalog))
+
+    with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+        return DeletionPlan(dict(zip(clients.keys(), executor.map(list_images, clients.values()))))
+
+
+def _get_config_file(arguments, environments: List[str]) -> Optional[str]:
+    """
+    Gets the config file that defines the given environments. Only the OpenStack arguments and OS_* environment
+    variables define the default environment unless a config file is given explicitly, so that a glancecp config file
+    that happens to be around does not change which project images are deleted from.
+    :param arguments: namespace containing the CLI arguments
+    :param environments: the environments to delete images from ("" for the default one)
+    :return: path of the config file, or `None` for none
+    """
+    if arguments.config is not None:
+        return arguments.config
+    if get_env("GLANCENUKE_CONFIG_FILE"):
+        return get_env("GLANCENUKE_CONFIG_FILE")
+    if any(env_name != "" for env_name in environments):
+        return get_env("GLANCECP_CONFIG_FILE", default="glancecp.config")
+    return None
 
 
-def _get_images(client: Client) -> Tuple[List[str], List[str], Dict[str, str]]:
+def _load_config(config_file: Optional[str]) -> ConfigParser:
     """
-    Gets the images from OpenStack.
+    Loads the configuration of the OpenStack environments (as for glancecp).
+    :param config_file: path to the INI-style config file, which need not exist (`None` for no configuration)
+    :return: the configuration
+    """
+    if config_file is None:
+        return ConfigParser()
+    if os.path.isfile(config_file):
+        config = ConfigParser(default_section="common")
+        config.read(config_file)
+        return config
+    if os.path.exists(config_file):
+        raise IsADirectoryError("Config path %s exists but is not a file" % config_file)
+    return ConfigParser()
+
+
+def _describe_environments(environments: List[str]) -> str:
+    environments = [env_name for env_name in environments if env_name != ""]
+    return "" if len(environments) == 0 else " in %s" % ", ".join(environments)
+
+
+def _iter_deletable_images(client: Client, selection: ImageSelection,
+                           catalog: ImageCatalog=None) -> Iterator[Tuple[str, str]]:
+    """
+    Lists the images from OpenStack that can be deleted, page by page.
+
+    Each image is only yielded once the image after it has been listed. Glance fetches the next page of the listing
+    with the last image of the current page as its marker, which must not have been deleted by then.
     :param client: glance client to access OpenStack.
-    :return: tuple where the first element is the ids of images that can be deleted, the second is the ids of images
-    that cannot be deleted and the third is a mapping between image ids and their friendly names
-    """
-    to_delete = []  # type: List[str]
-    to_leave = []  # type: List[str]
-    id_name_map = {}  # type: Dict[str, str]
-
-    for image in client.images.list():
-        image_id = image[ID_PROPERTY]
-        id_name_map[image_id] = image[NAME_PROPERTY]
-        if image[PROTECTED_PROPERTY]:
-            to_leave.append(image_id)
-        else:
-            to_delete.append(image_id)
+    :param selection: criteria for the images to delete
+    :param catalog: index of the images to list them from, where it can be used
+    :return: iterator of the ids and names of the selected images
+    """
+    previous = None
+    for image in _list_images(client, selection, catalog):
+        if not selection.matches(image):
+            continue
+        if previous is not None:
+            yield previous
+        previous = (image[ID_PROPERTY], image[NAME_PROPERTY])
+    if previous is not None:
+        yield previous
 
-    return to_delete, to_leave, id_name_map
 
+def _list_images(client: Client, selection: ImageSelection, catalog: ImageCatalog=None) -> Iterator:
+    """
+    Lists the images that may match the given selection, having glance filter them as far as it can.
 
-def _get_correct_image_noun(images: Sized):
+    If an index of the images is given (and can be used for the environment), the images are listed from the index
+    instead, after it has been brought up to date. Images deleted by others since the index was last rebuilt may still
+    be listed: deleting them again does no harm.
+    :param client: glance client to access OpenStack.
+    :param selection: criteria for the images to list
+    :param catalog: index of the images
+    :return: iterator of the images
     """
-    Gets the correct image noun (image or images) depending on the number of images.
-    :param images: the container of images
-    :return: the image noun
+    # community images are only listed by glance when asked for, so are not in the index
+    if catalog is not None and catalog.supports(client) and selection.visibility != "community":
+        yield from catalog.list_images(client)
+        return
+    filters = selection.get_filters(get_image_api_version(client))
+    images = iter(client.images.list(filters=filters, page_size=LIST_PAGE_SIZE))
+    try:
+        # the filters are only sent (and so can only be rejected) when the first page is requested
+        first = next(images)
+    except StopIteration:
+        return
+    except HTTPBadRequest as e:
+        if len(filters) == 0:
+            raise
+        print_error("WARNING: glance rejected the image filters %s (%s); listing every image instead"
+                     % (filters, describe_error(e)))
+        yield from client.images.list(page_size=LIST_PAGE_SIZE)
+        return
+    yield first
+    yield from images
+
+
+def _recording_ids(images: Iterable[Tuple[str, str]], image_ids: List[str]) -> Iterator[Tuple[str, str]]:
     """
-    return "image" if len(images) in [0, 1] else "images"
+    Wraps the given images so that the identifier of each is recorded as it is taken.
+    :param images: the identifiers and names of the images
+    :param image_ids: list to which the identifiers are appended
+    :return: iterator of the images
+    """
+    for image in images:
+        image_ids.append(image[0])
+        yield image
+
+
+def _prefixed(outputter: Callable[[Any], None], prefix: str) -> Callable[[Any], None]:
+    """
+    Wraps the given outputter so that every message it outputs starts with the given prefix.
+    :param outputter: the outputter to wrap
+    :param prefix: the prefix
+    :return: the wrapped outputter
+    """
+    return lambda message: outputter("%s%s" % (prefix, message))
+
+
+def _get_selection(arguments) -> ImageSelection:
+    """
+    Gets the criteria for the images to delete from the given CLI arguments.
+    :param arguments: namespace containing the arguments
+    :return: the criteria
+    """
+    return ImageSelection(
+        names=arguments.names, owner=arguments.owner, visibility=arguments.visibility, statuses=arguments.statuses,
+        tags=arguments.tags, created_before=arguments.created_before, updated_before=arguments.updated_before,
+        min_size=arguments.min_size, max_size=arguments.max_size)
 
 
 def _parse_args(args: List[str]):
@@ -144,20 +351,105 @@ def _parse_args(args: List[str]):
     """
     parser = argparse.ArgumentParser(
         prog="glancenuke",
-        description="Tool for deleting all (non-protected) OpenStack images in a tenant",
+        description="Tool for deleting all (non-protected) OpenStack images in a tenant, or only those matching the "
+                    "given criteria",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    add_openstack_args(parser)
+    # the OpenStack arguments are resolved for each environment once the config file is known
+    add_openstack_args(parser, resolve_defaults=False)
+    parser.add_argument("--env", action="append", default=[], dest="environments", metavar="ENV",
+                        help="OpenStack environment to delete images from, matched against the sections of the config "
+                             "file and used as the prefix of environment variables as in glancecp (can be given more "
+                             "than once to delete images from several environments at the same time; defaults to "
+                             "the environment given by the OpenStack arguments and OS_* environment variables)")
+    parser.add_argument("--config", dest="config", default=None,
+                        help="Path to the INI-style config file that defines the environments (as for glancecp; "
+                             "defaults to env[GLANCENUKE_CONFIG_FILE] or, if any --env is given, "
+                             "env[GLANCECP_CONFIG_FILE] or glancecp.config). Without --config, --env or "
+                             "env[GLANCENUKE_CONFIG_FILE], no config file is read and the default environment is "
+                             "defined by the OpenStack arguments and OS_* environment variables alone")
+    parser.add_argument("--save-plan", dest="save_plan", metavar="PLAN_FILE",
+                        help="Only list the images to delete in every environment, saving them to this file to be "
+                             "reviewed and then deleted with --execute-plan")
+    parser.add_argument("--execute-plan", dest="execute_plan", metavar="PLAN_FILE",
+                        help="Delete the images in a plan saved with --save-plan, without listing images again")
 
     parser.add_argument("-q", dest="quiet", action="store_true", default=False, help="Quiet mode (also requires -y)")
     parser.add_argument("-y", dest="no_consent_required", action="store_true", default=False,
                         help="Do not require consent before deleting images")
     parser.add_argument("-p", "--parallel-deletes", choices=range(1, 1000), type=int, default=5, metavar="{1,...,1000}",
                         dest="max_simultaneous_deletes",
-                        help="Maximum number of deletes to request in parallel")
+                        help="Maximum number of deletes to request in parallel in each environment")
+    parser.add_argument("--global-parallel-deletes", type=int, default=None, dest="global_simultaneous_deletes",
+                        help="Maximum number of deletes to request in parallel across all environments (defaults to "
+                             "no limit beyond that of each environment)")
+    parser.add_argument("--adaptive", dest="adaptive", action="store_true", default=False,
+                        help="Adapt the number of deletes requested in parallel to the latency and error rate of the "
+                             "deletes, keeping it between --min-parallel-deletes and --parallel-deletes")
+    parser.add_argument("--min-parallel-deletes", choices=range(1, 1000), type=int, default=1,
+                        metavar="{1,...,1000}", dest="min_simultaneous_deletes",
+                        help="Minimum number of deletes to request in parallel in adaptive mode")
+    parser.add_argument("--max-in-flight", type=int, default=None, dest="max_in_flight",
+                        help="Maximum number of listed images waiting to be deleted (defaults to twice the number of "
+                             "parallel deletes)")
+    parser.add_argument("--delete-retries", type=int, default=DEFAULT_RETRIES, dest="delete_retries",
+                        help="Maximum number of times to retry deleting an image after a transient error (e.g. 503, "
+                             "409 or a dropped connection)")
+    parser.add_argument("--retry-delay", type=float, default=DEFAULT_RETRY_DELAY, dest="retry_delay",
+                        help="Longest wait before the first retry of a delete in seconds, doubled for each retry "
+                             "after (the actual wait is random, up to this)")
+    parser.add_argument("--max-retry-delay", type=float, default=DEFAULT_MAX_RETRY_DELAY, dest="max_retry_delay",
+                        help="Longest wait before any retry of a delete in seconds")
     parser.add_argument("--ignore-delete-failures", dest="ignore_delete_failures", action="store_true", default=True,
                         help="Whether the failure to delete one or more images should be ignored")
+    selection = parser.add_argument_group(
+        "image selection", "Criteria that the images to delete must all match. Glance is asked to filter the images by "
+                           "them wherever its API allows, so that only candidate images are listed.")
+    selection.add_argument("--name", action="append", default=[], dest="names", metavar="PATTERN",
+                           help="Name, or shell-style pattern (e.g. 'test-*'), that image names must match (can be "
+                                "given more than once to match any of several)")
+    selection.add_argument("--owner", dest="owner", metavar="PROJECT_ID",
+                           help="Only delete images owned by the project with this identifier")
+    selection.add_argument("--visibility", choices=["public", "private", "shared", "community"], dest="visibility",
+                           help="Only delete images with this visibility")
+    selection.add_argument("--status", action="append", default=[], dest="statuses", metavar="STATUS",
+                           help="Only delete images with this status (can be given more than once)")
+    selection.add_argument("--tag", action="append", default=[], dest="tags", metavar="TAG",
+                           help="Only delete images with this tag (can be given more than once to require several)")
+    selection.add_argument("--created-before", type=parse_time, dest="created_before", metavar="TIME",
+                           help="Only delete images created before this time, given as an ISO 8601 timestamp (UTC "
+                                "unless given) or an age (e.g. '30d'; units are s, m, h, d and w)")
+    selection.add_argument("--updated-before", type=parse_time, dest="updated_before", metavar="TIME",
+                           help="Only delete images last updated before this time (as for --created-before)")
+    selection.add_argument("--min-size", type=parse_size, dest="min_size", metavar="SIZE",
+                           help="Only delete images of at least this size in bytes (K, M, G and T suffixes allowed)")
+    selection.add_argument("--max-size", type=parse_size, dest="max_size", metavar="SIZE",
+                           help="Only delete images of at most this size in bytes (K, M, G and T suffixes allowed)")
+    add_image_index_args(parser)
+    parser.add_argument("--token-cache-dir", dest="token_cache_dir", default=None,
+                        help="Directory in which to cache Keystone tokens and the image endpoint between runs")
+    parser.add_argument("--profile", dest="profile", default=None, metavar="PATH",
+                        help="File to write a profile of the run (covering every thread) to, in the format read by "
+                             "Python's pstats module")
+    parser.add_argument("--trace", dest="trace", default=None, metavar="PATH",
+                        help="File to write a trace of every Glance and Keystone API call to as JSON lines, "
+                             "summarising the latencies of the calls at the end of the run")
 
     arguments = parser.parse_args(args)
+    if arguments.execute_plan is not None:
+        if arguments.save_plan is not None or len(arguments.environments) > 0 \
+                or not _get_selection(arguments).is_everything():
+            print("The environments and images to delete are taken from the plan: --execute-plan cannot be given "
+                  "with --save-plan, --env or image selection criteria", file=sys.stderr)
+            exit(1)
+    if arguments.global_simultaneous_deletes is not None and arguments.global_simultaneous_deletes < 1:
+        print("The global number of parallel deletes must be at least 1", file=sys.stderr)
+        exit(1)
+    if arguments.delete_retries < 0:
+        print("The number of delete retries cannot be negative", file=sys.stderr)
+        exit(1)
+    if arguments.adaptive and arguments.min_simultaneous_deletes > arguments.max_simultaneous_deletes:
+        print("The minimum number of parallel deletes cannot be more than the maximum", file=sys.stderr)
+        exit(1)
     if arguments.quiet and not arguments.no_consent_required:
         print("Must require no consent to operate in quiet mode (i.e. add the -y flag)", file=sys.stderr)
         exit(1)
@@ -0,0 +1,156 @@
+"""
+Syncs images from one OpenStack glance environment to another, copying only those that are missing from the
+destination or have changed.
+"""
+
+import argparse
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from openstacktools._copy import NAME_LOOKUP_PAGE_SIZE
+from openstacktools._sync import AMBIGUOUS, UNCHANGED, plan_sync
+from openstacktools.glancecp import GlanceCPShell, debug_enabled
+
+
+class GlanceSyncShell(GlanceCPShell):
+    def parse_args(self, argv):
+        parser = argparse.ArgumentParser(
+            prog="glancesync",
+            description=__doc__.strip(),
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+        parser.add_argument("source_env", help='''
+               The OpenStack environment from which to sync images (matched
+               against the sections of the config file and used as the prefix
+               of environment variables, as in glancecp).
+        ''')
+
+        parser.add_argument("dest_env", help='''
+               The OpenStack environment to which to sync images.
+        ''')
+
+        parser.add_argument("names", nargs="*", help='''
+               Names of the images to sync. If no names are given (here or
+               with '--names-file'), all active images visible in the source
+               environment are synced.
+        ''')
+
+        parser.add_argument("--names-file",
+                            dest="names_file",
+                            help='''
+               File listing the names of the images to sync, one per line
+               (blank lines and lines starting with '#' are ignored).
+        ''')
+
+        parser.add_argument("--dry-run",
+                            dest="dry_run",
+                            action="store_true",
+                            default=False,
+                            help="Only report what would be copied.")
+
+        self.add_copy_args(parser)
+        # a changed image always has a namesake at the destination: by default, the stale copy is kept
+        parser.set_defaults(duplicate_name_strategy="allow")
+        return parser.parse_args(argv)
+
+    def get_names(self, args):
+        names = list(args.names)
+        if args.names_file:
+            with open(args.names_file) as names_file:
+                names.extend(line.strip() for line in names_file
+                             if line.strip() != "" and not line.strip().startswith("#"))
+        return sorted(set(names)) if len(names) > 0 else None
+
+    def list_images(self, client, names):
+        if names is None:
+            return list(client.images.list())
+        images = []
+        for index in range(0, len(names), NAME_LOOKUP_PAGE_SIZE):
+            images.extend(self.copier.find_images_by_name(client, names[index:index + NAME_LOOKUP_PAGE_SIZE]))
+        return images
+
+    def main(self, argv):
+        args = self.parse_args(argv)
+        config = self.load_config(args.config)
+        names = self.get_names(args)
+        self.check_copy_args(args)
+
+        with self.diagnostics(args):
+            try:
+                self.sync(config, args, names)
+            finally:
+                if args.metrics_json:
+                    self.metrics.write_json(args.metrics_json)
+
+    def sync(self, config, args, names):
+        from glanceclient.common import utils
+        from oslo_utils import encodeutils
+        self.prepare_transfers(args)
+        env_args = self.resolve_env_args(args, args.source_env, args.dest_env, config)
+        clients = {}
+        for source_or_dest, env_name in [("source", args.source_env), ("dest", args.dest_env)]:
+            with self.metrics.phase("auth", side=source_or_dest, env=env_name):
+                clients[source_or_dest] = self.authenticate_client(source_or_dest, env_name, env_args)
+
+        # list each side once
+        with self.metrics.phase("list", side="source"):
+            source_images = [image for image in self.list_images(clients["source"][0], names)
+                             if image["status"] == "active"]
+        with self.metrics.phase("list", side="dest"):
+            dest_images = self.list_images(clients["dest"][0], sorted(set(image["name"] for image in source_images)))
+        plan = plan_sync(source_images, dest_images)
+
+        not_found = sorted(set(names or []) - set(image["name"] for image in source_images))
+        for name in not_found:
+            print("FAILED\t%s\t\tno active source image with this name" % name)
+        failed = len(not_found)
+
+        copies = []
+        for action, source_image, named_dest_images in plan:
+            if action == UNCHANGED:
+                print("UNCHANGED\t%s\t%s\t%s" % (source_image["name"], source_image["id"], named_dest_images[0]["id"]))
+            elif action == AMBIGUOUS:
+                print("FAILED\t%s\t%s\tseveral active source images have this name"
+                      % (source_image["name"], source_image["id"]))
+                failed += 1
+            elif args.dry_run:
+                print("%s\t%s\t%s\t%s" % (action.upper(), source_image["name"], source_image["id"],
+                                          ",".join(image["id"] for image in named_dest_images)))
+            else:
+                copies.append(source_image)
+
+        def copy(source_image):
+            try:
+                return True, self.copy_image(clients["source"], source_image["id"], clients["dest"],
+                                             source_image["name"]).dest_image_id
+            except Exception as e:
+                return False, encodeutils.exception_to_unicode(e)
+
+        with ThreadPoolExecutor(max_workers=args.parallel_copies) as executor:
+            for source_image, (succeeded, detail) in zip(copies, executor.map(copy, copies)):
+                print("%s\t%s\t%s\t%s" % ("COPIED" if succeeded else "FAILED", source_image["name"], source_image["id"],
+                                          detail))
+                failed += 0 if succeeded else 1
+
+        if failed > 0:
+            utils.exit("Failed to sync %d of %d images" % (failed, len(plan) + len(not_found)))
+
+
+def main():
+    from oslo_utils import encodeutils
+    argv = [encodeutils.safe_decode(a) for a in sys.argv[1:]]
+    try:
+        GlanceSyncShell().main(argv)
+    except KeyboardInterrupt:
+        from glanceclient.common import utils
+        utils.exit('... terminating glancesync', exit_code=130)
+    except Exception as e:
+        if debug_enabled(argv) is True:
+            traceback.print_exc()
+        from glanceclient.common import utils
+        utils.exit(encodeutils.exception_to_unicode(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -20,7 +20,9 @@ setup(
     entry_points={
         "console_scripts": [
             "glancecp=openstacktools.glancecp:main",
-            "glancenuke=openstacktools.glancenuke:main"
+            "glancecpd=openstacktools.glancecpd:main",
+            "glancenuke=openstacktools.glancenuke:main",
+            "glancesync=openstacktools.glancesync:main"
         ]
     }
 )
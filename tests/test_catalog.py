@@ -0,0 +1,153 @@
+import os
+import tempfile
+import unittest
+
+from glanceclient import exc
+from keystoneauth1 import adapter as ksa_adapter
+
+from openstacktools._catalog import ImageCatalog, get_catalog_key
+from openstacktools._copy import ImageCopier
+from openstacktools.glancesync import GlanceSyncShell
+
+
+class _SessionClient(ksa_adapter.Adapter):
+    def __init__(self, endpoint: str, project_id: str):
+        super().__init__(None)
+        self._endpoint = endpoint
+        self._project_id = project_id
+
+    def get_endpoint(self, *args, **kwargs):
+        return self._endpoint
+
+    def get_project_id(self, *args, **kwargs):
+        return self._project_id
+
+
+class _TokenClient(object):
+    def __init__(self, endpoint: str, token: str):
+        self.endpoint = endpoint
+        self.auth_token = token
+
+
+class _Images(object):
+    def __init__(self):
+        self.images = {}
+        self.list_filters = []
+
+    def list(self, filters=None, **kwargs):
+        self.list_filters.append(dict(filters or {}))
+        updated_after = (filters or {}).get("updated_at", "gte:")[len("gte:"):]
+        return [dict(image) for image in sorted(self.images.values(), key=lambda image: image["updated_at"])
+                if image["updated_at"] >= updated_after]
+
+    def get(self, image_id):
+        if image_id not in self.images:
+            raise exc.HTTPNotFound()
+        return dict(self.images[image_id])
+
+
+class _Client(object):
+    def __init__(self, http_client, version: int=2):
+        self.http_client = http_client
+        self.version = version
+        self.images = _Images()
+
+    def add_image(self, image_id: str, name: str, updated_at: str, **properties):
+        self.images.images[image_id] = dict(id=image_id, name=name, updated_at=updated_at, status="active",
+                                            **properties)
+
+
+class TestGetCatalogKey(unittest.TestCase):
+    def test_projects_on_same_endpoint_differ(self):
+        self.assertNotEqual(get_catalog_key(_Client(_SessionClient("https://glance", "project1"))),
+                            get_catalog_key(_Client(_SessionClient("https://glance", "project2"))))
+
+    def test_token_clients_on_same_endpoint_differ(self):
+        self.assertNotEqual(get_catalog_key(_Client(_TokenClient("https://glance", "token1"))),
+                            get_catalog_key(_Client(_TokenClient("https://glance", "token2"))))
+        self.assertNotIn("token1", get_catalog_key(_Client(_TokenClient("https://glance", "token1"))))
+
+
+class TestImageCatalog(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.catalog = ImageCatalog(os.path.join(self.directory.name, "index.sqlite"))
+        self.client = _Client(_SessionClient("https://glance", "project"))
+
+    def tearDown(self):
+        self.catalog.close()
+        self.directory.cleanup()
+
+    def test_supports(self):
+        self.assertTrue(self.catalog.supports(self.client))
+        self.assertFalse(self.catalog.supports(_Client(_SessionClient("https://glance", "project"), version=1)))
+        self.assertFalse(self.catalog.supports(_Client(_TokenClient("https://glance", "token"))))
+
+    def test_list_images_by_name(self):
+        self.client.add_image("1", "a", "2020-01-01T00:00:00Z")
+        self.client.add_image("2", "b", "2020-01-02T00:00:00Z")
+        self.assertEqual(["1"], [image["id"] for image in self.catalog.list_images(self.client, ["a"])])
+        self.assertEqual([], self.catalog.list_images(self.client, []))
+        self.assertEqual(["1", "2"], [image["id"] for image in self.catalog.list_images(self.client)])
+
+    def test_refresh_is_incremental(self):
+        self.client.add_image("1", "a", "2020-01-01T00:00:00Z")
+        self.catalog.refresh(self.client)
+        self.client.add_image("2", "b", "2020-01-02T00:00:00Z")
+        self.catalog.refresh(self.client, full=False)
+        reopened = ImageCatalog(self.catalog.path)
+        reopened.refresh(self.client)
+        reopened.close()
+        self.assertEqual({}, self.client.images.list_filters[0])
+        self.assertEqual({"updated_at": "gte:2020-01-01T00:00:00Z"}, self.client.images.list_filters[-1])
+
+    def test_projects_are_indexed_separately(self):
+        other = _Client(_SessionClient("https://glance", "other"))
+        self.client.add_image("1", "a", "2020-01-01T00:00:00Z")
+        other.add_image("2", "a", "2020-01-01T00:00:00Z")
+        self.assertEqual(["1"], [image["id"] for image in self.catalog.list_images(self.client, ["a"])])
+        self.assertEqual(["2"], [image["id"] for image in self.catalog.list_images(other, ["a"])])
+
+    def test_images_deleted_since_are_dropped_when_found(self):
+        self.client.add_image("1", "a", "2020-01-01T00:00:00Z")
+        self.catalog.refresh(self.client)
+        del self.client.images.images["1"]
+        self.assertEqual([], self.catalog.find_images_by_name(self.client, ["a"]))
+        self.assertEqual([], self.catalog.list_images(self.client, ["a"]))
+
+    def test_find_by_checksum(self):
+        self.client.add_image("1", "a", "2020-01-01T00:00:00Z", checksum="abc")
+        self.assertEqual(["1"], [image["id"] for image in
+                                 self.catalog.find_images_by_checksum(self.client, "checksum", "abc")])
+        self.assertRaises(ValueError, self.catalog.find_images_by_checksum, self.client, "name", "a")
+
+    def test_add_and_remove(self):
+        self.catalog.refresh(self.client)
+        self.catalog.add(self.client, [{"id": "1", "name": "a", "updated_at": "2020-01-01T00:00:00Z"}])
+        self.assertEqual(["1"], [image["id"] for image in self.catalog.list_images(self.client, ["a"])])
+        self.catalog.remove(self.client, ["1"])
+        self.assertEqual([], self.catalog.list_images(self.client, ["a"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class TestGlanceSyncLookup(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.catalog = ImageCatalog(os.path.join(self.directory.name, "index.sqlite"))
+        self.client = _Client(_SessionClient("https://glance", "project"))
+        self.shell = GlanceSyncShell()
+        self.shell.copier = ImageCopier(catalog=self.catalog)
+
+    def tearDown(self):
+        self.catalog.close()
+        self.directory.cleanup()
+
+    def test_names_are_found_in_the_index(self):
+        self.client.add_image("1", "a", "2020-01-01T00:00:00Z")
+        self.client.add_image("2", "b", "2020-01-02T00:00:00Z")
+        self.assertEqual(["1"], [image["id"] for image in self.shell.list_images(self.client, ["a"])])
+        self.assertEqual(["1"], [image["id"] for image in self.shell.list_images(self.client, ["a"])])
+        self.assertEqual([{}], self.client.images.list_filters)
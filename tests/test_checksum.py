@@ -0,0 +1,74 @@
+import hashlib
+import unittest
+
+from openstacktools._checksum import ChecksumCalculator, has_same_data, verify_checksums
+from openstacktools._helpers import null_op
+
+DATA = [b"some ", b"image ", b"data"]
+MD5 = hashlib.md5(b"".join(DATA)).hexdigest()
+SHA512 = hashlib.sha512(b"".join(DATA)).hexdigest()
+
+
+def _image(**properties) -> dict:
+    image = {"id": "id", "status": "active", "size": 15, "checksum": MD5, "os_hash_algo": "sha512",
+             "os_hash_value": SHA512}
+    image.update(properties)
+    return image
+
+
+class TestChecksumCalculator(unittest.TestCase):
+    def test_hexdigests(self):
+        calculator = ChecksumCalculator("sha512")
+        self.assertEqual(DATA, list(calculator.wrap(iter(DATA))))
+        self.assertEqual({"md5": MD5, "sha512": SHA512}, calculator.hexdigests())
+        calculator.close()
+
+    def test_unknown_algorithm(self):
+        messages = []
+        calculator = ChecksumCalculator("unknown", log=messages.append)
+        list(calculator.wrap(iter(DATA)))
+        self.assertEqual({"md5": MD5}, calculator.hexdigests())
+        self.assertEqual(1, len(messages))
+
+    def test_closed(self):
+        calculator = ChecksumCalculator(log=null_op)
+        calculator.close()
+        calculator.close()
+        self.assertRaises(ValueError, calculator.hexdigests)
+
+
+class TestVerifyChecksums(unittest.TestCase):
+    def test_matching(self):
+        self.assertEqual([], verify_checksums(_image(), _image(id="dest"), {"md5": MD5, "sha512": SHA512}))
+
+    def test_mismatches(self):
+        mismatches = verify_checksums(_image(), _image(id="dest", checksum="other"), {"md5": MD5, "sha512": SHA512})
+        self.assertEqual(1, len(mismatches))
+        self.assertIn("destination image dest", mismatches[0])
+
+    def test_missing_checksums_are_not_compared(self):
+        self.assertEqual([], verify_checksums(_image(checksum=None, os_hash_algo=None), _image(id="dest"),
+                                              {"md5": MD5}))
+
+
+class TestHasSameData(unittest.TestCase):
+    def test_same(self):
+        self.assertTrue(has_same_data(_image(), _image(id="other")))
+
+    def test_inactive_or_different_size(self):
+        self.assertFalse(has_same_data(_image(), _image(status="queued")))
+        self.assertFalse(has_same_data(_image(), _image(size=16)))
+
+    def test_different_checksums(self):
+        self.assertFalse(has_same_data(_image(), _image(checksum="other")))
+        self.assertFalse(has_same_data(_image(), _image(os_hash_value="other")))
+
+    def test_nothing_to_compare(self):
+        self.assertFalse(has_same_data(_image(checksum=None), _image(os_hash_algo="sha256")))
+
+    def test_md5_only(self):
+        self.assertTrue(has_same_data(_image(os_hash_algo=None), _image(os_hash_algo=None, os_hash_value=None)))
+
+
+if __name__ == "__main__":
+    unittest.main()
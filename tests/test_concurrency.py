@@ -0,0 +1,80 @@
+import unittest
+
+from openstacktools._concurrency import AdaptiveConcurrencyLimit
+
+
+def _complete(limit: AdaptiveConcurrencyLimit, requests: int, latency: float=0.1, overloaded: bool=False):
+    for _ in range(requests):
+        limit.release(limit.acquire(), latency, overloaded)
+
+
+class TestAdaptiveConcurrencyLimit(unittest.TestCase):
+    def setUp(self):
+        self.changes = []
+        self.limit = AdaptiveConcurrencyLimit(2, 32, on_change=lambda old, new, reason: self.changes.append((old, new)))
+
+    def test_invalid_bounds(self):
+        self.assertRaises(ValueError, AdaptiveConcurrencyLimit, 0, 4)
+        self.assertRaises(ValueError, AdaptiveConcurrencyLimit, 4, 2)
+
+    def test_initial_limit_is_within_bounds(self):
+        self.assertEqual(2, self.limit.limit)
+        self.assertEqual(8, AdaptiveConcurrencyLimit(2, 8, initial=100).limit)
+        self.assertEqual(2, AdaptiveConcurrencyLimit(2, 8, initial=1).limit)
+
+    def test_slow_start_increases_by_one_per_request(self):
+        _complete(self.limit, 6)
+        self.assertEqual(8, self.limit.limit)
+        self.assertEqual([(2, 4), (4, 8)], self.changes)
+
+    def test_increase_stops_at_maximum(self):
+        _complete(self.limit, 100)
+        self.assertEqual(32, self.limit.limit)
+        self.assertEqual((16, 32), self.changes[-1])
+
+    def test_overload_decreases_multiplicatively(self):
+        _complete(self.limit, 14)
+        self.assertEqual(16, self.limit.limit)
+        _complete(self.limit, 1, overloaded=True)
+        self.assertEqual(8, self.limit.limit)
+        self.assertEqual((16, 8), self.changes[-1])
+
+    def test_additive_increase_after_overload(self):
+        _complete(self.limit, 14)
+        _complete(self.limit, 1, overloaded=True)
+        # a limit's worth of successful requests raises the limit by about one
+        _complete(self.limit, 8)
+        self.assertEqual(8, self.limit.limit)
+        _complete(self.limit, 1)
+        self.assertEqual(9, self.limit.limit)
+
+    def test_decrease_does_not_go_below_minimum(self):
+        for _ in range(10):
+            _complete(self.limit, 1, overloaded=True)
+        self.assertEqual(2, self.limit.limit)
+
+    def test_burst_of_overloads_decreases_once(self):
+        _complete(self.limit, 14)
+        tickets = [self.limit.acquire() for _ in range(4)]
+        for ticket in tickets:
+            self.limit.release(ticket, 0.1, overloaded=True)
+        self.assertEqual(8, self.limit.limit)
+        self.assertEqual(4, self.limit.overloaded)
+
+    def test_rising_latency_decreases(self):
+        limit = AdaptiveConcurrencyLimit(1, 64, latency_tolerance=2.0)
+        _complete(limit, 20, latency=0.1)
+        before = limit.limit
+        _complete(limit, 10, latency=1.0)
+        self.assertLess(limit.limit, before)
+
+    def test_latency_ignored_without_tolerance(self):
+        limit = AdaptiveConcurrencyLimit(1, 64, latency_tolerance=None)
+        _complete(limit, 20, latency=0.1)
+        before = limit.limit
+        _complete(limit, 10, latency=1.0)
+        self.assertGreaterEqual(limit.limit, before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+from glanceclient.common import http as glance_http
+
+from openstacktools._copy import CopyOptions, ImageCopier, data_to_upload_stream
+from openstacktools._helpers import null_op
+
+
+class TestCopyOptions(unittest.TestCase):
+    def test_replace(self):
+        options = CopyOptions().replace(duplicate_name_strategy="replace", chunk_size=1024)
+        self.assertEqual("replace", options.duplicate_name_strategy)
+        self.assertEqual(1024, options.chunk_size)
+        self.assertRaises(TypeError, CopyOptions().replace, unknown=1)
+
+    def test_check(self):
+        for invalid in [dict(duplicate_name_strategy="other"), dict(dedup="other"), dict(chunk_size=0),
+                        dict(upload_retries=-1), dict(fan_out_queue_depth=0), dict(read_ahead=-1)]:
+            self.assertRaises(ValueError, CopyOptions(**invalid).check)
+
+
+class TestImageCopier(unittest.TestCase):
+    def test_does_not_change_glanceclient_chunk_size(self):
+        chunk_size = glance_http.CHUNKSIZE
+        ImageCopier(CopyOptions(chunk_size=chunk_size + 1), log=null_op)
+        self.assertEqual(chunk_size, glance_http.CHUNKSIZE)
+
+    def test_for_destination(self):
+        copier = ImageCopier(CopyOptions(properties=["min_disk"]), log=null_op)
+        self.assertIs(copier, copier.for_destination(None))
+        dest_copier = copier.for_destination({"duplicate_name_strategy": "rename", "properties": []})
+        self.assertEqual("rename", dest_copier.options.duplicate_name_strategy)
+        self.assertEqual([], dest_copier.options.properties)
+        self.assertEqual(["min_disk"], copier.options.properties)
+        self.assertIs(copier.metrics, dest_copier.metrics)
+
+    def test_for_destination_rejects_download_options(self):
+        copier = ImageCopier(log=null_op)
+        self.assertRaises(ValueError, copier.for_destination, {"chunk_size": 1})
+        self.assertRaises(ValueError, copier.for_destination, {"duplicate_name_strategy": "other"})
+
+
+class TestDataToUploadStream(unittest.TestCase):
+    def test_reads_across_chunks(self):
+        stream = data_to_upload_stream([b"abc", b"", b"defgh", bytearray(b"ij")], buffer_size=4)
+        self.assertEqual(b"ab", stream.read(2))
+        self.assertEqual(b"cdefghij", stream.read())
+        self.assertEqual(b"", stream.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
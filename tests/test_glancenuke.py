@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from openstacktools._arguments import resolve_openstack_args
+from openstacktools.glancenuke import _get_config_file, _load_config, _parse_args
+
+_CONFIG = """
+[common]
+OS_AUTH_URL = http://config.example.com:5000/v3
+OS_PROJECT_NAME = config-project
+
+[env1]
+OS_PROJECT_NAME = env1-project
+"""
+
+
+class TestEnvironmentConfig(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.working_directory = os.getcwd()
+        with open(os.path.join(self.directory.name, "glancecp.config"), "w") as config_file:
+            config_file.write(_CONFIG)
+        os.chdir(self.directory.name)
+
+    def tearDown(self):
+        os.chdir(self.working_directory)
+        self.directory.cleanup()
+
+    def _resolve(self, args, env_name):
+        arguments = _parse_args(args)
+        environments = arguments.environments if len(arguments.environments) > 0 else [""]
+        config = _load_config(_get_config_file(arguments, environments))
+        return resolve_openstack_args(arguments, env_name, config)
+
+    @patch.dict(os.environ, {"OS_AUTH_URL": "http://env.example.com:5000/v3", "OS_PROJECT_NAME": "env-project"},
+                clear=True)
+    def test_os_environment_only(self):
+        resolved = self._resolve([], "")
+        self.assertEqual("http://env.example.com:5000/v3", resolved.os_auth_url)
+        self.assertEqual("env-project", resolved.os_project_name)
+
+    @patch.dict(os.environ, {"OS_AUTH_URL": "http://env.example.com:5000/v3", "OS_PROJECT_NAME": "env-project"},
+                clear=True)
+    def test_explicit_config(self):
+        resolved = self._resolve(["--config", "glancecp.config"], "")
+        self.assertEqual("http://config.example.com:5000/v3", resolved.os_auth_url)
+        self.assertEqual("config-project", resolved.os_project_name)
+
+    @patch.dict(os.environ, {"OS_AUTH_URL": "http://env.example.com:5000/v3"}, clear=True)
+    def test_environments_read_default_config(self):
+        resolved = self._resolve(["--env", "env1"], "env1")
+        self.assertEqual("http://config.example.com:5000/v3", resolved.os_auth_url)
+        self.assertEqual("env1-project", resolved.os_project_name)
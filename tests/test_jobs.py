@@ -0,0 +1,108 @@
+import threading
+import time
+import unittest
+
+from openstacktools._jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, JobScheduler
+
+TIMEOUT = 5
+
+
+class TestJobScheduler(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.scheduler = None
+
+    def tearDown(self):
+        self.release.set()
+        if self.scheduler is not None:
+            self.scheduler.close()
+
+    def _blocking(self, result=None):
+        def function(job):
+            if not self.release.wait(TIMEOUT):
+                raise RuntimeError("Job was never released")
+            return result
+        return function
+
+    def _wait_for_status(self, job, status):
+        # jobs are started without notifying anything, so their status is polled
+        deadline = time.monotonic() + TIMEOUT
+        while job.status != status and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(status, job.status)
+
+    def test_invalid_limits(self):
+        self.assertRaises(ValueError, JobScheduler, 0)
+        self.assertRaises(ValueError, JobScheduler, 2, environment_limit=0)
+        self.assertRaises(ValueError, JobScheduler, 2, environment_limits={"env": 0})
+
+    def test_runs_job(self):
+        self.scheduler = JobScheduler(2)
+        job = self.scheduler.submit("copy", ["env1", "env2"], lambda job: {"done": True})
+        self.assertIs(job, self.scheduler.wait(job.id, TIMEOUT))
+        self.assertEqual(SUCCEEDED, job.status)
+        self.assertEqual({"done": True}, job.to_dict()["result"])
+        self.assertEqual(1, self.scheduler.stats()["succeeded"])
+
+    def test_failed_job(self):
+        self.scheduler = JobScheduler(1)
+
+        def fail(job):
+            raise ValueError("broken")
+        job = self.scheduler.submit("delete", ["env1"], fail)
+        self.scheduler.wait(job.id, TIMEOUT)
+        self.assertEqual(FAILED, job.status)
+        self.assertEqual("broken", job.error)
+
+    def test_environment_limit_holds_back_only_its_jobs(self):
+        self.scheduler = JobScheduler(3, environment_limit=1)
+        first = self.scheduler.submit("copy", ["env1"], self._blocking())
+        held_back = self.scheduler.submit("copy", ["env1", "env2"], self._blocking())
+        other = self.scheduler.submit("copy", ["env2"], self._blocking())
+        self._wait_for_status(first, RUNNING)
+        self._wait_for_status(other, RUNNING)
+        self.assertEqual(QUEUED, held_back.status)
+        self.assertEqual({"env1": 1, "env2": 1}, self.scheduler.stats()["running_by_environment"])
+        self.release.set()
+        self.assertEqual(SUCCEEDED, self.scheduler.wait(held_back.id, TIMEOUT).status)
+
+    def test_per_environment_limits_override(self):
+        self.scheduler = JobScheduler(4, environment_limit=1, environment_limits={"big": 2})
+        jobs = [self.scheduler.submit("copy", ["big"], self._blocking()) for _ in range(3)]
+        self._wait_for_status(jobs[0], RUNNING)
+        self._wait_for_status(jobs[1], RUNNING)
+        self.assertEqual(QUEUED, jobs[2].status)
+
+    def test_worker_limit(self):
+        self.scheduler = JobScheduler(1)
+        running = self.scheduler.submit("copy", ["env1"], self._blocking())
+        queued = self.scheduler.submit("copy", ["env2"], self._blocking())
+        self._wait_for_status(running, RUNNING)
+        self.assertEqual(QUEUED, queued.status)
+        self.assertEqual(1, self.scheduler.stats()["queued"])
+
+    def test_close_fails_queued_jobs(self):
+        self.scheduler = JobScheduler(1)
+        running = self.scheduler.submit("copy", ["env1"], self._blocking())
+        queued = self.scheduler.submit("copy", ["env1"], self._blocking())
+        self._wait_for_status(running, RUNNING)
+        waited = []
+        waiter = threading.Thread(target=lambda: waited.append(self.scheduler.wait(queued.id, 60)))
+        waiter.start()
+        self.scheduler.close(wait=False)
+        waiter.join(TIMEOUT)
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(FAILED, queued.status)
+        self.assertEqual("scheduler closed", queued.error)
+        self.assertRaises(RuntimeError, self.scheduler.submit, "copy", ["env1"], self._blocking())
+
+    def test_history_is_bounded(self):
+        self.scheduler = JobScheduler(1, history=2)
+        jobs = [self.scheduler.submit("copy", ["env1"], lambda job: None) for _ in range(4)]
+        self.scheduler.wait(jobs[-1].id, TIMEOUT)
+        self.assertEqual([job.id for job in jobs[2:]], [job.id for job in self.scheduler.list()])
+        self.assertEqual(4, self.scheduler.stats()["succeeded"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import json
+import os
+import tempfile
+import unittest
+
+from openstacktools._plan import DeletionPlan
+
+
+class TestDeletionPlan(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "plan.json")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        plan = DeletionPlan({"": [("id-2", "b"), ("id-1", "a")], "env1": [], "env2": [("id-3", "c")]})
+        plan.save(self.path)
+        loaded = DeletionPlan.load(self.path)
+        self.assertEqual({"": [("id-1", "a"), ("id-2", "b")], "env1": [], "env2": [("id-3", "c")]}, loaded.images)
+        self.assertEqual(["", "env1", "env2"], sorted(loaded.environments))
+        self.assertEqual(3, loaded.total)
+        self.assertEqual(["plan.json"], os.listdir(self.directory.name))
+
+    def test_load_unsupported_version(self):
+        with open(self.path, "w") as plan_file:
+            json.dump({"version": 99, "environments": {}}, plan_file)
+        self.assertRaises(ValueError, DeletionPlan.load, self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from openstacktools._retry import RetryPolicy, RetryScheduler
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_invalid(self):
+        self.assertRaises(ValueError, RetryPolicy, -1)
+        self.assertRaises(ValueError, RetryPolicy, 1, -1.0)
+        self.assertRaises(ValueError, RetryPolicy, 1, 1.0, -1.0)
+
+    def test_max_attempts(self):
+        self.assertEqual(1, RetryPolicy(0).max_attempts)
+        self.assertEqual(4, RetryPolicy(3).max_attempts)
+
+    def test_delay_doubles_up_to_maximum(self):
+        policy = RetryPolicy(10, delay=1.0, max_delay=5.0)
+        with patch("openstacktools._retry.random.uniform", side_effect=lambda low, high: high):
+            self.assertEqual([1.0, 2.0, 4.0, 5.0, 5.0], [policy.get_delay(attempts) for attempts in range(1, 6)])
+
+    def test_delay_is_within_bounds(self):
+        policy = RetryPolicy(10, delay=0.5, max_delay=3.0)
+        for attempts in range(1, 10):
+            for _ in range(100):
+                delay = policy.get_delay(attempts)
+                self.assertGreaterEqual(delay, 0.0)
+                self.assertLessEqual(delay, min(3.0, 0.5 * 2 ** (attempts - 1)))
+
+
+class TestRetryScheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = RetryScheduler()
+
+    def tearDown(self):
+        self.scheduler.close()
+
+    def test_calls_in_order_of_delay(self):
+        calls = []
+        done = threading.Event()
+        self.scheduler.schedule(0.2, lambda: (calls.append("late"), done.set()))
+        self.scheduler.schedule(0.0, calls.append, "early")
+        self.assertTrue(done.wait(5))
+        self.assertEqual(["early", "late"], calls)
+
+    def test_close_drops_pending_calls(self):
+        calls = []
+        self.scheduler.schedule(60, calls.append, "never")
+        started = time.monotonic()
+        self.scheduler.close()
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual([], calls)
+        self.assertRaises(RuntimeError, self.scheduler.schedule, 0, calls.append, "closed")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+
+from openstacktools._segments import SegmentedDownload, get_segments
+
+
+class TestGetSegments(unittest.TestCase):
+    def test_exact_multiple(self):
+        self.assertEqual([(0, 9), (10, 19)], get_segments(0, 20, 10))
+
+    def test_last_segment_is_shorter(self):
+        self.assertEqual([(0, 9), (10, 19), (20, 24)], get_segments(0, 25, 10))
+
+    def test_from_offset(self):
+        self.assertEqual([(5, 14), (15, 19)], get_segments(5, 20, 10))
+
+    def test_empty(self):
+        self.assertEqual([], get_segments(20, 20, 10))
+
+
+class TestSegmentedDownload(unittest.TestCase):
+    def test_invalid(self):
+        self.assertRaises(ValueError, SegmentedDownload, None, "image", 10, 0)
+        self.assertRaises(ValueError, SegmentedDownload, None, "image", 10, 2, segment_size=0)
+
+    def test_short_segment_is_an_error(self):
+        download = SegmentedDownload(None, "image", 20, 2, segment_size=10)
+        with self.assertRaises(IOError):
+            list(download._check_length(1, [b"x" * 9]))
+        self.assertEqual([b"x" * 10], list(download._check_length(1, [b"x" * 10])))
+
+
+if __name__ == "__main__":
+    unittest.main()
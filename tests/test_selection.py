@@ -0,0 +1,90 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from openstacktools._selection import ImageSelection, format_time, parse_time
+
+NOW = datetime(2020, 6, 15, 12, 0, 0, tzinfo=timezone.utc)
+
+
+def _image(**properties) -> dict:
+    image = {"id": "id", "name": "test-1", "owner": "project", "visibility": "private", "status": "active",
+             "tags": ["a", "b"], "created_at": "2020-01-01T00:00:00Z", "updated_at": "2020-02-01T00:00:00Z",
+             "size": 100, "protected": False}
+    image.update(properties)
+    return image
+
+
+class TestParseTime(unittest.TestCase):
+    def test_age(self):
+        self.assertEqual(NOW - timedelta(days=30), parse_time("30d", now=NOW))
+        self.assertEqual(NOW - timedelta(hours=2), parse_time(" 2h ", now=NOW))
+
+    def test_timestamp(self):
+        self.assertEqual(datetime(2020, 1, 2, 3, 4, 5, tzinfo=timezone.utc), parse_time("2020-01-02T03:04:05Z"))
+
+    def test_timestamp_without_timezone_is_utc(self):
+        self.assertEqual(datetime(2020, 1, 2, 3, 4, 5, tzinfo=timezone.utc), parse_time("2020-01-02T03:04:05"))
+
+    def test_format_round_trip(self):
+        self.assertEqual("2020-06-15T12:00:00Z", format_time(NOW))
+        self.assertEqual(NOW, parse_time(format_time(NOW)))
+
+
+class TestImageSelection(unittest.TestCase):
+    def test_everything(self):
+        selection = ImageSelection()
+        self.assertTrue(selection.is_everything())
+        self.assertTrue(selection.matches(_image()))
+        self.assertFalse(selection.matches(_image(protected=True)))
+        self.assertTrue(ImageSelection(include_protected=True).matches(_image(protected=True)))
+        self.assertEqual({"protected": "false"}, selection.get_filters(2))
+        self.assertEqual({}, selection.get_filters(1))
+
+    def test_single_name_filter(self):
+        self.assertEqual({"name": "test-1"}, ImageSelection(names=["test-1"]).get_filters(1))
+
+    def test_several_names_filter_only_on_v2(self):
+        selection = ImageSelection(names=["a", 'b"c'])
+        self.assertEqual('in:"a","b\\"c"', selection.get_filters(2)["name"])
+        self.assertNotIn("name", selection.get_filters(1))
+
+    def test_patterns_are_not_filters(self):
+        selection = ImageSelection(names=["test-1", "test-*"])
+        self.assertNotIn("name", selection.get_filters(2))
+        self.assertTrue(selection.matches(_image(name="test-2")))
+        self.assertFalse(selection.matches(_image(name="other")))
+
+    def test_v2_filters(self):
+        selection = ImageSelection(owner="project", visibility="private", statuses=["active"], tags=["a"],
+                                   created_before=NOW, updated_before=NOW, min_size=1, max_size=1000)
+        self.assertEqual({"protected": "false", "owner": "project", "visibility": "private", "status": "active",
+                          "tag": ["a"], "created_at": "lt:2020-06-15T12:00:00Z",
+                          "updated_at": "lt:2020-06-15T12:00:00Z", "size_min": 1, "size_max": 1000},
+                         selection.get_filters(2))
+        self.assertEqual({"status": "active", "size_min": 1, "size_max": 1000}, selection.get_filters(1))
+
+    def test_several_statuses_are_not_a_filter(self):
+        selection = ImageSelection(statuses=["active", "queued"])
+        self.assertNotIn("status", selection.get_filters(2))
+        self.assertTrue(selection.matches(_image(status="queued")))
+        self.assertFalse(selection.matches(_image(status="killed")))
+
+    def test_matches_each_criterion(self):
+        self.assertFalse(ImageSelection(owner="other").matches(_image()))
+        self.assertFalse(ImageSelection(visibility="public").matches(_image()))
+        self.assertFalse(ImageSelection(tags=["a", "c"]).matches(_image()))
+        self.assertTrue(ImageSelection(tags=["a", "b"]).matches(_image()))
+        self.assertFalse(ImageSelection(created_before=datetime(2019, 1, 1, tzinfo=timezone.utc)).matches(_image()))
+        self.assertTrue(ImageSelection(updated_before=NOW).matches(_image()))
+        self.assertFalse(ImageSelection(min_size=101).matches(_image()))
+        self.assertFalse(ImageSelection(max_size=99).matches(_image()))
+        self.assertFalse(ImageSelection(min_size=1).matches(_image(size=None)))
+
+    def test_v1_visibility(self):
+        image = _image(visibility=None, is_public=True)
+        self.assertTrue(ImageSelection(visibility="public").matches(image))
+        self.assertFalse(ImageSelection(visibility="private").matches(image))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+
+from openstacktools._helpers import null_op
+from openstacktools._spool import Spool
+
+SOURCE_IMAGE = {"id": "source", "size": 3, "checksum": "abc", "os_hash_value": "def", "updated_at": "2020-01-01"}
+
+
+class TestSpool(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.messages = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _spool(self, source_image: dict=None) -> Spool:
+        return Spool(self.directory.name, source_image or SOURCE_IMAGE, log=self.messages.append)
+
+    def test_new_spool(self):
+        spool = self._spool()
+        self.assertEqual(0, spool.downloaded)
+        self.assertFalse(spool.complete)
+        self.assertEqual((None, []), spool.get_destination("dest"))
+
+    def test_destinations_persist(self):
+        self._spool().set_destination("dest", "image", ["old"])
+        spool = self._spool()
+        self.assertEqual(("image", ["old"]), spool.get_destination("dest"))
+        self.assertEqual((None, []), spool.get_destination("other"))
+
+    def test_spool_is_discarded_once_every_destination_finished(self):
+        spool = self._spool()
+        spool.set_destination("dest1", "image1", [])
+        spool.set_destination("dest2", "image2", [])
+        with open(spool.data_path, "wb") as data_file:
+            data_file.write(b"abc")
+        spool.finish_destination("dest1")
+        self.assertTrue(os.path.exists(spool.data_path))
+        self.assertEqual(("image2", []), self._spool().get_destination("dest2"))
+        spool.finish_destination("dest2")
+        self.assertFalse(os.path.exists(spool.data_path))
+        self.assertFalse(os.path.exists(spool.checkpoint_path))
+
+    def test_changed_source_image_discards_spool(self):
+        self._spool().set_destination("dest", "image", [])
+        spool = self._spool(dict(SOURCE_IMAGE, updated_at="2020-02-01"))
+        self.assertEqual((None, []), spool.get_destination("dest"))
+        self.assertEqual(1, len(self.messages))
+
+    def test_quiet_log(self):
+        Spool(self.directory.name, SOURCE_IMAGE, log=null_op).set_destination("dest", "image", [])
+        Spool(self.directory.name, dict(SOURCE_IMAGE, size=4), log=null_op)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import stat
+import tempfile
+import unittest
+
+from keystoneclient import access
+
+from openstacktools._token_cache import CachedAuthentication, TokenCache, get_token_cache_key
+
+AUTH_KWARGS = {"auth_url": "https://keystone/v3", "username": "user", "password": "secret", "project_name": "project"}
+
+
+def _access_info(expires_at: str) -> access.AccessInfo:
+    domain = {"id": "default", "name": "Default"}
+    return access.AccessInfo.factory(auth_token="token", body={"token": {
+        "expires_at": expires_at, "methods": ["password"], "user": {"id": "user", "name": "user", "domain": domain},
+        "project": {"id": "project", "name": "project", "domain": domain}}})
+
+
+class TestGetTokenCacheKey(unittest.TestCase):
+    def test_same_credentials(self):
+        self.assertEqual(get_token_cache_key(dict(AUTH_KWARGS), service_type="image"),
+                         get_token_cache_key(dict(AUTH_KWARGS), service_type="image"))
+
+    def test_differs_by_credentials_and_endpoint(self):
+        key = get_token_cache_key(AUTH_KWARGS, service_type="image")
+        self.assertNotEqual(key, get_token_cache_key(dict(AUTH_KWARGS, password="changed"), service_type="image"))
+        self.assertNotEqual(key, get_token_cache_key(dict(AUTH_KWARGS, project_name="other"), service_type="image"))
+        self.assertNotEqual(key, get_token_cache_key(AUTH_KWARGS, service_type="image", region_name="other"))
+        self.assertNotIn("secret", key)
+
+
+class TestTokenCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.directory.name, "tokens")
+        self.messages = []
+        self.cache = TokenCache(self.cache_dir, log=self.messages.append)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_directory_is_private(self):
+        self.assertEqual(0o700, stat.S_IMODE(os.stat(self.cache_dir).st_mode))
+
+    def test_refuses_shared_directory(self):
+        os.chmod(self.cache_dir, 0o755)
+        self.assertRaises(PermissionError, TokenCache, self.cache_dir)
+
+    def test_round_trip(self):
+        self.cache.store("key", CachedAuthentication("v2", "v3", _access_info("2999-01-01T00:00:00.000000Z"),
+                                                     "https://glance"))
+        cached = self.cache.lookup("key")
+        self.assertEqual(("v2", "v3", "https://glance"), (cached.v2_auth_url, cached.v3_auth_url, cached.endpoint))
+        self.assertEqual("token", cached.access_info.auth_token)
+        self.assertEqual("project", cached.access_info.project_id)
+
+    def test_expiring_token_is_not_used(self):
+        self.cache.store("key", CachedAuthentication("v2", "v3", _access_info("2000-01-01T00:00:00.000000Z"), None))
+        cached = self.cache.lookup("key")
+        self.assertIsNone(cached.access_info)
+        self.assertEqual("v3", cached.v3_auth_url)
+
+    def test_missing_entry(self):
+        self.assertIsNone(self.cache.lookup("missing"))
+        self.assertEqual([], self.messages)
+
+    def test_unreadable_entry_is_logged(self):
+        with open(self.cache.get_path("key"), "w") as cache_file:
+            cache_file.write("not json")
+        self.assertIsNone(self.cache.lookup("key"))
+        self.assertEqual(1, len(self.messages))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+from openstacktools._tracing import get_percentile, get_url_template
+
+IMAGE_ID = "0b4c6b54-3b8e-4b4a-9d5e-7a7d2c1a2f3e"
+PROJECT_ID = "9f1d0c2b3a4e5f60718293a4b5c6d7e8"
+
+
+class TestGetUrlTemplate(unittest.TestCase):
+    def test_plain_path(self):
+        self.assertEqual("/v2/images", get_url_template("https://glance:9292/v2/images"))
+
+    def test_identifiers(self):
+        self.assertEqual("/v2/images/{id}/file", get_url_template("https://glance/v2/images/%s/file" % IMAGE_ID))
+        self.assertEqual("/v3/projects/{id}", get_url_template("https://keystone/v3/projects/%s" % PROJECT_ID))
+
+    def test_member_of_collection(self):
+        self.assertEqual("/v1/images/{id}", get_url_template("https://glance/v1/images/ubuntu"))
+        self.assertEqual("/v2/images/{id}/tags/{id}",
+                         get_url_template("https://glance/v2/images/%s/tags/mytag" % IMAGE_ID))
+
+    def test_collection_view(self):
+        self.assertEqual("/v1/images/detail", get_url_template("https://glance/v1/images/detail"))
+
+    def test_query_parameter_names(self):
+        self.assertEqual("/v2/images?limit&marker&name",
+                         get_url_template("https://glance/v2/images?name=a&marker=%s&limit=20&name=b" % IMAGE_ID))
+
+
+class TestGetPercentile(unittest.TestCase):
+    def test_nearest_rank(self):
+        values = [float(value) for value in range(1, 11)]
+        self.assertEqual(5.0, get_percentile(values, 50))
+        self.assertEqual(9.0, get_percentile(values, 90))
+        self.assertEqual(10.0, get_percentile(values, 99))
+        self.assertEqual(10.0, get_percentile(values, 100))
+        self.assertEqual(1.0, get_percentile(values, 0))
+
+    def test_single_value(self):
+        self.assertEqual(3.0, get_percentile([3.0], 50))
+
+
+if __name__ == "__main__":
+    unittest.main()
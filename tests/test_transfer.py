@@ -0,0 +1,114 @@
+import threading
+import time
+import unittest
+from typing import Tuple
+
+from openstacktools._transfer import FanOut, ReadAhead
+
+TIMEOUT = 5
+
+
+def _consume_all(fan_out: FanOut, index: int, results: dict):
+    try:
+        results[index] = list(fan_out.consume(index))
+    except Exception as e:
+        results[index] = e
+
+
+class TestFanOut(unittest.TestCase):
+    def _start_consumers(self, fan_out: FanOut, consumers: int) -> Tuple[list, dict]:
+        results = {}
+        threads = [threading.Thread(target=_consume_all, args=(fan_out, index, results)) for index in range(consumers)]
+        for thread in threads:
+            thread.start()
+        return threads, results
+
+    def _join(self, threads: list):
+        for thread in threads:
+            thread.join(TIMEOUT)
+            self.assertFalse(thread.is_alive())
+
+    def test_every_consumer_gets_all_data(self):
+        fan_out = FanOut(3, queue_depth=2)
+        threads, results = self._start_consumers(fan_out, 3)
+        data = [bytes([value]) for value in range(20)]
+        fan_out.feed(data)
+        self._join(threads)
+        self.assertEqual({0: data, 1: data, 2: data}, results)
+
+    def test_fail_releases_consumers(self):
+        fan_out = FanOut(2)
+        threads, results = self._start_consumers(fan_out, 2)
+        fan_out.fail(ValueError("broken"))
+        self._join(threads)
+        for index in range(2):
+            self.assertIsInstance(results[index], IOError)
+            self.assertIn("broken", str(results[index]))
+
+    def test_abandoned_consumer_does_not_hold_back_others(self):
+        fan_out = FanOut(2, queue_depth=1)
+        threads, results = self._start_consumers(fan_out, 1)
+        fan_out.abandon(1)
+        data = [b"x"] * 10
+        fan_out.feed(data)
+        self._join(threads)
+        self.assertEqual(data, results[0])
+
+    def test_feed_stops_once_all_abandoned(self):
+        fan_out = FanOut(1, queue_depth=1)
+        fan_out.abandon(0)
+        read = []
+
+        def data():
+            for value in range(1000):
+                read.append(value)
+                yield b"x"
+        fan_out.feed(data())
+        self.assertLess(len(read), 1000)
+
+
+class TestReadAhead(unittest.TestCase):
+    def test_reads_all_data(self):
+        data = [bytes([value]) for value in range(50)]
+        read_ahead = ReadAhead(iter(data), queue_depth=4)
+        self.assertEqual(data, list(read_ahead))
+        self.assertTrue(read_ahead.close())
+
+    def test_read_failure_is_raised(self):
+        def data():
+            yield b"x"
+            raise ValueError("broken")
+        read_ahead = ReadAhead(data())
+        with self.assertRaises(IOError):
+            list(read_ahead)
+        self.assertTrue(read_ahead.close())
+
+    def test_close_stops_reading(self):
+        read = []
+
+        def data():
+            for value in range(1000):
+                read.append(value)
+                yield b"x"
+        read_ahead = ReadAhead(data(), queue_depth=2)
+        next(iter(read_ahead))
+        self.assertTrue(read_ahead.close())
+        self.assertLess(len(read), 1000)
+
+    def test_close_does_not_wait_for_stalled_read(self):
+        stalled = threading.Event()
+
+        def data():
+            yield b"x"
+            stalled.wait(TIMEOUT * 2)
+            yield b"y"
+        read_ahead = ReadAhead(data())
+        next(iter(read_ahead))
+        started = time.monotonic()
+        self.assertFalse(read_ahead.close(timeout=0.1))
+        self.assertLess(time.monotonic() - started, TIMEOUT)
+        stalled.set()
+
+
+if __name__ == "__main__":
+    unittest.main()